@@ -0,0 +1,57 @@
+import argparse
+from contextlib import redirect_stdout
+import io
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from models.metric import Metric
+from models.repo_data import RepoData
+from models.repo_record import RepoRecord
+from utilities import cache_utilities
+from utilities.cache_utilities import get_github_data_cache
+
+'''
+Measures how long it takes to open the on-disk cache, read and update a single repo, and save the cache, for caches
+of increasing size. These should stay roughly flat as the cache grows.
+
+Run with `python -m benchmarks.benchmark_cache` from the root of the repo.
+'''
+
+def _fill_cache(number_of_repos: int) -> None:
+    with get_github_data_cache() as cache:
+        for i in range(number_of_repos):
+            repo = RepoRecord(name=f"repo-{i}", full_name=f"org-{i % 100}/repo-{i}", stargazers_count=i, forks_count=i)
+            cache.update_data_for_repo(repo, RepoData(stars_count=i, forks_count=i, pull_requests_count=i))
+
+def _time_single_repo_session(number_of_repos: int) -> tuple[float, float, float]:
+    repo = RepoRecord(name="repo-0", full_name="org-0/repo-0", stargazers_count=0, forks_count=0)
+    start_time = time.perf_counter()
+    with get_github_data_cache() as cache:
+        load_time = time.perf_counter() - start_time
+        assert cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS) is not None
+        cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 1)
+        save_start_time = time.perf_counter()
+    save_time = time.perf_counter() - save_start_time
+    return load_time, save_time, time.perf_counter() - start_time
+
+def main(args):
+    for number_of_repos in args.sizes:
+        with tempfile.TemporaryDirectory() as cache_directory, \
+                patch.object(cache_utilities, "CACHE_DIRECTORY", cache_directory), \
+                patch.object(cache_utilities, "CACHE_FILE", os.path.join(cache_directory, "github_data.sqlite3")), \
+                patch.object(cache_utilities, "PICKLE_CACHE_FILE", os.path.join(cache_directory, "github_data.pkl")):
+            # get_github_data_cache prints a note when it finds cached data
+            with redirect_stdout(io.StringIO()):
+                _fill_cache(number_of_repos)
+                (load_time, save_time, total_time) = _time_single_repo_session(number_of_repos)
+            print(f"{number_of_repos:>8} cached repos: load {load_time * 1000:.2f}ms, save {save_time * 1000:.2f}ms, total {total_time * 1000:.2f}ms")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks opening and saving the on-disk cache as it grows.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,125 @@
+import argparse
+from contextlib import contextmanager, redirect_stdout
+import io
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import github_organization_repo_explorer as explorer
+from tests.mock_github_server import MockGithubServer, create_synthetic_organization
+from utilities import cache_utilities, snapshot_utilities
+from utilities.cache_utilities import DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, get_github_data_cache
+from utilities.github_utilities import MAX_PER_PAGE
+from utilities.repo_utilities import DEFAULT_CONCURRENCY
+
+'''
+Runs synthetic orgs through the real `main` path against a local mock Github server, with simulated latency and rate
+limit headers, and reports the wall time, request count, peak memory (as seen by tracemalloc, which includes the mock
+server's allocations for the responses), and cache load and save time for:
+- a cold run, with an empty cache
+- a warm run, right after the cold one
+- an expired run, with everything in the cache past its TTL
+
+With `--baseline`, it also times counting each repo's stargazers by paging through them, which is what we'd have to do
+if we didn't read the stars count off of the listing. That costs a request per repo, one at a time, so it only runs for
+orgs of up to MAX_BASELINE_REPOS repos.
+
+Run with `python -m benchmarks.benchmark_main` from the root of the repo. Compare the results before and after a change
+to catch performance regressions.
+'''
+
+ORGANIZATION_NAME = "benchmark-org"
+SCENARIOS = ["cold", "warm", "expired"]
+MAX_BASELINE_REPOS = 1_000
+
+class _CacheTimer(object):
+    def __init__(self):
+        self.load_seconds = 0.0
+        self.save_seconds = 0.0
+
+    # wraps get_github_data_cache to time opening the cache and committing it at the end of the run
+    @contextmanager
+    def get_github_data_cache(self, *args, **kwargs):
+        cache_context = get_github_data_cache(*args, **kwargs)
+        start_time = time.perf_counter()
+        cache = cache_context.__enter__()
+        self.load_seconds = time.perf_counter() - start_time
+        try:
+            yield cache
+        except BaseException as e:
+            if not cache_context.__exit__(type(e), e, e.__traceback__):
+                raise
+        else:
+            start_time = time.perf_counter()
+            cache_context.__exit__(None, None, None)
+            self.save_seconds = time.perf_counter() - start_time
+
+def _expire_cache(cache_file: str) -> None:
+    # moves everything in the cache back past the longest TTL, as if the last run had been a while ago
+    expired_seconds = max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+    connection = sqlite3.connect(cache_file)
+    with connection:
+        for table_name in ["organization_repos", "repo_metrics"]:
+            connection.execute(f"UPDATE {table_name} SET last_checked_time = last_checked_time - ?", (expired_seconds,))
+    connection.close()
+
+def _run_main(server: MockGithubServer, argv: list[str]) -> tuple[float, int, int, _CacheTimer]:
+    cache_timer = _CacheTimer()
+    request_count = server.request_count
+    with patch.object(explorer, "_get_github_client", lambda concurrency: server.create_client(per_page=MAX_PER_PAGE, pool_size=concurrency)), \
+            patch.object(explorer, "get_github_data_cache", cache_timer.get_github_data_cache), \
+            redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        explorer.main(explorer.parse_args(argv))
+        wall_time = time.perf_counter() - start_time
+        (_, peak_memory) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return (wall_time, server.request_count - request_count, peak_memory, cache_timer)
+
+def _run_baseline(server: MockGithubServer) -> tuple[float, int]:
+    github = server.create_client(per_page=MAX_PER_PAGE, pool_size=1)
+    request_count = server.request_count
+    start_time = time.perf_counter()
+    for repo in github.get_organization(ORGANIZATION_NAME).get_repos():
+        repo.get_stargazers().totalCount
+    return (time.perf_counter() - start_time, server.request_count - request_count)
+
+def main(args):
+    for number_of_repos in args.sizes:
+        print(f"{number_of_repos} repos, ranking the top {args.n} by {args.criteria}:")
+        repos = create_synthetic_organization(number_of_repos)
+        argv = [ORGANIZATION_NAME, "-n", str(args.n), "-c", args.criteria, "--concurrency", str(args.concurrency)]
+        with tempfile.TemporaryDirectory() as cache_directory, \
+                patch.object(cache_utilities, "CACHE_DIRECTORY", cache_directory), \
+                patch.object(cache_utilities, "CACHE_FILE", os.path.join(cache_directory, "github_data.sqlite3")), \
+                patch.object(cache_utilities, "PICKLE_CACHE_FILE", os.path.join(cache_directory, "github_data.pkl")), \
+                patch.object(snapshot_utilities, "SNAPSHOT_FILE", os.path.join(cache_directory, "snapshots.sqlite3")), \
+                MockGithubServer({ORGANIZATION_NAME: repos}, latency_seconds=args.latency) as server:
+            for scenario in SCENARIOS:
+                if scenario == "expired":
+                    _expire_cache(cache_utilities.CACHE_FILE)
+                (wall_time, request_count, peak_memory, cache_timer) = _run_main(server, argv)
+                print(
+                    f"{scenario:>12}: {wall_time:.2f}s, {request_count:>5} requests, peak memory {peak_memory / 1024 / 1024:.1f}MB, "
+                    f"cache load {cache_timer.load_seconds * 1000:.1f}ms, cache save {cache_timer.save_seconds * 1000:.1f}ms"
+                )
+            if args.baseline and number_of_repos <= MAX_BASELINE_REPOS:
+                (wall_time, request_count) = _run_baseline(server)
+                print(f"{'baseline':>12}: {wall_time:.2f}s, {request_count:>5} requests (counting stargazers per repo)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the tool end to end against a local mock Github server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1_000, 10_000], help="The numbers of repos in the synthetic orgs, e.g. up to 50000")
+    parser.add_argument("--criteria", "-c", type=str, default="pull_requests")
+    parser.add_argument("--latency", type=float, default=0.02, help="The simulated latency of each request in seconds")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--baseline", action="store_true", help="Also time counting stargazers per repo")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,58 @@
+import argparse
+import heapq
+import time
+
+from models.criteria import Criteria
+from models.metric import METRICS_BY_CRITERIA
+from models.repo_data import RepoData
+from models.repo_metric_table import RepoMetricTable
+from models.repo_record import RepoRecord
+from tests.mock_github_server import create_synthetic_organization
+from utilities.repo_utilities import RepoWithValue, _push_to_top_n
+
+'''
+Compares ranking a fully fetched org with the RepoWithValue heap (a RepoData and a RepoWithValue per repo, pushed
+through heapq one at a time) against the columnar RepoMetricTable, for every criteria. The table is built once and
+then answers every criteria, so we time building it separately from ranking with it.
+
+Run with `python -m benchmarks.benchmark_ranking` from the root of the repo.
+'''
+
+def _rank_with_heap(repos: list[RepoRecord], pull_requests_counts: list[int], n: int, criteria: Criteria) -> list[tuple[int | float, RepoRecord]]:
+    top_repos_with_value = []
+    for (repo, pull_requests_count) in zip(repos, pull_requests_counts):
+        repo_data = RepoData(stars_count=repo.stargazers_count, forks_count=repo.forks_count, pull_requests_count=pull_requests_count)
+        _push_to_top_n(top_repos_with_value, RepoWithValue(repo_data.get_data_for_criteria(criteria), repo), n)
+    return [(repo_with_value.value, repo_with_value.repo) for repo_with_value in heapq.nlargest(n, top_repos_with_value)]
+
+def main(args):
+    for number_of_repos in args.sizes:
+        mock_repos = create_synthetic_organization(number_of_repos)
+        repos = [RepoRecord(repo.name, f"org/{repo.name}", repo.stars_count, repo.forks_count) for repo in mock_repos]
+        pull_requests_counts = [repo.pull_requests_count for repo in mock_repos]
+
+        start_time = time.perf_counter()
+        table = RepoMetricTable(repos, (repo.stargazers_count for repo in repos), (repo.forks_count for repo in repos), pull_requests_counts)
+        build_time = time.perf_counter() - start_time
+        print(f"{number_of_repos:>8} repos: building the table takes {build_time * 1000:.1f}ms")
+
+        for criteria in METRICS_BY_CRITERIA:
+            start_time = time.perf_counter()
+            heap_result = _rank_with_heap(repos, pull_requests_counts, args.n, criteria)
+            heap_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            table_result = table.get_top_n(args.n, criteria)
+            table_time = time.perf_counter() - start_time
+
+            assert heap_result == table_result, f"the heap and the table disagree on the ranking by {criteria.value}"
+            print(f"{criteria.value:>26}: heap {heap_time * 1000:.1f}ms, table {table_time * 1000:.1f}ms")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks ranking with the RepoWithValue heap against the columnar metric table.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("-n", type=int, default=10)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
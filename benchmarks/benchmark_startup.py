@@ -0,0 +1,122 @@
+import argparse
+from contextlib import redirect_stdout
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import github_organization_repo_explorer as explorer
+from tests.mock_github_server import MockGithubServer, create_synthetic_organization
+from utilities import cache_utilities, snapshot_utilities
+
+'''
+Times how long the tool takes to start up, each in a fresh interpreter since that's what a user waits on:
+- import, which only imports the explorer
+- help, which prints -h
+- warm, which answers a query from a warm cache (filled in beforehand from a local mock Github server)
+
+Each one is run `--repeat` times and the fastest is reported, along with the time spent importing (from
+`python -X importtime`) and which of HEAVY_MODULES got imported. None of them should need pygithub, requests, or
+dotenv, since they're only imported once a run has to make a request. The warm run exits with an error if it tries to
+create a Github client.
+
+With `--budget-ms`, it exits with an error if any of them take longer than that, so it can guard the startup time in CI.
+
+Run with `python -m benchmarks.benchmark_startup` from the root of the repo.
+'''
+
+ORGANIZATION_NAME = "benchmark-org"
+SCENARIOS = ["import", "help", "warm"]
+HEAVY_MODULES = ["github", "requests", "urllib3", "dotenv"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs the explorer against the cache in `cache_directory`, without a daemon and without a way to make requests
+WARM_RUN_SCRIPT = """
+import os
+import sys
+
+from utilities import cache_utilities, snapshot_utilities
+cache_utilities.CACHE_DIRECTORY = sys.argv[1]
+cache_utilities.CACHE_FILE = os.path.join(sys.argv[1], "github_data.sqlite3")
+snapshot_utilities.SNAPSHOT_FILE = os.path.join(sys.argv[1], "snapshots.sqlite3")
+
+import github_organization_repo_explorer as explorer
+def _get_github_client(concurrency):
+    print("ERROR: The cache couldn't answer the warm run without making a request.", file=sys.stderr)
+    exit(1)
+explorer._get_github_client = _get_github_client
+explorer.main(explorer.parse_args(sys.argv[2:]))
+"""
+
+def _get_command(scenario: str, cache_directory: str, argv: list[str]) -> list[str]:
+    if scenario == "import":
+        return ["-c", "import github_organization_repo_explorer"]
+    elif scenario == "help":
+        return ["github_organization_repo_explorer.py", "--no-daemon", "-h"]
+    return ["-c", WARM_RUN_SCRIPT, cache_directory] + argv
+
+def _run(command: list[str], python_args: list[str] = []) -> subprocess.CompletedProcess:
+    completed_process = subprocess.run([sys.executable] + python_args + command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if completed_process.returncode != 0:
+        print(completed_process.stderr)
+        exit(1)
+    return completed_process
+
+# the total time spent importing, and the top level packages that were imported, from `-X importtime`'s output
+def _parse_import_times(stderr: str) -> tuple[float, set[str]]:
+    (total_microseconds, package_names) = (0, set())
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        (self_microseconds, _, module_name) = line[len("import time:"):].split("|")
+        total_microseconds += int(self_microseconds)
+        package_names.add(module_name.strip().split(".")[0])
+    return (total_microseconds / 1000, package_names)
+
+def _warm_cache(cache_directory: str, number_of_repos: int, argv: list[str]) -> None:
+    with patch.object(cache_utilities, "CACHE_DIRECTORY", cache_directory), \
+            patch.object(cache_utilities, "CACHE_FILE", os.path.join(cache_directory, "github_data.sqlite3")), \
+            patch.object(snapshot_utilities, "SNAPSHOT_FILE", os.path.join(cache_directory, "snapshots.sqlite3")), \
+            MockGithubServer({ORGANIZATION_NAME: create_synthetic_organization(number_of_repos)}) as server, \
+            patch.object(explorer, "_get_github_client", lambda concurrency: server.create_client(pool_size=concurrency)), \
+            redirect_stdout(io.StringIO()):
+        explorer.main(explorer.parse_args(argv))
+
+def main(args):
+    argv = [ORGANIZATION_NAME, "-n", "10", "-c", args.criteria, "--no-daemon"]
+    over_budget_scenarios = []
+    with tempfile.TemporaryDirectory() as cache_directory:
+        _warm_cache(cache_directory, args.repos, argv)
+        print(f"Startup time, fastest of {args.repeat} (warm runs rank {args.repos} repos by {args.criteria}):")
+        for scenario in SCENARIOS:
+            command = _get_command(scenario, cache_directory, argv)
+            wall_times = []
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                _run(command)
+                wall_times.append(time.perf_counter() - start_time)
+            (import_milliseconds, package_names) = _parse_import_times(_run(command, ["-X", "importtime"]).stderr)
+            heavy_modules = [module_name for module_name in HEAVY_MODULES if module_name in package_names]
+
+            wall_milliseconds = min(wall_times) * 1000
+            print(f"{scenario:>8}: {wall_milliseconds:.0f}ms, {import_milliseconds:.0f}ms importing, heavy imports: {', '.join(heavy_modules) or 'none'}")
+            if args.budget_ms is not None and wall_milliseconds > args.budget_ms:
+                over_budget_scenarios.append(scenario)
+
+    if len(over_budget_scenarios) > 0:
+        print(f"\nOver the {args.budget_ms}ms budget: {', '.join(over_budget_scenarios)}")
+        exit(1)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks how long the tool takes to start up.")
+    parser.add_argument("--repos", type=int, default=1_000, help="The number of repos in the synthetic org for the warm run")
+    parser.add_argument("--criteria", "-c", type=str, default="pull_requests")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", dest="budget_ms", type=float, required=False, help="Exit with an error if any of them take longer than this")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
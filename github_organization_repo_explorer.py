@@ -1,61 +1,455 @@
 #!/usr/bin/env python
-import argparse
+from __future__ import annotations
 
-from github import Github, Auth
+import argparse
+from contextlib import closing, contextmanager, nullcontext, redirect_stdout
+import heapq
+import io
+import sys
+import threading
+import time
+from typing import Callable, TYPE_CHECKING
 
+from models.backend import Backend
 from models.criteria import Criteria, get_string_representation
-from utilities.github_utilities import get_organization, get_repos
-from utilities.repo_utilities import get_top_repos_by_criteria, RepoWithValue
-from utilities.authentication_utilities import get_personal_access_token
-from utilities.cache_utilities import get_github_data_cache
+from models.metric import GROWTH_METRIC_BY_CRITERIA, METRICS_BY_CRITERIA, Metric
+from models.repo_record import RepoRecord
+from utilities.github_utilities import get_repos, try_get_top_repo_candidates_from_search, MAX_PER_PAGE, SEARCH_SORT_BY_CRITERIA
+from utilities.graphql_utilities import get_repos_with_data
+from utilities.repo_utilities import export_cached_data_for_repos, export_data_for_repos, get_top_repos_by_criteria, get_top_repos_by_growth, try_get_top_repos_from_cache, RepoWithValue, DEFAULT_CONCURRENCY
+from utilities.cache_utilities import DEFAULT_MAX_CACHE_BYTES, DEFAULT_MAX_CACHE_ENTRIES, GithubDataCache, get_github_data_cache
+from utilities.daemon_utilities import try_run_with_daemon
+from utilities.export_utilities import EXPORT_FORMATS, RepoDataExporter, open_exporter
+from utilities.profiling_utilities import JSON_FORMAT, PROFILE_FORMATS, start_profiler
+from utilities.snapshot_utilities import SECONDS_PER_DAY, SnapshotStore, get_snapshot_store, record_scan
 
+# pygithub, requests, and dotenv take most of the time it takes to start up, so they (and the utilities that need them
+# to load) are only imported once a run actually needs to make a request or ask for a PAT. -h, invalid arguments, and
+# queries the cache can answer don't pay for them. benchmarks/benchmark_startup.py keeps an eye on this
+if TYPE_CHECKING:
+    from github import Github
+    from utilities.http_archive_utilities import HttpRecording, HttpReplay
+
+NO_DAEMON_ARG = "--no-daemon"
+RECORD_ARG = "--record"
+REPLAY_ARG = "--replay"
+ORGANIZATION_NAMES_ARG_VALIDATION_ERROR_MESSAGE = "At least one organization_name or --orgs-file is required."
 TOP_N_ARG_VALIDATION_ERROR_MESSAGE = "--top-n/-n must be an integer value greater than zero."
+CONCURRENCY_ARG_VALIDATION_ERROR_MESSAGE = "--concurrency must be an integer value greater than zero."
+CACHE_MAX_ENTRIES_ARG_VALIDATION_ERROR_MESSAGE = "--cache-max-entries must be an integer value greater than zero."
+CACHE_MAX_MB_ARG_VALIDATION_ERROR_MESSAGE = "--cache-max-mb must be an integer value greater than zero."
+MAX_STALE_AGE_ARG_VALIDATION_ERROR_MESSAGE = "--max-stale-age must be an integer value greater than zero."
+DEFAULT_MAX_STALE_AGE_MINUTES = 24 * 60
+WINDOW_DAYS_ARG_VALIDATION_ERROR_MESSAGE = "--window-days must be an integer value greater than zero."
+DEFAULT_WINDOW_DAYS = 7
+NO_SNAPSHOTS_ERROR_MESSAGE = "ERROR: There's no history for this org yet. Rank it by stars, forks, or pull_requests first, and again once it has had time to grow."
+EXPORT_ARG_VALIDATION_ERROR_MESSAGE = "--export can't be used with the growth criteria or --stale-ok."
+FROM_CACHE_ARG_VALIDATION_ERROR_MESSAGE = "--from-cache only applies to --export."
+RECORD_ARG_VALIDATION_ERROR_MESSAGE = "--record and --replay can't be used together."
+REPLAY_LATENCY_ARG_VALIDATION_ERROR_MESSAGE = "--replay-latency only applies to --replay."
+NOT_CACHED_ERROR_MESSAGE = "ERROR: There's no cached data for this org yet. Export it without --from-cache first."
+SECONDS_PER_HOUR = 60 * 60
+BYTES_PER_MB = 1024 * 1024
+CACHE_TTL_ARG_VALIDATION_ERROR_MESSAGE = f"--cache-ttl must look like METRIC=MINUTES, where METRIC is one of {', '.join(metric.value for metric in Metric)} and MINUTES is an integer value greater than or equal to zero."
 
 def _print_result(top_repos: list[RepoWithValue], organization_name: str, n: int, criteria: Criteria) -> None:
     print(f"\nTop {n} repos in {organization_name} based on {criteria.value}:")
     for repo in top_repos:
         print(f"\t- {repo.name} ({get_string_representation(repo.value, criteria)})")
 
-def _get_github_client() -> Github:
-    personal_access_token = get_personal_access_token()
-    if personal_access_token is not None:
-        return Github(
-            login_or_token=get_personal_access_token(),
-            auth=Auth.Token("access_token")
-        )
-    else:
-        return Github()
-
-def main(args):
-    (organization_name, n, criteria, refresh_cache) = (args.organization_name, args.n, Criteria(args.criteria), args.refresh_cache)
-    github_client = _get_github_client()
+def _print_cross_organization_result(top_repos: list[RepoWithValue], organization_count: int, n: int, criteria: Criteria) -> None:
+    print(f"\nTop {n} repos across {organization_count} orgs based on {criteria.value}:")
+    for repo in top_repos:
+        print(f"\t- {repo.repo.full_name} ({get_string_representation(repo.value, criteria)})")
+
+def _print_changes(before_top_repos: list[RepoWithValue], top_repos: list[RepoWithValue], organization_name: str, n: int, criteria: Criteria) -> None:
+    print(f"\nTop {n} repos in {organization_name} based on {criteria.value} after refreshing:")
+    before_by_name = {repo.name: (index, repo) for (index, repo) in enumerate(before_top_repos)}
+    for (index, repo) in enumerate(top_repos):
+        changes = []
+        if repo.name not in before_by_name:
+            changes.append("new")
+        else:
+            (before_index, before_repo) = before_by_name[repo.name]
+            if before_index != index:
+                changes.append(f"was #{before_index + 1}")
+            if before_repo.value != repo.value:
+                changes.append(f"was {get_string_representation(before_repo.value, criteria)}")
+        changes_description = f" [{', '.join(changes)}]" if len(changes) > 0 else ""
+        print(f"\t- {repo.name} ({get_string_representation(repo.value, criteria)}){changes_description}")
+
+    names = {repo.name for repo in top_repos}
+    dropped_names = [repo.name for repo in before_top_repos if repo.name not in names]
+    if len(dropped_names) > 0:
+        print(f"\tNo longer in the top {n}: {', '.join(dropped_names)}")
+    elif [(repo.name, repo.value) for repo in before_top_repos] == [(repo.name, repo.value) for repo in top_repos]:
+        print("\tNo changes")
+
+# the orgs from the command line followed by the ones in --orgs-file (one per line, skipping blank lines and # comments),
+# without duplicates
+def _get_organization_names(args) -> list[str]:
+    organization_names = list(args.organization_names)
+    if args.organizations_file is not None:
+        with open(args.organizations_file) as organizations_file:
+            for line in organizations_file:
+                organization_name = line.split("#")[0].strip()
+                if organization_name != "":
+                    organization_names.append(organization_name)
+    return list(dict.fromkeys(organization_names))
+
+def _get_github_client(concurrency: int) -> Github:
+    # the fetch workers share this client, so it needs a connection pool at least as big as the number of workers.
+    # we also turn off pygithub's default throttling of 0.25s between requests (and 1s between "writes", which includes
+    # our read-only GraphQL POSTs) since it serializes the workers, and ask for the max page size so that listing an
+    # org's repos costs 1 request per 100 repos rather than per 30. rate limits are handled by our own scheduler
+    # rather than pygithub's retry, so that all the workers pause together. with several tokens, each request is sent
+    # with whichever one has the most budget left
+    from utilities.authentication_utilities import get_personal_access_tokens
+
+    return _create_github_client(concurrency, get_personal_access_tokens())
+
+def _create_github_client(concurrency: int, personal_access_tokens: list[str], base_url: str | None = None) -> Github:
+    from github import Auth, Consts, Github
+    from utilities.http_utilities import create_server_error_retry, install_thread_safe_connection_classes
+
+    install_thread_safe_connection_classes(personal_access_tokens)
+    return Github(
+        auth=Auth.Token(personal_access_tokens[0]) if len(personal_access_tokens) > 0 else None,
+        base_url=base_url or Consts.DEFAULT_BASE_URL,
+        per_page=MAX_PER_PAGE,
+        pool_size=concurrency,
+        retry=create_server_error_retry(),
+        seconds_between_requests=None,
+        seconds_between_writes=None,
+    )
+
+# stands in for the Github client until a request needs it, so that a query the cache can answer doesn't import
+# pygithub or ask for a PAT. the fetch workers can be the first to need it, so creating it is locked
+class _LazyGithubClient(object):
+    def __init__(self, create_client: Callable[[], Github]):
+        self._create_client = create_client
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        with self._lock:
+            if self._client is None:
+                self._client = self._create_client()
+        return getattr(self._client, name)
+
+# returns the repos, and whether they're every repo in the org (search only gives us the top of it)
+def _get_repos(github_client: Github, organization_name: str, n: int, criteria: Criteria, backend: Backend, full_scan: bool, incremental: bool, cache: GithubDataCache) -> tuple[list[RepoRecord], bool]:
+    metrics = METRICS_BY_CRITERIA[criteria]
+    if backend == Backend.GRAPHQL:
+        repos = get_repos_with_data(github_client, organization_name, cache, metrics)
+        print(f"\tFound {len(repos)} repo(s)")
+        return (repos, True)
+
+    # when ranking by something search can sort by, we only need the top of the search results rather than every
+    # repo in the org. if we already have the full listing cached though, that doesn't cost any requests at all
+    if not full_scan and criteria in SEARCH_SORT_BY_CRITERIA and cache.try_get_repos_for_org(organization_name, metrics) is None:
+        repos = try_get_top_repo_candidates_from_search(github_client, organization_name, n, criteria)
+        if repos is not None:
+            print(f"\tFound the top {len(repos)} repo(s) by {criteria.value} with Github search")
+            return (repos, False)
+        print("\tGithub search couldn't give us a complete answer, so we'll look through every repo instead")
+
+    # with --incremental, a stale pull requests count is reused if the repo's timestamps in the listing are the same as
+    # when it was fetched. that only tells us the repo hasn't changed if the listing is as fresh as the counts need to
+    # be, and the listing is cached for longer than they are, so we revalidate it (mostly 304s) if it isn't
+    revalidate = incremental and Metric.PULL_REQUESTS in metrics and not cache.is_listing_fresh_for_metric(organization_name, Metric.PULL_REQUESTS)
+    repos = get_repos(github_client, organization_name, cache, metrics, revalidate)
+    print(f"\tFound {len(repos)} repo(s)")
+    return (repos, True)
+
+def _get_top_repos_for_org(github_client: Github, organization_name: str, n: int, criteria: Criteria, backend: Backend, full_scan: bool, incremental: bool, concurrency: int, cache: GithubDataCache, snapshot_store: SnapshotStore) -> list[RepoWithValue]:
+    print(f"Gathering the repos for {organization_name}...")
+    (repos, is_full_listing) = _get_repos(github_client, organization_name, n, criteria, backend, full_scan, incremental, cache)
+    print()
     
-    with get_github_data_cache(refresh=refresh_cache) as cache:
-        print(f"Gathering the repos for {organization_name}...")
-        organization = get_organization(github_client, organization_name)
-        repos = get_repos(organization_name, organization, cache)
-        print(f"\tFound {repos.totalCount} repo(s)\n")
-        
-        print(f"Filtering to the top {n} repo(s) based on {criteria.value}...")
-        top_repos_by_criteria = get_top_repos_by_criteria(repos, n, criteria, cache)
-        _print_result(top_repos_by_criteria, args.organization_name, n, criteria)
+    print(f"Filtering to the top {n} repo(s) based on {criteria.value}...")
+    top_repos_by_criteria = get_top_repos_by_criteria(repos, n, criteria, cache, concurrency, github_client, incremental, organization_name)
+    # every scan of the whole org adds to its history, which the growth criteria rank by. the top of the search results
+    # would leave every other repo out of the hour's snapshot
+    if is_full_listing and snapshot_store.is_due_for_scan(organization_name):
+        record_scan(snapshot_store, organization_name, repos, cache)
+    _print_result(top_repos_by_criteria, organization_name, n, criteria)
+    return top_repos_by_criteria
 
-def validate_top_n_arg(value):
+# ranks by a growth criteria (e.g. stars_growth) using only the history that earlier scans left in the snapshot store
+def _get_top_repos_by_growth_for_org(organization_name: str, n: int, criteria: Criteria, window_days: int, snapshot_store: SnapshotStore) -> list[RepoWithValue]:
+    print(f"Filtering to the top {n} repo(s) in {organization_name} based on {criteria.value} over the last {window_days} day(s)...")
+    growth = snapshot_store.get_growth(organization_name, GROWTH_METRIC_BY_CRITERIA[criteria], window_days * SECONDS_PER_DAY)
+    if len(growth) == 0:
+        print(NO_SNAPSHOTS_ERROR_MESSAGE)
+        exit(1)
+    history_days = (time.time() - snapshot_store.get_first_scan_time(organization_name)) / SECONDS_PER_DAY
+    if history_days < window_days:
+        print(f"\tThe history for {organization_name} only goes back {history_days:.1f} day(s), so this is the growth since then")
+
+    repos = [RepoRecord(name=repo_full_name.split("/", 1)[-1], full_name=repo_full_name, stargazers_count=0, forks_count=0) for (repo_full_name, _, _) in growth]
+    top_repos_by_criteria = get_top_repos_by_growth(repos, [repo_growth for (_, _, repo_growth) in growth], n, criteria)
+    _print_result(top_repos_by_criteria, organization_name, n, criteria)
+    return top_repos_by_criteria
+
+# for --export: writes every repo's data to the export as we get it, and ranks them along the way
+def _export_repos_for_org(github_client: Github, organization_name: str, n: int, criteria: Criteria, backend: Backend, incremental: bool, concurrency: int, cache: GithubDataCache, snapshot_store: SnapshotStore, exporter: RepoDataExporter) -> list[RepoWithValue]:
+    print(f"Gathering the repos for {organization_name}...")
+    # search only gives us the top of the org, so we always look through every repo
+    (repos, _) = _get_repos(github_client, organization_name, n, criteria, backend, True, incremental, cache)
+    print()
+
+    print(f"Exporting the data for every repo in {organization_name} to {exporter.path}...")
+    top_repos_by_criteria = export_data_for_repos(repos, n, criteria, cache, lambda repo, repo_data: exporter.write(organization_name, repo, repo_data), concurrency, github_client, incremental)
+    if snapshot_store.is_due_for_scan(organization_name):
+        record_scan(snapshot_store, organization_name, repos, cache)
+    _print_result(top_repos_by_criteria, organization_name, n, criteria)
+    return top_repos_by_criteria
+
+# for --export --from-cache: the same as _export_repos_for_org, but with whatever is cached and without any requests
+def _export_cached_repos_for_org(organization_name: str, n: int, criteria: Criteria, cache: GithubDataCache, exporter: RepoDataExporter) -> list[RepoWithValue]:
+    checked_time = cache.try_get_repos_checked_time_for_org(organization_name)
+    if checked_time is None:
+        print(NOT_CACHED_ERROR_MESSAGE)
+        exit(1)
+
+    print(f"Exporting the cached data for every repo in {organization_name} to {exporter.path}...")
+    print(f"\tThe cached repos for {organization_name} are from {(time.time() - checked_time) / SECONDS_PER_HOUR:.1f} hour(s) ago")
+    repos_with_pull_requests_count = cache.iterate_repos_with_metric_for_org(organization_name, Metric.PULL_REQUESTS)
+    top_repos_by_criteria = export_cached_data_for_repos(repos_with_pull_requests_count, n, criteria, lambda repo, repo_data: exporter.write(organization_name, repo, repo_data))
+    _print_result(top_repos_by_criteria, organization_name, n, criteria)
+    return top_repos_by_criteria
+
+# for --stale-ok: prints the top repos from cached data up to `max_age_seconds` old right away, then refreshes whatever
+# was stale (without the usual progress output) so that the cache is up to date for the next run. returns None if the
+# cached data can't give a complete answer, in which case the org goes through the usual path
+def _try_get_stale_ok_top_repos_for_org(github_client: Github, organization_name: str, n: int, criteria: Criteria, backend: Backend, incremental: bool, concurrency: int, max_age_seconds: int, show_changes: bool, cache: GithubDataCache, snapshot_store: SnapshotStore) -> list[RepoWithValue] | None:
+    cached_listing = cache.try_get_stale_ok_repos_for_org(organization_name, METRICS_BY_CRITERIA[criteria], max_age_seconds)
+    if cached_listing is None:
+        return None
+    (repos, is_listing_stale) = cached_listing
+    cached_top_repos = try_get_top_repos_from_cache(repos, n, criteria, cache, max_age_seconds)
+    if cached_top_repos is None:
+        return None
+    (top_repos_by_criteria, stale_count) = cached_top_repos
+
+    _print_result(top_repos_by_criteria, organization_name, n, criteria)
+    if not is_listing_stale and stale_count == 0:
+        return top_repos_by_criteria
+
+    print(f"\nRefreshing the stale cached data for {organization_name}...")
+    # flush so the answer shows up before the refresh starts, e.g. when stdout is piped
+    sys.stdout.flush()
+    with redirect_stdout(io.StringIO()) as refresh_output:
+        try:
+            # always as a full scan, since search (for stars and forks) doesn't write the listing back to the cache, so
+            # the stale listing would never be refreshed
+            refreshed_top_repos = _get_top_repos_for_org(github_client, organization_name, n, criteria, backend, True, incremental, concurrency, cache, snapshot_store)
+        except SystemExit:
+            refreshed_top_repos = None
+    if refreshed_top_repos is None:
+        # the answer above still stands, it just might be out of date
+        print(refresh_output.getvalue(), end="")
+        print(f"Couldn't refresh the data for {organization_name}, so the top repos above may be out of date")
+        return top_repos_by_criteria
+
+    if show_changes:
+        _print_changes(top_repos_by_criteria, refreshed_top_repos, organization_name, n, criteria)
+    return refreshed_top_repos
+
+# returns the orgs that errored out
+def _explore_organizations(args, github_client: Github | None, cache: GithubDataCache, snapshot_store: SnapshotStore, exporter: RepoDataExporter | None) -> list[str]:
+    (n, criteria, concurrency, backend, full_scan, incremental, cross_org) = (args.n, Criteria(args.criteria), args.concurrency, Backend(args.backend), args.full_scan, args.incremental, args.cross_org)
+    organization_names = _get_organization_names(args)
+
+    def get_top_repos_for_org(organization_name: str) -> list[RepoWithValue]:
+        if criteria in GROWTH_METRIC_BY_CRITERIA:
+            return _get_top_repos_by_growth_for_org(organization_name, n, criteria, args.window_days, snapshot_store)
+        if exporter is not None and args.from_cache:
+            return _export_cached_repos_for_org(organization_name, n, criteria, cache, exporter)
+        if exporter is not None:
+            return _export_repos_for_org(github_client, organization_name, n, criteria, backend, incremental, concurrency, cache, snapshot_store, exporter)
+        if args.stale_ok:
+            top_repos_by_criteria = _try_get_stale_ok_top_repos_for_org(github_client, organization_name, n, criteria, backend, incremental, concurrency, args.max_stale_age * 60, args.show_changes, cache, snapshot_store)
+            if top_repos_by_criteria is not None:
+                return top_repos_by_criteria
+        return _get_top_repos_for_org(github_client, organization_name, n, criteria, backend, full_scan, incremental, concurrency, cache, snapshot_store)
+
+    # every org goes through the same client (and connection pool), rate limit scheduler, and cache session
+    failed_organization_names = []
+    top_repos = []
+    for (index, organization_name) in enumerate(organization_names):
+        if index > 0:
+            print()
+        if len(organization_names) == 1:
+            top_repos += get_top_repos_for_org(organization_name)
+            continue
+        # in a batch, an org that errors out (e.g. because it doesn't exist) shouldn't throw away the others
+        try:
+            top_repos += get_top_repos_for_org(organization_name)
+        except SystemExit:
+            print(f"Skipped {organization_name} because of the error above")
+            failed_organization_names.append(organization_name)
+
+    # any repo in the top n across all of the orgs has to be in the top n of its own org, so we don't need any
+    # more data to rank them together. repo names can repeat across orgs, so ties go by full name instead
+    if cross_org:
+        ranked_repos = heapq.nsmallest(n, top_repos, key=lambda repo: (-repo.value, repo.repo.full_name))
+        _print_cross_organization_result(ranked_repos, len(organization_names) - len(failed_organization_names), n, criteria)
+    return failed_organization_names
+
+# --record and --replay run against an empty cache (and snapshot store) rather than the ones on disk. a recording then
+# has every request the run could make, and a replay makes the same requests as the recording did
+@contextmanager
+def _open_in_memory_cache(refresh: bool, time_to_live_seconds_by_metric: dict[Metric, int], max_entries: int, max_bytes: int):
+    cache = GithubDataCache(time_to_live_seconds_by_metric=time_to_live_seconds_by_metric, max_entries=max_entries, max_bytes=max_bytes)
+    try:
+        yield cache
+    finally:
+        cache.close()
+
+def _open_http_archive(args) -> HttpRecording | HttpReplay | None:
+    if args.record is None and args.replay is None:
+        return None
+    from utilities.http_archive_utilities import HttpRecording, HttpReplay
+
+    if args.record is not None:
+        return HttpRecording(args.record)
+    return HttpReplay(args.replay, args.replay_latency)
+
+def _use_http_archive(http_archive: HttpRecording | HttpReplay | None):
+    if http_archive is None:
+        return nullcontext()
+    from utilities.http_archive_utilities import use_http_archive
+
+    return use_http_archive(http_archive)
+
+# the daemon passes in its long-lived client and a way to open its cache rather than the one on disk (see
+# github_organization_repo_explorer_daemon.py)
+def main(args, github_client: Github | None = None, open_cache: Callable | None = None):
+    profiler = start_profiler()
+    try:
+        http_archive = _open_http_archive(args)
+        if http_archive is not None:
+            open_cache = _open_in_memory_cache
+        # a replay doesn't send any requests, so it doesn't need a token
+        if args.replay is not None:
+            github_client = _create_github_client(args.concurrency, [], http_archive.base_url)
+        # exporting from the cache doesn't make any requests, so it doesn't need a client (or a token) either. otherwise
+        # the client is only created once something isn't cached (or is stale)
+        elif github_client is None and not args.from_cache:
+            github_client = _LazyGithubClient(lambda: _get_github_client(args.concurrency))
+        time_to_live_seconds_by_metric = {metric: minutes * 60 for (metric, minutes) in args.cache_ttls}
+        with (
+            _use_http_archive(http_archive),
+            (open_cache or get_github_data_cache)(refresh=args.refresh_cache, time_to_live_seconds_by_metric=time_to_live_seconds_by_metric, max_entries=args.cache_max_entries, max_bytes=args.cache_max_mb * BYTES_PER_MB) as cache,
+            (closing(SnapshotStore()) if http_archive is not None else get_snapshot_store()) as snapshot_store,
+            (open_exporter(args.export, args.export_format) if args.export is not None else nullcontext()) as exporter,
+        ):
+            try:
+                failed_organization_names = _explore_organizations(args, github_client, cache, snapshot_store, exporter)
+            finally:
+                # whatever was exported before an error is still there
+                if exporter is not None:
+                    print(f"\nExported {exporter.row_count} repo(s) to {exporter.path}")
+                if args.record is not None:
+                    print(f"\nRecorded {http_archive.exchange_count} request(s) to {args.record}")
+                elif args.replay is not None:
+                    print(f"\nReplayed {http_archive.exchange_count} request(s) from {args.replay}")
+
+        if len(failed_organization_names) > 0:
+            print(f"\nCouldn't get the top repos for: {', '.join(failed_organization_names)}")
+            exit(1)
+    finally:
+        # we still want the profile of a run that errored out, since that's often the one that needs looking into
+        if args.profile is not None:
+            profiler.write(args.profile, args.profile_format)
+            print(f"\n{profiler.get_summary()}")
+            print(f"Wrote the profile to {args.profile}")
+
+def _validate_positive_int_arg(value, error_message: str) -> int:
     try:
         value_as_int = int(value)
         if value_as_int < 1:
-            raise argparse.ArgumentTypeError(TOP_N_ARG_VALIDATION_ERROR_MESSAGE)
+            raise argparse.ArgumentTypeError(error_message)
     except:
-        raise argparse.ArgumentTypeError(TOP_N_ARG_VALIDATION_ERROR_MESSAGE)
+        raise argparse.ArgumentTypeError(error_message)
     return value_as_int
 
-def parse_args():
-    parser = argparse.ArgumentParser(prog="py", description="For a given Github org, finds the top N repos by the requested criteria.")
-    parser.add_argument("organization_name", type=str, help="The name of the org you want to explore")
+def validate_top_n_arg(value):
+    return _validate_positive_int_arg(value, TOP_N_ARG_VALIDATION_ERROR_MESSAGE)
+
+def validate_concurrency_arg(value):
+    return _validate_positive_int_arg(value, CONCURRENCY_ARG_VALIDATION_ERROR_MESSAGE)
+
+def validate_cache_max_entries_arg(value):
+    return _validate_positive_int_arg(value, CACHE_MAX_ENTRIES_ARG_VALIDATION_ERROR_MESSAGE)
+
+def validate_cache_max_mb_arg(value):
+    return _validate_positive_int_arg(value, CACHE_MAX_MB_ARG_VALIDATION_ERROR_MESSAGE)
+
+def validate_max_stale_age_arg(value):
+    return _validate_positive_int_arg(value, MAX_STALE_AGE_ARG_VALIDATION_ERROR_MESSAGE)
+
+def validate_window_days_arg(value):
+    return _validate_positive_int_arg(value, WINDOW_DAYS_ARG_VALIDATION_ERROR_MESSAGE)
+
+def validate_cache_ttl_arg(value) -> tuple[Metric, int]:
+    try:
+        (metric_value, minutes) = value.split("=")
+        (metric, minutes_as_int) = (Metric(metric_value), int(minutes))
+        if minutes_as_int < 0:
+            raise argparse.ArgumentTypeError(CACHE_TTL_ARG_VALIDATION_ERROR_MESSAGE)
+    except:
+        raise argparse.ArgumentTypeError(CACHE_TTL_ARG_VALIDATION_ERROR_MESSAGE)
+    return (metric, minutes_as_int)
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="py", description="For each given Github org, finds the top N repos by the requested criteria.")
+    parser.add_argument("organization_names", type=str, nargs="*", metavar="organization_name", help="The names of the orgs you want to explore")
+    parser.add_argument("--orgs-file", dest="organizations_file", type=str, required=False, help="A file with more orgs to explore, one per line")
+    parser.add_argument("--cross-org", dest="cross_org", action="store_true", help="Also rank the top N repos across all of the orgs")
     parser.add_argument("--number", "-n", dest="n", type=validate_top_n_arg, required=False, default=5, help="The number of repos you want to filter to")
     parser.add_argument("--criteria", "-c", dest="criteria", type=str, required=True, choices=[criteria.value for criteria in Criteria], help="The criteria you want to filter by")
+    parser.add_argument("--window-days", dest="window_days", type=validate_window_days_arg, required=False, default=DEFAULT_WINDOW_DAYS, help="For the growth criteria (e.g. stars_growth), how many days back to measure the growth over")
+    parser.add_argument("--export", dest="export", type=str, required=False, help="Also write the data for every repo (not just the top N) to this file as it's fetched. The format comes from the extension (.jsonl, .csv, or .parquet) unless --export-format is given")
+    parser.add_argument("--export-format", dest="export_format", type=str, required=False, choices=EXPORT_FORMATS, help="The format of the --export file. parquet needs pyarrow")
+    parser.add_argument("--from-cache", dest="from_cache", action="store_true", help="With --export, export whatever is cached, however old it is, without making any requests")
     parser.add_argument("--refresh-cache", dest="refresh_cache", action="store_true")
-    return parser.parse_args()
+    parser.add_argument("--backend", dest="backend", type=str, required=False, default=Backend.REST.value, choices=[backend.value for backend in Backend], help="Which Github API to fetch repo data with. The graphql backend needs far fewer requests for large orgs but requires a PAT")
+    parser.add_argument("--full-scan", dest="full_scan", action="store_true", help="Rank by stars or forks by looking through every repo in the org rather than the top of Github's search results")
+    parser.add_argument("--incremental", dest="incremental", action="store_true", help="When cached data has expired, only check the repos that have been updated or pushed to since it was fetched. Changes that don't touch a repo's timestamps (e.g. a pull request from a fork) can take up to a day to show up")
+    parser.add_argument("--stale-ok", dest="stale_ok", action="store_true", help="Print the top repos right away from cached data, even if it's past its TTL, then refresh the stale data so the next run is up to date")
+    parser.add_argument("--max-stale-age", dest="max_stale_age", type=validate_max_stale_age_arg, required=False, default=DEFAULT_MAX_STALE_AGE_MINUTES, help="With --stale-ok, how many minutes old cached data can be and still be used for the first answer")
+    parser.add_argument("--show-changes", dest="show_changes", action="store_true", help="With --stale-ok, also print the top repos after refreshing and how they changed")
+    parser.add_argument("--cache-ttl", dest="cache_ttls", type=validate_cache_ttl_arg, action="append", required=False, default=[], help="How many minutes a cached metric (stars, forks, or pull_requests) stays fresh for, e.g. --cache-ttl pull_requests=10. Can be repeated for each metric")
+    parser.add_argument("--cache-max-entries", dest="cache_max_entries", type=validate_cache_max_entries_arg, required=False, default=DEFAULT_MAX_CACHE_ENTRIES, help="The max number of entries (repos in org listings and metrics for repos) to keep in the cache before evicting the least recently used orgs")
+    parser.add_argument("--cache-max-mb", dest="cache_max_mb", type=validate_cache_max_mb_arg, required=False, default=DEFAULT_MAX_CACHE_BYTES // BYTES_PER_MB, help="The max size of the cache in MB before evicting the least recently used orgs")
+    parser.add_argument("--concurrency", dest="concurrency", type=validate_concurrency_arg, required=False, default=DEFAULT_CONCURRENCY, help="The max number of repos to fetch data for in parallel")
+    parser.add_argument("--profile", dest="profile", type=str, required=False, help="Write a profile of the run (requests per endpoint, latencies, cache hits and misses, and time per phase) to this file")
+    parser.add_argument(RECORD_ARG, dest="record", type=str, required=False, help="Record every request the run makes to Github, and the responses, to this file so that the run can be replayed with --replay. Runs against an empty cache")
+    parser.add_argument(REPLAY_ARG, dest="replay", type=str, required=False, help="Answer the run's requests from a file recorded with --record rather than Github, without a network or a PAT. Runs against an empty cache")
+    parser.add_argument("--replay-latency", dest="replay_latency", action="store_true", help="With --replay, take as long to answer each request as Github did when it was recorded")
+    parser.add_argument(NO_DAEMON_ARG, dest="no_daemon", action="store_true", help="Run the query in this process even if the daemon is running")
+    parser.add_argument("--profile-format", dest="profile_format", type=str, required=False, default=JSON_FORMAT, choices=PROFILE_FORMATS, help="The format of the --profile file. chrome-trace files can be opened in chrome://tracing or https://ui.perfetto.dev")
+    args = parser.parse_args(argv)
+    if len(args.organization_names) == 0 and args.organizations_file is None:
+        parser.error(ORGANIZATION_NAMES_ARG_VALIDATION_ERROR_MESSAGE)
+    if args.export is not None and (Criteria(args.criteria) in GROWTH_METRIC_BY_CRITERIA or args.stale_ok):
+        parser.error(EXPORT_ARG_VALIDATION_ERROR_MESSAGE)
+    if args.from_cache and args.export is None:
+        parser.error(FROM_CACHE_ARG_VALIDATION_ERROR_MESSAGE)
+    if args.record is not None and args.replay is not None:
+        parser.error(RECORD_ARG_VALIDATION_ERROR_MESSAGE)
+    if args.replay_latency and args.replay is None:
+        parser.error(REPLAY_LATENCY_ARG_VALIDATION_ERROR_MESSAGE)
+    return args
 
 if __name__ == "__main__":
+    # when the daemon is running, it answers the query with its open cache and connections. recordings and replays need
+    # their own connections and cache though, so they always run in this process
+    if not any(arg.split("=")[0] in [NO_DAEMON_ARG, RECORD_ARG, REPLAY_ARG] for arg in sys.argv[1:]):
+        exit_code = try_run_with_daemon(sys.argv[1:])
+        if exit_code is not None:
+            exit(exit_code)
     main(parse_args())
\ No newline at end of file
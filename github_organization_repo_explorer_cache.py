@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import argparse
+from datetime import datetime
+import os
+
+import github_organization_repo_explorer as explorer
+from utilities import cache_utilities
+from utilities.cache_utilities import DEFAULT_MAX_CACHE_BYTES, DEFAULT_MAX_CACHE_ENTRIES, GithubDataCache
+from utilities.profiling_utilities import CACHE_HIT, CACHE_MISS, CACHE_STALE
+
+'''
+Inspects and maintains the on-disk cache without running a query:
+- `stats` prints the cache's size, what's in it, and its hit rates over every run so far
+- `compact` drops entries that are too old to be worth revalidating and evicts the least recently used orgs until the
+  cache is within its limits, which saving the cache otherwise only does every so often
+'''
+
+STATS_COMMAND = "stats"
+COMPACT_COMMAND = "compact"
+NO_CACHE_MESSAGE = "There's no cached data yet."
+
+def _format_mb(size_bytes: int) -> str:
+    return f"{size_bytes / explorer.BYTES_PER_MB:.1f} MB"
+
+def _print_stats(cache: GithubDataCache) -> None:
+    print(f"Cache: {cache_utilities.CACHE_FILE}")
+    print(f"\tSize: {_format_mb(cache.get_file_size_bytes())} on disk, {_format_mb(cache.get_size_bytes())} in use (limit {_format_mb(cache.max_bytes)})")
+    print(f"\tEntries: {cache.get_entry_count():,} (limit {cache.max_entries:,})")
+    (organization_count, repo_count) = cache.get_organization_counts()
+    print(f"\t\t- {organization_count:,} org listing(s) with {repo_count:,} repo(s)")
+    for (metric, (count, stale_count)) in cache.get_metric_counts().items():
+        print(f"\t\t- {metric.value}: {count:,} ({stale_count:,} stale)")
+    last_compacted_time = cache.get_last_compacted_time()
+    print(f"\tLast compacted: {datetime.fromtimestamp(last_compacted_time).strftime('%Y-%m-%d %H:%M') if last_compacted_time is not None else 'never'}")
+
+    print("\nHit rates:")
+    lookup_counts_by_kind = cache.get_lookup_counts()
+    if len(lookup_counts_by_kind) == 0:
+        print("\tNo lookups recorded yet")
+    for (kind, counts) in lookup_counts_by_kind.items():
+        total_count = sum(counts.values())
+        print(f"\t- {kind}: {counts[CACHE_HIT] / total_count * 100:.1f}% ({counts[CACHE_HIT]:,} hit(s), {counts[CACHE_MISS]:,} miss(es), {counts[CACHE_STALE]:,} stale)")
+
+def _compact(cache: GithubDataCache) -> None:
+    size_bytes = cache.get_file_size_bytes()
+    removed_count = cache.compact()
+    cache.commit()
+    cache.vacuum_if_fragmented()
+    print(f"Removed {removed_count:,} entries. The cache went from {_format_mb(size_bytes)} to {_format_mb(cache.get_file_size_bytes())} on disk.")
+
+def main(args):
+    if not os.path.exists(cache_utilities.CACHE_FILE):
+        print(NO_CACHE_MESSAGE)
+        return
+
+    cache = GithubDataCache(cache_utilities.CACHE_FILE, max_entries=args.cache_max_entries, max_bytes=args.cache_max_mb * explorer.BYTES_PER_MB)
+    try:
+        if args.command == STATS_COMMAND:
+            _print_stats(cache)
+        elif args.command == COMPACT_COMMAND:
+            _compact(cache)
+    finally:
+        cache.close()
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="py", description="Inspects and maintains the explorer's on-disk cache.")
+    parser.add_argument("command", type=str, choices=[STATS_COMMAND, COMPACT_COMMAND], help="stats prints the cache's size and hit rates, and compact removes old entries and evicts orgs past the limits")
+    parser.add_argument("--cache-max-entries", dest="cache_max_entries", type=explorer.validate_cache_max_entries_arg, required=False, default=DEFAULT_MAX_CACHE_ENTRIES, help="The max number of entries to keep in the cache")
+    parser.add_argument("--cache-max-mb", dest="cache_max_mb", type=explorer.validate_cache_max_mb_arg, required=False, default=DEFAULT_MAX_CACHE_BYTES // explorer.BYTES_PER_MB, help="The max size of the cache in MB")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    main(parse_args())
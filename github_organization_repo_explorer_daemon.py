@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import argparse
+from contextlib import contextmanager
+import os
+
+from github import Github
+
+import github_organization_repo_explorer as explorer
+from models.metric import Metric
+from utilities.cache_utilities import DEFAULT_MAX_CACHE_BYTES, DEFAULT_MAX_CACHE_ENTRIES, GithubDataCache, get_github_data_cache, save_github_data_cache
+from utilities.daemon_utilities import DaemonServer, is_daemon_running
+from utilities.repo_utilities import DEFAULT_CONCURRENCY
+
+'''
+A long-running process that answers the explorer's queries over a Unix socket.
+
+It keeps the Github client (and its pool of open connections), the rate limit scheduler, and the cache open between
+queries, so a query doesn't pay for starting python, importing pygithub, looking up the PAT, opening the cache, or new
+TLS handshakes. While it's running, `github_organization_repo_explorer.py` hands its arguments over to it and prints
+the answer.
+'''
+
+DAEMON_ALREADY_RUNNING_ERROR_MESSAGE = "The daemon is already running."
+
+class ExplorerDaemon(object):
+    def __init__(self, github_client: Github, cache: GithubDataCache):
+        self.github_client = github_client
+        self.cache = cache
+
+    # stands in for get_github_data_cache for each query, so the query's changes are saved when it finishes, like they
+    # would be for a run from the command line
+    @contextmanager
+    def open_cache(self, refresh: bool = False, time_to_live_seconds_by_metric: dict[Metric, int] | None = None, max_entries: int = DEFAULT_MAX_CACHE_ENTRIES, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.cache.start_session()
+        self.cache.set_time_to_live_seconds_by_metric(time_to_live_seconds_by_metric)
+        self.cache.set_limits(max_entries, max_bytes)
+        if refresh:
+            self.cache.clear()
+        try:
+            yield self.cache
+        finally:
+            save_github_data_cache(self.cache)
+
+    def answer_query(self, argv: list[str], cwd: str) -> None:
+        args = explorer.parse_args(argv)
+        # the paths are relative to wherever the query came from rather than wherever the daemon was started
+        if args.organizations_file is not None:
+            args.organizations_file = os.path.join(cwd, args.organizations_file)
+        if args.profile is not None:
+            args.profile = os.path.join(cwd, args.profile)
+        if args.export is not None:
+            args.export = os.path.join(cwd, args.export)
+        explorer.main(args, self.github_client, self.open_cache)
+
+def main(args):
+    if is_daemon_running():
+        print(DAEMON_ALREADY_RUNNING_ERROR_MESSAGE)
+        exit(1)
+
+    github_client = explorer._get_github_client(args.concurrency)
+    with get_github_data_cache() as cache:
+        daemon = ExplorerDaemon(github_client, cache)
+        with DaemonServer(daemon.answer_query) as server:
+            print(f"Listening for queries on {server.socket_path}. Press Ctrl-C to stop.")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                print("\nStopping the daemon")
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="py", description="Keeps the Github client and cache open to answer the explorer's queries quickly.")
+    parser.add_argument("--concurrency", dest="concurrency", type=explorer.validate_concurrency_arg, required=False, default=DEFAULT_CONCURRENCY, help="The number of connections to keep open to Github")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    main(parse_args())
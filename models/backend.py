@@ -0,0 +1,7 @@
+from enum import Enum
+
+class Backend(Enum):
+    # one request to list the org's repos, then one request per repo for the pull requests count
+    REST = "rest"
+    # a few batched queries that return the stars, forks, and pull requests counts for up to 100 repos each
+    GRAPHQL = "graphql"
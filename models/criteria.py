@@ -5,6 +5,10 @@ class Criteria(Enum):
     FORKS = "forks"
     PULL_REQUESTS = "pull_requests"
     CONTRIBUTION_PERCENTAGE = "contribution_percentage"
+    # how much the count went up over a window of time, from the snapshot store rather than Github
+    STARS_GROWTH = "stars_growth"
+    FORKS_GROWTH = "forks_growth"
+    PULL_REQUESTS_GROWTH = "pull_requests_growth"
 
 def get_string_representation(value: int | float, criteria: Criteria) -> str:
     if criteria == Criteria.STARS:
@@ -14,4 +18,10 @@ def get_string_representation(value: int | float, criteria: Criteria) -> str:
     elif criteria == Criteria.PULL_REQUESTS:
         return f"{value} pull requests" if value != 1 else f"{value} pull request"
     elif criteria == Criteria.CONTRIBUTION_PERCENTAGE:
-        return f"{round(value, 2)}%"
\ No newline at end of file
+        return f"{round(value, 2)}%"
+    elif criteria == Criteria.STARS_GROWTH:
+        return f"{value:+} stars" if abs(value) != 1 else f"{value:+} star"
+    elif criteria == Criteria.FORKS_GROWTH:
+        return f"{value:+} forks" if abs(value) != 1 else f"{value:+} fork"
+    elif criteria == Criteria.PULL_REQUESTS_GROWTH:
+        return f"{value:+} pull requests" if abs(value) != 1 else f"{value:+} pull request"
\ No newline at end of file
@@ -0,0 +1,26 @@
+from enum import Enum
+
+from models.criteria import Criteria
+
+class Metric(Enum):
+    STARS = "stars"
+    FORKS = "forks"
+    PULL_REQUESTS = "pull_requests"
+
+# the metrics we need to rank repos by each criteria
+METRICS_BY_CRITERIA = {
+    Criteria.STARS: frozenset({Metric.STARS}),
+    Criteria.FORKS: frozenset({Metric.FORKS}),
+    Criteria.PULL_REQUESTS: frozenset({Metric.PULL_REQUESTS}),
+    Criteria.CONTRIBUTION_PERCENTAGE: frozenset({Metric.PULL_REQUESTS, Metric.FORKS}),
+}
+
+# the metric that each growth criteria ranks by the growth of
+GROWTH_METRIC_BY_CRITERIA = {
+    Criteria.STARS_GROWTH: Metric.STARS,
+    Criteria.FORKS_GROWTH: Metric.FORKS,
+    Criteria.PULL_REQUESTS_GROWTH: Metric.PULL_REQUESTS,
+}
+
+# the metrics that come with the org's repo listing, rather than needing a request per repo
+LISTING_METRICS = frozenset({Metric.STARS, Metric.FORKS})
@@ -1,7 +1,10 @@
 from models.criteria import Criteria
 
 class RepoData:
-    def __init__(self, stars_count: int, forks_count: int, pull_requests_count: int):
+    __slots__ = ("stars_count", "forks_count", "pull_requests_count")
+
+    # pull_requests_count may be None if we only needed the data that's available from the org's repo listing
+    def __init__(self, stars_count: int, forks_count: int, pull_requests_count: int | None):
         self.stars_count = stars_count
         self.forks_count = forks_count
         self.pull_requests_count = pull_requests_count
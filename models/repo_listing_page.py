@@ -0,0 +1,9 @@
+from models.repo_record import RepoRecord
+from models.validators import Validators
+
+# one page of an org's repo listing. we cache the listing page by page since Github validates each page separately.
+class RepoListingPage:
+    def __init__(self, repos: list[RepoRecord], validators: Validators | None, has_next_page: bool):
+        self.repos = repos
+        self.validators = validators
+        self.has_next_page = has_next_page
@@ -0,0 +1,81 @@
+from array import array
+import heapq
+from typing import Iterable
+
+from models.criteria import Criteria
+from models.repo_record import RepoRecord
+
+'''
+A compact table of the metrics for a list of repos, stored as columns rather than as an object per repo.
+
+Ranking a table only creates Python objects for the n repos it returns, and the values for each criteria are computed
+once per table, so the same table can answer top n queries for every criteria.
+'''
+
+# marks a repo whose pull requests count we don't have (e.g. because it was skipped as unable to make the top n)
+MISSING_COUNT = -1
+
+class RepoMetricTable:
+    __slots__ = ("repos", "stars_counts", "forks_counts", "pull_requests_counts", "growths_by_criteria", "_values_by_criteria")
+
+    # the counts line up with `repos`. `pull_requests_counts` uses None for the repos we don't have a count for, and if
+    # it's left out, we don't have any. `growths_by_criteria` has the values for any growth criteria we're ranking by
+    # (see utilities/snapshot_utilities.py), which can be negative
+    def __init__(self, repos: list[RepoRecord], stars_counts: Iterable[int], forks_counts: Iterable[int], pull_requests_counts: Iterable[int | None] | None = None, growths_by_criteria: dict[Criteria, Iterable[int | None]] | None = None):
+        self.repos = repos
+        self.stars_counts = array("q", stars_counts)
+        self.forks_counts = array("q", forks_counts)
+        self.pull_requests_counts = array("q", [MISSING_COUNT]) * len(repos)
+        if pull_requests_counts is not None:
+            for (index, pull_requests_count) in enumerate(pull_requests_counts):
+                if pull_requests_count is not None:
+                    self.pull_requests_counts[index] = pull_requests_count
+        self.growths_by_criteria = {criteria: list(growths) for (criteria, growths) in (growths_by_criteria or {}).items()}
+        self._values_by_criteria = {}
+
+    def __len__(self) -> int:
+        return len(self.repos)
+
+    def set_pull_requests_count(self, index: int, pull_requests_count: int) -> None:
+        self.pull_requests_counts[index] = pull_requests_count
+        # the pull requests and contribution percentage columns depend on this
+        self._values_by_criteria.pop(Criteria.PULL_REQUESTS, None)
+        self._values_by_criteria.pop(Criteria.CONTRIBUTION_PERCENTAGE, None)
+
+    # the value of every repo for `criteria`, with None for the repos that are missing a count it needs
+    def get_values(self, criteria: Criteria) -> list[int | float | None]:
+        if criteria not in self._values_by_criteria:
+            if criteria == Criteria.STARS:
+                values = list(self.stars_counts)
+            elif criteria == Criteria.FORKS:
+                values = list(self.forks_counts)
+            elif criteria == Criteria.PULL_REQUESTS:
+                values = [count if count != MISSING_COUNT else None for count in self.pull_requests_counts]
+            elif criteria == Criteria.CONTRIBUTION_PERCENTAGE:
+                # this has to match RepoData.get_data_for_criteria exactly, or ties could break differently
+                values = [
+                    pull_requests_count / (forks_count + 1) * 100 if pull_requests_count != MISSING_COUNT else None
+                    for (pull_requests_count, forks_count) in zip(self.pull_requests_counts, self.forks_counts)
+                ]
+            elif criteria in self.growths_by_criteria:
+                values = self.growths_by_criteria[criteria]
+            else:
+                raise ValueError(f"Unknown criteria: {criteria.value}")
+            self._values_by_criteria[criteria] = values
+        return self._values_by_criteria[criteria]
+
+    # returns the top n (value, repo) pairs for `criteria` from highest to lowest, in the same order as ranking the
+    # repos with RepoWithValue. repos that are missing a count the criteria needs are left out.
+    def get_top_n(self, n: int, criteria: Criteria) -> list[tuple[int | float, RepoRecord]]:
+        values = self.get_values(criteria)
+        present_values = [value for value in values if value is not None]
+        if n < 1 or len(present_values) == 0:
+            return []
+
+        # a partial selection of just the values is much cheaper than carrying every repo's name through it. once we
+        # know the nth highest value, only the repos at or above it can make the top n, and we break their ties by name
+        # with earlier names first (see RepoWithValue)
+        nth_value = heapq.nlargest(n, present_values)[-1]
+        candidate_indices = [index for (index, value) in enumerate(values) if value is not None and value >= nth_value]
+        top_n_indices = heapq.nsmallest(n, candidate_indices, key=lambda index: (-values[index], self.repos[index].name))
+        return [(values[index], self.repos[index]) for index in top_n_indices]
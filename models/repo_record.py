@@ -0,0 +1,22 @@
+# a compact, fully materialized record of a repo from its org's listing. it mirrors the attribute names of
+# pygithub's Repository for the fields we rank on, but unlike a Repository it doesn't hold on to a client, so
+# it's cheap to cache and never makes requests on its own.
+class RepoRecord:
+    # open_issues_count includes open pull requests, so it's an upper bound on the pull requests count. it may be None
+    # if the repo didn't come from the REST API's listing. updated_at and pushed_at are Github's timestamps for the
+    # last change to the repo and the last push to it, which we use to tell whether the repo has changed since we
+    # last fetched its data. they may be None if we don't know them.
+    def __init__(self, name: str, full_name: str, stargazers_count: int, forks_count: int, open_issues_count: int | None = None, updated_at: str | None = None, pushed_at: str | None = None):
+        self.name = name
+        self.full_name = full_name
+        self.stargazers_count = stargazers_count
+        self.forks_count = forks_count
+        self.open_issues_count = open_issues_count
+        self.updated_at = updated_at
+        self.pushed_at = pushed_at
+
+    def __eq__(self, other):
+        return isinstance(other, RepoRecord) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"RepoRecord({self.full_name})"
@@ -0,0 +1,14 @@
+# the validators Github sent with a response, which we send back when re-requesting it so that Github can tell
+# us it hasn't changed (a 304, which doesn't count against the rate limit) instead of sending it again
+class Validators:
+    def __init__(self, etag: str | None, last_modified: str | None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def get_conditional_request_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
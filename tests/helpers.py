@@ -1,16 +1,51 @@
-from unittest.mock import MagicMock
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
 
 from models.criteria import Criteria
 from models.repo_data import RepoData
+from models.repo_record import RepoRecord
 
 def create_mock_repository(organization_name: str, repo_name: str):
     mock_repository = MagicMock()
     mock_repository.name = repo_name
     mock_repository.full_name = f"{organization_name}/{repo_name}"
+    # we don't know anything about the repo's pull requests from its listing
+    mock_repository.open_issues_count = None
+    # or when it last changed
+    mock_repository.updated_at = None
+    mock_repository.pushed_at = None
     return mock_repository
+
+def create_repo_record(organization_name: str, repo_name: str, stargazers_count: int = 0, forks_count: int = 0, open_issues_count: int | None = None, updated_at: str | None = None, pushed_at: str | None = None) -> RepoRecord:
+    return RepoRecord(name=repo_name, full_name=f"{organization_name}/{repo_name}", stargazers_count=stargazers_count, forks_count=forks_count, open_issues_count=open_issues_count, updated_at=updated_at, pushed_at=pushed_at)
     
 def assertRepoDataIsEqual(repo_data1: RepoData, repo_data2: RepoData) -> None:
     assert repo_data1.get_data_for_criteria(Criteria.STARS) == repo_data2.get_data_for_criteria(Criteria.STARS)
     assert repo_data1.get_data_for_criteria(Criteria.FORKS) == repo_data2.get_data_for_criteria(Criteria.FORKS)
     assert repo_data1.get_data_for_criteria(Criteria.PULL_REQUESTS) == repo_data2.get_data_for_criteria(Criteria.PULL_REQUESTS)
-    assert repo_data1.get_data_for_criteria(Criteria.CONTRIBUTION_PERCENTAGE) == repo_data2.get_data_for_criteria(Criteria.CONTRIBUTION_PERCENTAGE)
\ No newline at end of file
+    assert repo_data1.get_data_for_criteria(Criteria.CONTRIBUTION_PERCENTAGE) == repo_data2.get_data_for_criteria(Criteria.CONTRIBUTION_PERCENTAGE)
+
+def use_temporary_cache_directory(test_case: unittest.TestCase) -> str:
+    # points the on-disk cache at a temporary directory for the duration of the test
+    temporary_directory = tempfile.TemporaryDirectory()
+    test_case.addCleanup(temporary_directory.cleanup)
+    cache_directory = temporary_directory.name
+    for (name, value) in [
+        ("CACHE_DIRECTORY", cache_directory),
+        ("CACHE_FILE", os.path.join(cache_directory, "github_data.sqlite3")),
+        ("PICKLE_CACHE_FILE", os.path.join(cache_directory, "github_data.pkl")),
+    ]:
+        patcher = patch(f"utilities.cache_utilities.{name}", value)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+    # so that tests never talk to a daemon that's running on this machine or add to the real snapshot history
+    for (name, value) in [
+        ("utilities.daemon_utilities.DAEMON_SOCKET_PATH", os.path.join(cache_directory, "daemon.sock")),
+        ("utilities.snapshot_utilities.SNAPSHOT_FILE", os.path.join(cache_directory, "snapshots.sqlite3")),
+    ]:
+        patcher = patch(name, value)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+    return cache_directory
@@ -0,0 +1,423 @@
+from collections import Counter
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from github import Auth, Github
+
+from utilities.http_utilities import create_server_error_retry, install_thread_safe_connection_classes
+
+'''
+A local stand-in for the parts of the Github REST and GraphQL APIs that this tool uses, so that tests and
+benchmarks can exercise the real pygithub client path without reaching out to Github.
+
+Point a client at it with `server.create_client()`, or `Github(base_url=server.base_url, ...)`.
+'''
+
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+MAX_GRAPHQL_PAGE_SIZE = 100
+MAX_SEARCH_RESULTS = 1000
+# the authenticated rate limit
+DEFAULT_RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW_SECONDS = 60 * 60
+PRIMARY_RATE_LIMIT_MESSAGE = "API rate limit exceeded for user ID 1."
+SECONDARY_RATE_LIMIT_MESSAGE = "You have exceeded a secondary rate limit. Please wait a few minutes before you try again."
+
+class MockRepo:
+    def __init__(self, name: str, stars_count: int, forks_count: int, pull_requests_count: int, issues_count: int = 0):
+        self.name = name
+        self.stars_count = stars_count
+        self.forks_count = forks_count
+        # open pull requests, to match the default state of the pulls endpoint
+        self.pull_requests_count = pull_requests_count
+        self.closed_pull_requests_count = 0
+        self.pull_requests_updated_at = "2023-10-01T00:00:00Z"
+        # open issues, not counting pull requests
+        self.issues_count = issues_count
+        self.updated_at = "2023-10-01T00:00:00Z"
+        self.pushed_at = "2023-10-01T00:00:00Z"
+
+    def update_pull_requests(self, pull_requests_count: int, closed_pull_requests_count: int, updated_at: str) -> None:
+        self.pull_requests_count = pull_requests_count
+        self.closed_pull_requests_count = closed_pull_requests_count
+        self.pull_requests_updated_at = updated_at
+
+def create_synthetic_organization(number_of_repos: int, seed: int = 0) -> list[MockRepo]:
+    # a long-tailed distribution so that there are a handful of popular repos and lots of ties at the bottom
+    rng = random.Random(seed)
+    return [
+        MockRepo(
+            name=f"repo-{i:05d}",
+            stars_count=int(rng.paretovariate(1.2)) - 1,
+            forks_count=int(rng.paretovariate(1.5)) - 1,
+            pull_requests_count=int(rng.paretovariate(1.5)) - 1,
+            issues_count=int(rng.paretovariate(1.2)) - 1,
+        )
+        for i in range(number_of_repos)
+    ]
+
+class MockGithubServer:
+    def __init__(self, repos_by_organization_name: dict[str, list[MockRepo]], latency_seconds: float = 0, rate_limit: int = DEFAULT_RATE_LIMIT, rate_limit_window_seconds: int = RATE_LIMIT_WINDOW_SECONDS):
+        self.repos_by_organization_name = {
+            organization_name: sorted(repos, key=lambda repo: repo.name)
+            for organization_name, repos in repos_by_organization_name.items()
+        }
+        self.latency_seconds = latency_seconds
+        self.request_count_by_endpoint = Counter()
+        # requests that were answered with a 304 because the client already had the latest version
+        self.not_modified_count_by_endpoint = Counter()
+        # set to simulate a search that timed out before finding every match
+        self.search_incomplete_results = False
+        # the names of repos whose pull requests we answer with a 403, e.g. to make a scan fail partway through
+        self.forbidden_repo_names = set()
+        # like Github, we keep a separate rate limit budget per token and resource (e.g. core vs graphql)
+        self.rate_limit = rate_limit
+        self.rate_limit_window_seconds = rate_limit_window_seconds
+        self.rate_limited_count = 0
+        self._rate_limit_used_by_bucket = Counter()
+        self._rate_limit_reset_time_by_bucket = {}
+        # tokens that we answer with a 401, e.g. because they've been revoked
+        self.revoked_tokens = set()
+        self.request_count_by_token = Counter()
+        # the Retry-After (or None) for each of the upcoming requests that should hit a secondary rate limit
+        self._pending_secondary_rate_limits = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _create_handler_class(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        (host, port) = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.request_count_by_endpoint.values())
+
+    # with `tokens`, requests are spread across them like the tool does with several PATs
+    def create_client(self, token: str | None = "token", tokens: list[str] | None = None, **kwargs) -> Github:
+        # like the tool's own client, this one is safe to share between fetch workers and doesn't throttle requests
+        install_thread_safe_connection_classes(tokens)
+        if tokens:
+            token = tokens[0]
+        return Github(
+            base_url=self.base_url,
+            auth=Auth.Token(token) if token is not None else None,
+            seconds_between_requests=None,
+            seconds_between_writes=None,
+            retry=create_server_error_retry(),
+            **kwargs,
+        )
+
+    def record_request(self, endpoint: str, token: str | None = None) -> None:
+        with self._lock:
+            self.request_count_by_endpoint[endpoint] += 1
+            self.request_count_by_token[token] += 1
+
+    def record_not_modified(self, endpoint: str) -> None:
+        with self._lock:
+            self.not_modified_count_by_endpoint[endpoint] += 1
+
+    def trigger_secondary_rate_limit(self, request_count: int, retry_after_seconds: int | None = None) -> None:
+        # the next `request_count` requests will be rejected with a secondary rate limit error
+        with self._lock:
+            self._pending_secondary_rate_limits.extend([retry_after_seconds] * request_count)
+
+    def _get_rate_limit_reset_time(self, bucket: tuple[str | None, str]) -> int:
+        now = time.time()
+        reset_time = self._rate_limit_reset_time_by_bucket.get(bucket)
+        if reset_time is None or reset_time <= now:
+            reset_time = int(now) + self.rate_limit_window_seconds
+            self._rate_limit_reset_time_by_bucket[bucket] = reset_time
+            self._rate_limit_used_by_bucket[bucket] = 0
+        return reset_time
+
+    # returns the message and headers to reject the request with if it's over a rate limit, or None otherwise
+    def check_rate_limit(self, resource: str, token: str | None = None) -> tuple[str, dict[str, str]] | None:
+        with self._lock:
+            if len(self._pending_secondary_rate_limits) > 0:
+                self.rate_limited_count += 1
+                retry_after_seconds = self._pending_secondary_rate_limits.pop(0)
+                return (SECONDARY_RATE_LIMIT_MESSAGE, {"Retry-After": str(retry_after_seconds)} if retry_after_seconds is not None else {})
+            self._get_rate_limit_reset_time((token, resource))
+            if self._rate_limit_used_by_bucket[(token, resource)] >= self.rate_limit:
+                self.rate_limited_count += 1
+                return (PRIMARY_RATE_LIMIT_MESSAGE, {})
+            return None
+
+    def spend_rate_limit(self, resource: str, token: str | None = None) -> None:
+        with self._lock:
+            self._get_rate_limit_reset_time((token, resource))
+            self._rate_limit_used_by_bucket[(token, resource)] += 1
+
+    def get_rate_limit_headers(self, resource: str, token: str | None = None) -> dict[str, str]:
+        with self._lock:
+            reset_time = self._get_rate_limit_reset_time((token, resource))
+            used = self._rate_limit_used_by_bucket[(token, resource)]
+            return {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(max(self.rate_limit - used, 0)),
+                "X-RateLimit-Reset": str(reset_time),
+                "X-RateLimit-Used": str(used),
+                "X-RateLimit-Resource": resource,
+            }
+
+    def start(self) -> "MockGithubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "MockGithubServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+def _create_handler_class(server: MockGithubServer) -> type[BaseHTTPRequestHandler]:
+    class MockGithubRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # we send the headers and body in separate writes, which otherwise stalls keep-alive connections on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            time.sleep(server.latency_seconds)
+
+            if match := re.fullmatch(r"/orgs/([^/]+)", url.path):
+                self._handle("organization", "core", lambda: self._handle_get_organization(match.group(1)))
+            elif match := re.fullmatch(r"/orgs/([^/]+)/repos", url.path):
+                self._handle("repos", "core", lambda: self._handle_get_repos(match.group(1), url.path, query))
+            elif match := re.fullmatch(r"/repos/([^/]+)/([^/]+)/pulls", url.path):
+                self._handle("pulls", "core", lambda: self._handle_get_pulls(match.group(1), match.group(2), url.path, query))
+            elif match := re.fullmatch(r"/repos/([^/]+)/([^/]+)/stargazers", url.path):
+                self._handle("stargazers", "core", lambda: self._handle_get_stargazers(match.group(1), match.group(2), url.path, query))
+            elif match := re.fullmatch(r"/repos/([^/]+)/([^/]+)/forks", url.path):
+                self._handle("forks", "core", lambda: self._handle_get_forks(match.group(1), match.group(2), url.path, query))
+            elif url.path == "/search/repositories":
+                self._handle("search", "search", lambda: self._handle_search_repositories(url.path, query))
+            else:
+                self._handle("unknown", "core", lambda: self._send_json(404, {"message": "Not Found"}))
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(server.latency_seconds)
+
+            if url.path == "/graphql":
+                self._handle("graphql", "graphql", lambda: self._handle_graphql(json.loads(body)))
+            else:
+                self._handle("unknown", "core", lambda: self._send_json(404, {"message": "Not Found"}))
+
+        def _handle(self, endpoint: str, resource: str, handler) -> None:
+            self._endpoint = endpoint
+            self._resource = resource
+            # pygithub sends "token <PAT>"
+            authorization = self.headers.get("Authorization")
+            self._token = authorization.split(" ")[-1] if authorization is not None else None
+            server.record_request(endpoint, self._token)
+            if self._token in server.revoked_tokens:
+                self._send_response(401, json.dumps({"message": "Bad credentials"}).encode("utf-8"), {})
+                return
+            rate_limit_error = server.check_rate_limit(resource, self._token)
+            if rate_limit_error is not None:
+                (message, headers) = rate_limit_error
+                self._send_response(403, json.dumps({"message": message}).encode("utf-8"), headers)
+            else:
+                handler()
+
+        def _send_json(self, status: int, data, headers: dict[str, str] | None = None) -> None:
+            body = json.dumps(data).encode("utf-8")
+            headers = dict(headers or {})
+            if self.command == "GET" and status == 200:
+                # like Github, we validate GETs by a hash of the response body
+                etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+                headers["ETag"] = etag
+                if self.headers.get("If-None-Match") == etag:
+                    # 304s don't count against the rate limit
+                    server.record_not_modified(self._endpoint)
+                    self._send_response(304, b"", {"ETag": etag})
+                    return
+            server.spend_rate_limit(self._resource, self._token)
+            self._send_response(status, body, headers)
+
+        def _send_response(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+            headers = {**headers, **server.get_rate_limit_headers(self._resource, self._token)}
+            self.send_response(status)
+            if len(body) > 0:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        # `items` can be anything that supports len and slicing, and `to_json` (if any) is only applied to the items on
+        # the requested page, so that large orgs don't cost O(repos) per page
+        def _send_page(self, items, path: str, query: dict[str, str], wrap_items=None, to_json=None) -> None:
+            per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+            page = int(query.get("page", 1))
+            last_page = max((len(items) + per_page - 1) // per_page, 1)
+            headers = {}
+            if last_page > 1:
+                links = []
+                if page < last_page:
+                    links.append(f'<{server.base_url}{path}?{urlencode({**query, "page": page + 1})}>; rel="next"')
+                    links.append(f'<{server.base_url}{path}?{urlencode({**query, "page": last_page})}>; rel="last"')
+                if page > 1:
+                    links.append(f'<{server.base_url}{path}?{urlencode({**query, "page": page - 1})}>; rel="prev"')
+                    links.append(f'<{server.base_url}{path}?{urlencode({**query, "page": 1})}>; rel="first"')
+                headers["Link"] = ", ".join(links)
+            page_items = items[(page - 1) * per_page:page * per_page]
+            if to_json is not None:
+                page_items = [to_json(item) for item in page_items]
+            self._send_json(200, wrap_items(page_items) if wrap_items is not None else page_items, headers)
+
+        def _get_repo_json(self, organization_name: str, repo: MockRepo) -> dict:
+            full_name = f"{organization_name}/{repo.name}"
+            return {
+                "name": repo.name,
+                "full_name": full_name,
+                "url": f"{server.base_url}/repos/{full_name}",
+                "stargazers_count": repo.stars_count,
+                "forks_count": repo.forks_count,
+                # like Github, this counts open pull requests as issues too
+                "open_issues_count": repo.issues_count + repo.pull_requests_count,
+                "updated_at": repo.updated_at,
+                "pushed_at": repo.pushed_at,
+            }
+
+        def _find_repo(self, organization_name: str, repo_name: str) -> MockRepo | None:
+            for repo in server.repos_by_organization_name.get(organization_name, []):
+                if repo.name == repo_name:
+                    return repo
+            return None
+
+        def _handle_get_organization(self, organization_name: str) -> None:
+            if organization_name not in server.repos_by_organization_name:
+                self._send_json(404, {"message": "Not Found"})
+                return
+            self._send_json(200, {
+                "login": organization_name,
+                "url": f"{server.base_url}/orgs/{organization_name}",
+                "public_repos": len(server.repos_by_organization_name[organization_name]),
+            })
+
+        def _handle_get_repos(self, organization_name: str, path: str, query: dict[str, str]) -> None:
+            if organization_name not in server.repos_by_organization_name:
+                self._send_json(404, {"message": "Not Found"})
+                return
+            repos = server.repos_by_organization_name[organization_name]
+            self._send_page(repos, path, query, to_json=lambda repo: self._get_repo_json(organization_name, repo))
+
+        def _handle_get_pulls(self, organization_name: str, repo_name: str, path: str, query: dict[str, str]) -> None:
+            repo = self._find_repo(organization_name, repo_name)
+            if repo is None:
+                self._send_json(404, {"message": "Not Found"})
+                return
+            if repo_name in server.forbidden_repo_names:
+                self._send_json(403, {"message": "Resource not accessible by integration"})
+                return
+            if query.get("state") == "all":
+                # we only model the most recently updated PR, which is all the tool looks at when asking for every state
+                pull_requests_count = repo.pull_requests_count + repo.closed_pull_requests_count
+                pulls = [{"number": i + 1, "updated_at": repo.pull_requests_updated_at} for i in range(pull_requests_count)]
+            else:
+                pulls = [{"number": i + 1, "state": "open"} for i in range(repo.pull_requests_count)]
+            self._send_page(pulls, path, query)
+
+        # the tool reads the stars and forks counts off of the listing, but pygithub's `get_stargazers()` and
+        # `get_forks()` page through these, so benchmarks can compare against counting them per repo
+        def _handle_get_stargazers(self, organization_name: str, repo_name: str, path: str, query: dict[str, str]) -> None:
+            repo = self._find_repo(organization_name, repo_name)
+            if repo is None:
+                self._send_json(404, {"message": "Not Found"})
+                return
+            self._send_page(range(repo.stars_count), path, query, to_json=lambda i: {"login": f"stargazer-{i}", "id": i + 1})
+
+        def _handle_get_forks(self, organization_name: str, repo_name: str, path: str, query: dict[str, str]) -> None:
+            repo = self._find_repo(organization_name, repo_name)
+            if repo is None:
+                self._send_json(404, {"message": "Not Found"})
+                return
+            self._send_page(range(repo.forks_count), path, query, to_json=lambda i: {
+                "name": repo_name,
+                "full_name": f"forker-{i}/{repo_name}",
+                "url": f"{server.base_url}/repos/forker-{i}/{repo_name}",
+            })
+
+        def _handle_search_repositories(self, path: str, query: dict[str, str]) -> None:
+            # we only support the qualifiers the tool uses
+            qualifiers = dict(term.split(":", 1) for term in query.get("q", "").split() if ":" in term)
+            organization_name = qualifiers.get("org")
+            if organization_name not in server.repos_by_organization_name:
+                self._send_json(422, {
+                    "message": "Validation Failed",
+                    "errors": [{"message": "The listed users and repositories cannot be searched either because the resources do not exist or you do not have permission to view them.", "code": "invalid"}],
+                })
+                return
+
+            repos = server.repos_by_organization_name[organization_name]
+            count_by_sort = {"stars": lambda repo: repo.stars_count, "forks": lambda repo: repo.forks_count}
+            if "sort" in query:
+                # Github doesn't promise any order for ties, so we order them backwards by name to make sure the tool
+                # doesn't rely on it
+                repos = sorted(repos, key=lambda repo: (count_by_sort[query["sort"]](repo), repo.name), reverse=query.get("order", "desc") == "desc")
+            items = [self._get_repo_json(organization_name, repo) for repo in repos]
+            self._send_page(items[:MAX_SEARCH_RESULTS], path, query, lambda page_items: {
+                "total_count": len(items),
+                "incomplete_results": server.search_incomplete_results,
+                "items": page_items,
+            })
+
+        def _handle_graphql(self, body: dict) -> None:
+            if "Authorization" not in self.headers:
+                self._send_json(401, {"message": "This endpoint requires you to be authenticated."})
+                return
+
+            variables = body.get("variables", {})
+            organization_name = variables["organization"]
+            if organization_name not in server.repos_by_organization_name:
+                self._send_json(200, {
+                    "data": {"organization": None},
+                    "errors": [{"type": "NOT_FOUND", "message": f"Could not resolve to an Organization with the login of '{organization_name}'."}],
+                })
+                return
+
+            repos = server.repos_by_organization_name[organization_name]
+            page_size = min(variables.get("pageSize", MAX_GRAPHQL_PAGE_SIZE), MAX_GRAPHQL_PAGE_SIZE)
+            # the cursor is just the index of the next repo, which is good enough for a stand-in
+            start = int(variables["after"]) if variables.get("after") else 0
+            end = min(start + page_size, len(repos))
+            self._send_json(200, {"data": {"organization": {"repositories": {
+                "pageInfo": {"hasNextPage": end < len(repos), "endCursor": str(end)},
+                "nodes": [
+                    {
+                        "name": repo.name,
+                        "nameWithOwner": f"{organization_name}/{repo.name}",
+                        "stargazerCount": repo.stars_count,
+                        "forkCount": repo.forks_count,
+                        "updatedAt": repo.updated_at,
+                        "pushedAt": repo.pushed_at,
+                        "pullRequests": {"totalCount": repo.pull_requests_count},
+                    }
+                    for repo in repos[start:end]
+                ],
+            }}}})
+
+    return MockGithubRequestHandler
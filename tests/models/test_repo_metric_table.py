@@ -0,0 +1,55 @@
+import heapq
+import unittest
+
+from models.criteria import Criteria
+from models.metric import METRICS_BY_CRITERIA
+from models.repo_data import RepoData
+from models.repo_metric_table import RepoMetricTable
+from models.repo_record import RepoRecord
+from tests.helpers import create_repo_record
+from tests.mock_github_server import create_synthetic_organization
+from utilities.repo_utilities import RepoWithValue
+
+def create_table(repos: list[RepoRecord], pull_requests_counts: list[int | None] | None = None) -> RepoMetricTable:
+    return RepoMetricTable(repos, (repo.stargazers_count for repo in repos), (repo.forks_count for repo in repos), pull_requests_counts)
+
+class TestRepoMetricTable(unittest.TestCase):
+    def test_get_top_n_matches_ranking_with_repo_with_value(self):
+        # the synthetic org has lots of ties, which have to be broken by name just like RepoWithValue does
+        mock_repos = create_synthetic_organization(500)
+        repos = [create_repo_record("org", repo.name, repo.stars_count, repo.forks_count) for repo in mock_repos]
+        table = create_table(repos, [repo.pull_requests_count for repo in mock_repos])
+
+        for criteria in METRICS_BY_CRITERIA:
+            for n in [1, 10, 600]:
+                repos_with_value = [
+                    RepoWithValue(RepoData(repo.stars_count, repo.forks_count, repo.pull_requests_count).get_data_for_criteria(criteria), repo_record)
+                    for (repo, repo_record) in zip(mock_repos, repos)
+                ]
+                expected = [(repo_with_value.value, repo_with_value.repo) for repo_with_value in heapq.nlargest(n, repos_with_value)]
+                self.assertEqual(table.get_top_n(n, criteria), expected)
+
+    def test_get_top_n_leaves_out_repos_without_a_pull_requests_count(self):
+        repos = [create_repo_record("org", "a", forks_count=1), create_repo_record("org", "b", stargazers_count=5), create_repo_record("org", "c")]
+        table = create_table(repos, [4, None, 1])
+
+        self.assertEqual(table.get_top_n(3, Criteria.PULL_REQUESTS), [(4, repos[0]), (1, repos[2])])
+        self.assertEqual(table.get_top_n(3, Criteria.CONTRIBUTION_PERCENTAGE), [(200.0, repos[0]), (100.0, repos[2])])
+        # the listing counts are there for every repo
+        self.assertEqual(table.get_top_n(1, Criteria.STARS), [(5, repos[1])])
+
+        table.set_pull_requests_count(1, 3)
+        self.assertEqual(table.get_top_n(3, Criteria.PULL_REQUESTS), [(4, repos[0]), (3, repos[1]), (1, repos[2])])
+
+    def test_get_top_n_by_growth(self):
+        repos = [create_repo_record("org", "a"), create_repo_record("org", "b"), create_repo_record("org", "c")]
+        table = RepoMetricTable(repos, [0, 0, 0], [0, 0, 0], growths_by_criteria={Criteria.STARS_GROWTH: [-2, 5, None]})
+
+        self.assertEqual(table.get_top_n(3, Criteria.STARS_GROWTH), [(5, repos[1]), (-2, repos[0])])
+        with self.assertRaises(ValueError):
+            table.get_top_n(3, Criteria.FORKS_GROWTH)
+
+    def test_get_top_n_with_no_repos(self):
+        table = create_table([])
+        for criteria in METRICS_BY_CRITERIA:
+            self.assertEqual(table.get_top_n(5, criteria), [])
@@ -0,0 +1,426 @@
+from contextlib import redirect_stderr, redirect_stdout
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from github_organization_repo_explorer import NOT_CACHED_ERROR_MESSAGE, NO_SNAPSHOTS_ERROR_MESSAGE, main, parse_args
+from models.metric import Metric
+from tests.helpers import create_repo_record, use_temporary_cache_directory
+from tests.mock_github_server import MockGithubServer, MockRepo
+from utilities import cache_utilities
+from utilities.cache_utilities import DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, GithubDataCache, get_github_data_cache
+
+MOCK_REPOS = [
+    MockRepo("MostForks", stars_count=0, forks_count=3, pull_requests_count=0),
+    MockRepo("MostStars", stars_count=1, forks_count=0, pull_requests_count=1),
+    MockRepo("MostPullRequests", stars_count=0, forks_count=1, pull_requests_count=3),
+    MockRepo("HighestContributionPercentage", stars_count=0, forks_count=0, pull_requests_count=2),
+]
+
+class TestGithubOrganizationRepoExplorer(unittest.TestCase):
+    def setUp(self):
+        use_temporary_cache_directory(self)
+        self.server = MockGithubServer({"Amy-Testing": MOCK_REPOS}).start()
+        self.addCleanup(self.server.stop)
+        patcher = patch("github_organization_repo_explorer._get_github_client", lambda concurrency: self.server.create_client(pool_size=concurrency))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_main(self, argv: list[str]) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(parse_args(argv))
+        return output.getvalue()
+
+    def test_main_prints_top_repos(self):
+        output = self.run_main(["Amy-Testing", "-n", "2", "-c", "contribution_percentage"])
+        self.assertIn("Top 2 repos in Amy-Testing based on contribution_percentage:\n\t- HighestContributionPercentage (200.0%)\n\t- MostPullRequests (150.0%)\n", output)
+
+    def test_main_makes_no_requests_with_a_warm_cache(self):
+        self.run_main(["Amy-Testing", "-c", "pull_requests"])
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"], 2 * len(MOCK_REPOS))
+
+        request_count = self.server.request_count
+        # nor do they create a client (which would import pygithub and ask for a PAT)
+        with patch("github_organization_repo_explorer._get_github_client") as get_github_client_mock:
+            for criteria in ["stars", "forks", "pull_requests", "contribution_percentage"]:
+                self.run_main(["Amy-Testing", "-c", criteria])
+        self.assertEqual(self.server.request_count, request_count)
+        get_github_client_mock.assert_not_called()
+
+    def test_importing_does_not_import_the_heavy_dependencies(self):
+        # in a fresh interpreter, since the tests have already imported them
+        output = subprocess.run(
+            [sys.executable, "-c", "import sys, github_organization_repo_explorer; print(sorted(name for name in ['github', 'requests', 'dotenv'] if name in sys.modules))"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(output, "[]\n")
+
+    @patch("time.time")
+    def test_main_revalidates_an_expired_cache(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-c", "pull_requests"])
+
+        # the cold run already picked up validators for the pull requests, so even the first time the cache expires,
+        # it's one 304 for the repo listing and one per repo for the pull requests
+        for _ in range(2):
+            time_mock.return_value += max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+            request_count = self.server.request_count
+            not_modified_count = sum(self.server.not_modified_count_by_endpoint.values())
+            output = self.run_main(["Amy-Testing", "-c", "pull_requests"])
+            self.assertEqual(self.server.request_count - request_count, 1 + len(MOCK_REPOS))
+            self.assertEqual(sum(self.server.not_modified_count_by_endpoint.values()) - not_modified_count, 1 + len(MOCK_REPOS))
+            self.assertIn("\t- MostPullRequests (3 pull requests)\n\t- HighestContributionPercentage (2 pull requests)\n", output)
+
+    @patch("time.time")
+    def test_main_only_refetches_metrics_past_their_time_to_live(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-c", "pull_requests", "--cache-ttl", "pull_requests=1"])
+
+        time_mock.return_value += 2 * 60
+        request_count_by_endpoint = dict(self.server.request_count_by_endpoint)
+        output = self.run_main(["Amy-Testing", "-c", "pull_requests", "--cache-ttl", "pull_requests=1"])
+        # the listing is still fresh, so only the pull requests counts are checked again
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], request_count_by_endpoint["repos"])
+        self.assertGreater(self.server.request_count_by_endpoint["pulls"], request_count_by_endpoint["pulls"])
+        self.assertEqual(output.count("Revalidating data for"), len(MOCK_REPOS))
+        self.assertIn("\t- MostPullRequests (3 pull requests)\n", output)
+
+    @patch("time.time")
+    def test_main_only_checks_changed_repos_with_incremental(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-c", "pull_requests"])
+
+        time_mock.return_value += max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+        pushed_repo = MockRepo("MostForks", stars_count=0, forks_count=3, pull_requests_count=5)
+        pushed_repo.pushed_at = "2023-10-22T00:00:00Z"
+        self.server.repos_by_organization_name["Amy-Testing"] = [pushed_repo] + MOCK_REPOS[1:]
+        pulls_request_count = self.server.request_count_by_endpoint["pulls"]
+        output = self.run_main(["Amy-Testing", "-c", "pull_requests", "--incremental"])
+
+        # one listing pass, and only the repo that was pushed to is checked again (which costs 2 requests, since its
+        # pull requests have changed)
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"] - pulls_request_count, 2)
+        self.assertIn("Revalidating data for MostForks", output)
+        self.assertIn(f"Reusing cached data for {len(MOCK_REPOS) - 1} repo(s)", output)
+        self.assertIn("\t- MostForks (5 pull requests)\n\t- MostPullRequests (3 pull requests)\n", output)
+
+    @patch("time.time")
+    def test_main_revalidates_a_fresh_listing_with_incremental_once_the_pull_requests_have_expired(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-c", "pull_requests"])
+
+        # the pull requests counts have expired, but the listing is still fresh, so it has the timestamps from the
+        # first run
+        time_mock.return_value += DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.PULL_REQUESTS] + 60
+        self.assertLess(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.PULL_REQUESTS] + 60, DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.STARS])
+        pushed_repo = MockRepo("MostForks", stars_count=0, forks_count=3, pull_requests_count=5)
+        pushed_repo.pushed_at = "2023-10-22T00:00:00Z"
+        self.server.repos_by_organization_name["Amy-Testing"] = [pushed_repo] + MOCK_REPOS[1:]
+        request_count_by_endpoint = dict(self.server.request_count_by_endpoint)
+        output = self.run_main(["Amy-Testing", "-c", "pull_requests", "--incremental"])
+
+        # so the listing is revalidated to pick up the push, and only the repo that was pushed to is checked again
+        self.assertEqual(self.server.request_count_by_endpoint["repos"] - request_count_by_endpoint["repos"], 1)
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"] - request_count_by_endpoint["pulls"], 2)
+        self.assertIn("Revalidating data for MostForks", output)
+        self.assertIn(f"Reusing cached data for {len(MOCK_REPOS) - 1} repo(s)", output)
+        self.assertIn("\t- MostForks (5 pull requests)\n\t- MostPullRequests (3 pull requests)\n", output)
+
+        # once the listing has been checked within the pull requests TTL, it isn't revalidated again
+        request_count = self.server.request_count
+        self.run_main(["Amy-Testing", "-c", "pull_requests", "--incremental"])
+        self.assertEqual(self.server.request_count, request_count)
+
+    @patch("time.time")
+    def test_main_answers_from_stale_data_then_refreshes_with_stale_ok(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-n", "2", "-c", "pull_requests"])
+
+        time_mock.return_value += max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+        self.server.repos_by_organization_name["Amy-Testing"] = [MockRepo("MostForks", stars_count=0, forks_count=3, pull_requests_count=5)] + MOCK_REPOS[1:]
+        output = self.run_main(["Amy-Testing", "-n", "2", "-c", "pull_requests", "--stale-ok", "--show-changes"])
+
+        # the stale answer comes first, then the refreshed one without the progress output in between
+        self.assertIn("Top 2 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n\t- HighestContributionPercentage (2 pull requests)\n\nRefreshing the stale cached data for Amy-Testing...\n", output)
+        self.assertNotIn("Gathering the repos", output)
+        self.assertIn("Top 2 repos in Amy-Testing based on pull_requests after refreshing:\n\t- MostForks (5 pull requests) [new]\n\t- MostPullRequests (3 pull requests) [was #1]\n\tNo longer in the top 2: HighestContributionPercentage\n", output)
+
+        # the refresh was saved to the cache
+        request_count = self.server.request_count
+        output = self.run_main(["Amy-Testing", "-n", "2", "-c", "pull_requests", "--stale-ok"])
+        self.assertEqual(self.server.request_count, request_count)
+        self.assertNotIn("Refreshing", output)
+        self.assertIn("\t- MostForks (5 pull requests)\n\t- MostPullRequests (3 pull requests)\n", output)
+
+    @patch("time.time")
+    def test_main_refreshes_a_stale_listing_with_stale_ok_when_ranking_by_stars(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-n", "1", "-c", "stars", "--full-scan"])
+
+        time_mock.return_value += DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.STARS] + 60 * 60
+        self.server.repos_by_organization_name["Amy-Testing"] = [MockRepo("MostForks", stars_count=10, forks_count=3, pull_requests_count=0)] + MOCK_REPOS[1:]
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "stars", "--stale-ok"])
+        self.assertIn("Refreshing the stale cached data for Amy-Testing", output)
+
+        # the refresh revalidated the listing rather than searching, so the next run answers from it
+        with redirect_stdout(io.StringIO()), get_github_data_cache() as cache:
+            self.assertEqual(cache.try_get_repos_checked_time_for_org("Amy-Testing"), time_mock.return_value)
+        request_count = self.server.request_count
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "stars", "--stale-ok"])
+        self.assertEqual(self.server.request_count, request_count)
+        self.assertNotIn("Refreshing", output)
+        self.assertIn("Top 1 repos in Amy-Testing based on stars:\n\t- MostForks (10 stars)\n", output)
+
+    @patch("time.time")
+    def test_main_ignores_data_past_the_max_stale_age_with_stale_ok(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        output = self.run_main(["Amy-Testing", "-n", "2", "-c", "pull_requests", "--stale-ok"])
+        self.assertIn("Gathering the repos for Amy-Testing", output)
+
+        time_mock.return_value += 2 * 60 * 60
+        output = self.run_main(["Amy-Testing", "-n", "2", "-c", "pull_requests", "--stale-ok", "--max-stale-age", "60"])
+        self.assertIn("Gathering the repos for Amy-Testing", output)
+        self.assertNotIn("Refreshing", output)
+        self.assertIn("\t- MostPullRequests (3 pull requests)\n\t- HighestContributionPercentage (2 pull requests)\n", output)
+
+    @patch("time.time")
+    def test_main_ranks_by_growth_from_earlier_scans(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        self.run_main(["Amy-Testing", "-c", "pull_requests"])
+
+        time_mock.return_value += 2 * 24 * 60 * 60
+        (most_forks, most_stars) = (MockRepo("MostForks", stars_count=4, forks_count=3, pull_requests_count=0), MockRepo("MostStars", stars_count=2, forks_count=0, pull_requests_count=1))
+        self.server.repos_by_organization_name["Amy-Testing"] = [most_forks, most_stars] + MOCK_REPOS[2:]
+        self.run_main(["Amy-Testing", "-c", "pull_requests"])
+
+        request_count = self.server.request_count
+        output = self.run_main(["Amy-Testing", "-n", "2", "-c", "stars_growth"])
+        self.assertEqual(self.server.request_count, request_count)
+        self.assertIn("The history for Amy-Testing only goes back 2.0 day(s)", output)
+        self.assertIn("Top 2 repos in Amy-Testing based on stars_growth:\n\t- MostForks (+4 stars)\n\t- MostStars (+1 star)\n", output)
+
+    @patch("time.time")
+    def test_main_only_records_growth_from_scans_of_every_repo(self, time_mock):
+        # more repos than fit on a page of search results, with C at the bottom
+        fillers = [MockRepo(f"r{index:03}", stars_count=5, forks_count=0, pull_requests_count=0) for index in range(150)]
+        self.server.repos_by_organization_name["Amy-Testing"] = [MockRepo("A", stars_count=10, forks_count=0, pull_requests_count=0), MockRepo("C", stars_count=1, forks_count=0, pull_requests_count=0)] + fillers
+        time_mock.return_value = 1697943670.6
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "stars"])
+        self.assertIn("with Github search", output)
+        # the search above only saw the top of the org, so this hour's snapshot is still due
+        self.run_main(["Amy-Testing", "-n", "1", "-c", "pull_requests"])
+
+        time_mock.return_value += 2 * 24 * 60 * 60
+        self.server.repos_by_organization_name["Amy-Testing"][1] = MockRepo("C", stars_count=301, forks_count=0, pull_requests_count=0)
+        self.run_main(["Amy-Testing", "-n", "1", "-c", "pull_requests"])
+
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "stars_growth"])
+        self.assertIn("Top 1 repos in Amy-Testing based on stars_growth:\n\t- C (+300 stars)\n", output)
+
+    def test_main_exits_when_there_is_no_history_to_rank_by_growth(self):
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit):
+            main(parse_args(["Amy-Testing", "-c", "pull_requests_growth"]))
+        self.assertIn(NO_SNAPSHOTS_ERROR_MESSAGE, output.getvalue())
+        self.assertEqual(self.server.request_count, 0)
+
+    def test_main_exports_every_repo(self):
+        with tempfile.TemporaryDirectory() as directory:
+            export_path = os.path.join(directory, "repos.jsonl")
+            output = self.run_main(["Amy-Testing", "-n", "1", "-c", "pull_requests", "--export", export_path])
+            with open(export_path) as export_file:
+                rows = [json.loads(line) for line in export_file]
+
+        # search only finds the top candidates, so every repo comes from the listing
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 1)
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"], 2 * len(MOCK_REPOS))
+        self.assertCountEqual([(row["name"], row["pull_requests_count"], row["contribution_percentage"]) for row in rows], [
+            ("MostForks", 0, 0.0),
+            ("MostStars", 1, 100.0),
+            ("MostPullRequests", 3, 150.0),
+            ("HighestContributionPercentage", 2, 200.0),
+        ])
+        self.assertIn("Top 1 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n", output)
+        self.assertIn(f"Exported {len(MOCK_REPOS)} repo(s) to {export_path}", output)
+
+    def test_main_exports_from_the_cache_without_requests(self):
+        # this only caches the listing
+        self.run_main(["Amy-Testing", "-c", "forks", "--full-scan"])
+
+        request_count = self.server.request_count
+        with tempfile.TemporaryDirectory() as directory, patch("github_organization_repo_explorer._get_github_client") as get_github_client_mock:
+            export_path = os.path.join(directory, "repos.csv")
+            output = self.run_main(["Amy-Testing", "-n", "2", "-c", "forks", "--export", export_path, "--from-cache"])
+            with open(export_path, newline="") as export_file:
+                rows = list(csv.DictReader(export_file))
+        self.assertEqual(self.server.request_count, request_count)
+        get_github_client_mock.assert_not_called()
+
+        # we don't have any pull requests counts, so they're left blank
+        self.assertCountEqual([(row["name"], row["forks_count"], row["pull_requests_count"]) for row in rows], [(repo.name, str(repo.forks_count), "") for repo in MOCK_REPOS])
+        self.assertIn("Top 2 repos in Amy-Testing based on forks:\n\t- MostForks (3 forks)\n\t- MostPullRequests (1 fork)\n", output)
+
+    def test_main_exits_when_exporting_an_uncached_org_from_the_cache(self):
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory, redirect_stdout(output), self.assertRaises(SystemExit):
+            main(parse_args(["Amy-Testing", "-c", "stars", "--export", os.path.join(directory, "repos.jsonl"), "--from-cache"]))
+        self.assertIn(NOT_CACHED_ERROR_MESSAGE, output.getvalue())
+        self.assertIn("Exported 0 repo(s)", output.getvalue())
+        self.assertEqual(self.server.request_count, 0)
+
+    def test_main_replays_a_recorded_run_without_a_network(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recording_path = os.path.join(directory, "recording.sqlite3")
+            output = self.run_main(["Amy-Testing", "-n", "2", "-c", "contribution_percentage", "--record", recording_path])
+            self.assertIn(f"Recorded {self.server.request_count} request(s)", output)
+            self.server.stop()
+
+            with patch("utilities.authentication_utilities.get_personal_access_tokens") as get_personal_access_tokens_mock:
+                replay_output = self.run_main(["Amy-Testing", "-n", "2", "-c", "contribution_percentage", "--replay", recording_path])
+            get_personal_access_tokens_mock.assert_not_called()
+
+        self.assertIn("Top 2 repos in Amy-Testing based on contribution_percentage:\n\t- HighestContributionPercentage (200.0%)\n\t- MostPullRequests (150.0%)\n", replay_output)
+        self.assertIn(f"Replayed {2 * len(MOCK_REPOS) + 1} request(s)", replay_output)
+        # neither run used the cache on disk
+        self.assertFalse(os.path.exists(cache_utilities.CACHE_FILE))
+
+    def test_main_ranks_each_org_and_across_orgs(self):
+        self.server.repos_by_organization_name["Other-Org"] = [
+            MockRepo("Busy", stars_count=0, forks_count=0, pull_requests_count=4),
+            MockRepo("Quiet", stars_count=0, forks_count=0, pull_requests_count=0),
+        ]
+        output = self.run_main(["Amy-Testing", "Other-Org", "-n", "2", "-c", "pull_requests", "--cross-org"])
+
+        self.assertIn("Top 2 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n\t- HighestContributionPercentage (2 pull requests)\n", output)
+        self.assertIn("Top 2 repos in Other-Org based on pull_requests:\n\t- Busy (4 pull requests)\n\t- Quiet (0 pull requests)\n", output)
+        self.assertIn("Top 2 repos across 2 orgs based on pull_requests:\n\t- Other-Org/Busy (4 pull requests)\n\t- Amy-Testing/MostPullRequests (3 pull requests)\n", output)
+
+    def test_main_breaks_ties_across_orgs_by_full_name(self):
+        self.server.repos_by_organization_name["A-Org"] = [MockRepo("Docs", stars_count=0, forks_count=0, pull_requests_count=5)]
+        self.server.repos_by_organization_name["B-Org"] = [MockRepo("Docs", stars_count=0, forks_count=0, pull_requests_count=5)]
+        expected = "Top 2 repos across 2 orgs based on pull_requests:\n\t- A-Org/Docs (5 pull requests)\n\t- B-Org/Docs (5 pull requests)\n"
+        # the same order no matter which org comes first
+        self.assertIn(expected, self.run_main(["B-Org", "A-Org", "-n", "2", "-c", "pull_requests", "--cross-org"]))
+        self.assertIn(expected, self.run_main(["A-Org", "B-Org", "-n", "2", "-c", "pull_requests", "--cross-org"]))
+
+    def test_main_reads_orgs_from_a_file(self):
+        self.server.repos_by_organization_name["Other-Org"] = [MockRepo("Busy", stars_count=0, forks_count=0, pull_requests_count=4)]
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as organizations_file:
+            organizations_file.write("# orgs to compare\nOther-Org\n\nAmy-Testing  # again\n")
+            organizations_file.flush()
+            output = self.run_main(["Amy-Testing", "--orgs-file", organizations_file.name, "-n", "1", "-c", "forks", "--full-scan"])
+
+        self.assertEqual(output.count("Gathering the repos for Amy-Testing"), 1)
+        self.assertIn("Top 1 repos in Other-Org based on forks:\n\t- Busy (0 forks)\n", output)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 2)
+
+    def test_main_keeps_going_after_an_org_errors_out(self):
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit):
+            main(parse_args(["Missing-Org", "Amy-Testing", "-n", "1", "-c", "pull_requests"]))
+        self.assertIn("Skipped Missing-Org because of the error above", output.getvalue())
+        self.assertIn("Top 1 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n", output.getvalue())
+
+        # the other orgs' results were still saved to the cache
+        request_count = self.server.request_count
+        self.run_main(["Amy-Testing", "-n", "1", "-c", "pull_requests"])
+        self.assertEqual(self.server.request_count, request_count)
+
+    def test_main_writes_a_profile(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as profile_file:
+            output = self.run_main(["Amy-Testing", "-c", "pull_requests", "--profile", profile_file.name])
+            profile = json.load(open(profile_file.name))
+
+        self.assertIn("Profile: ", output)
+        self.assertIn(f"{2 * len(MOCK_REPOS) + 1} request(s)", output)
+        self.assertEqual(profile["requests"]["by_endpoint"]["/repos/{owner}/{repo}/pulls"]["count"], 2 * len(MOCK_REPOS))
+        self.assertEqual(profile["cache"]["pull_requests"]["miss"], len(MOCK_REPOS))
+        self.assertIn("fetch", profile["phases"])
+
+    def test_main_picks_up_where_a_failed_run_left_off(self):
+        self.server.forbidden_repo_names.add("MostPullRequests")
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit):
+            main(parse_args(["Amy-Testing", "-n", "10", "-c", "pull_requests", "--concurrency", "1"]))
+        self.assertIn("Saved the data fetched so far", output.getvalue())
+        pulls_request_count = self.server.request_count_by_endpoint["pulls"]
+
+        # only the repos that hadn't been fetched yet are fetched on the next run
+        self.server.forbidden_repo_names.clear()
+        output = self.run_main(["Amy-Testing", "-n", "10", "-c", "pull_requests"])
+        self.assertIn("\t- MostPullRequests (3 pull requests)\n", output)
+        # each fetch is 2 requests, and the forbidden repo's first one failed
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"] - pulls_request_count, 2 * len(MOCK_REPOS) - (pulls_request_count - 1))
+
+    def test_main_waits_for_another_run_fetching_the_same_repo(self):
+        # another run has already claimed MostPullRequests, and finishes fetching it shortly after we start
+        other_run_claimed = threading.Event()
+        def run_other_run():
+            other_cache = GithubDataCache(cache_utilities.CACHE_FILE)
+            repo = create_repo_record("Amy-Testing", "MostPullRequests")
+            other_cache.try_claim_fetch(repo, Metric.PULL_REQUESTS)
+            other_run_claimed.set()
+            time.sleep(0.2)
+            other_cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 3)
+            other_cache.release_fetch(repo, Metric.PULL_REQUESTS)
+            other_cache.close()
+        with redirect_stdout(io.StringIO()), get_github_data_cache():
+            pass
+        other_run = threading.Thread(target=run_other_run)
+        other_run.start()
+        other_run_claimed.wait()
+
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "pull_requests"])
+        other_run.join()
+        self.assertIn("Waiting for another run that's fetching data for 1 repo(s)", output)
+        self.assertIn("Top 1 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n", output)
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"], 2 * (len(MOCK_REPOS) - 1))
+
+    def test_parse_args_requires_an_org(self):
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            parse_args(["-c", "stars"])
+
+    def test_parse_args_rejects_invalid_cache_ttls(self):
+        self.assertEqual(parse_args(["Amy-Testing", "-c", "stars", "--cache-ttl", "stars=0", "--cache-ttl", "forks=30"]).cache_ttls, [(Metric.STARS, 0), (Metric.FORKS, 30)])
+        for cache_ttl in ["stars", "watchers=10", "stars=-1", "stars=ten"]:
+            with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                parse_args(["Amy-Testing", "-c", "stars", "--cache-ttl", cache_ttl])
+
+    def test_parse_args_rejects_invalid_export_args(self):
+        for argv in [["--export", "repos.jsonl", "-c", "stars_growth"], ["--export", "repos.jsonl", "-c", "stars", "--stale-ok"], ["-c", "stars", "--from-cache"]]:
+            with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                parse_args(["Amy-Testing"] + argv)
+
+    def test_parse_args_rejects_invalid_record_and_replay_args(self):
+        for argv in [["--record", "a.sqlite3", "--replay", "b.sqlite3"], ["--replay-latency"]]:
+            with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                parse_args(["Amy-Testing", "-c", "stars"] + argv)
+
+    def test_main_ranks_by_stars_with_search(self):
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "stars"])
+        self.assertIn("Top 1 repos in Amy-Testing based on stars:\n\t- MostStars (1 star)\n", output)
+        self.assertEqual(self.server.request_count_by_endpoint["search"], 1)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 0)
+
+    def test_main_falls_back_to_listing_when_search_is_incomplete(self):
+        self.server.search_incomplete_results = True
+        output = self.run_main(["Amy-Testing", "-n", "1", "-c", "forks"])
+        self.assertIn("Top 1 repos in Amy-Testing based on forks:\n\t- MostForks (3 forks)\n", output)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 1)
+
+    def test_main_skips_search_with_full_scan(self):
+        self.run_main(["Amy-Testing", "-c", "stars", "--full-scan"])
+        self.assertEqual(self.server.request_count_by_endpoint["search"], 0)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 1)
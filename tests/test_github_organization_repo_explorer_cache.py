@@ -0,0 +1,54 @@
+from contextlib import redirect_stdout
+import io
+import unittest
+from unittest.mock import patch
+
+import github_organization_repo_explorer as explorer
+from github_organization_repo_explorer_cache import NO_CACHE_MESSAGE, main, parse_args
+from tests.helpers import use_temporary_cache_directory
+from tests.mock_github_server import MockGithubServer, MockRepo
+
+MOCK_REPOS = [
+    MockRepo("MostStars", stars_count=1, forks_count=0, pull_requests_count=1),
+    MockRepo("MostPullRequests", stars_count=0, forks_count=1, pull_requests_count=3),
+]
+
+class TestGithubOrganizationRepoExplorerCache(unittest.TestCase):
+    def setUp(self):
+        use_temporary_cache_directory(self)
+        self.server = MockGithubServer({"Amy-Testing": MOCK_REPOS, "Other-Org": MOCK_REPOS}).start()
+        self.addCleanup(self.server.stop)
+        patcher = patch("github_organization_repo_explorer._get_github_client", lambda concurrency: self.server.create_client(pool_size=concurrency))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, argv: list[str]) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(parse_args(argv))
+        return output.getvalue()
+
+    def run_explorer(self, argv: list[str]) -> None:
+        with redirect_stdout(io.StringIO()):
+            explorer.main(explorer.parse_args(argv))
+
+    def test_stats(self):
+        self.assertEqual(self.run_command(["stats"]), f"{NO_CACHE_MESSAGE}\n")
+
+        self.run_explorer(["Amy-Testing", "-c", "pull_requests"])
+        self.run_explorer(["Amy-Testing", "-c", "pull_requests"])
+        output = self.run_command(["stats"])
+        self.assertIn("\t\t- 1 org listing(s) with 2 repo(s)\n\t\t- stars: 0 (0 stale)\n\t\t- forks: 0 (0 stale)\n\t\t- pull_requests: 2 (0 stale)\n", output)
+        self.assertIn("\t- organization_repos: 50.0% (1 hit(s), 1 miss(es), 0 stale)\n\t- pull_requests: 50.0% (2 hit(s), 2 miss(es), 0 stale)\n", output)
+
+    def test_compact(self):
+        self.run_explorer(["Amy-Testing", "-c", "pull_requests"])
+        self.run_explorer(["Other-Org", "-c", "pull_requests"])
+
+        output = self.run_command(["compact", "--cache-max-entries", "4"])
+        self.assertIn("Removed 4 entries.", output)
+        # the org that was used least recently was evicted
+        self.assertIn("\t\t- 1 org listing(s) with 2 repo(s)\n", self.run_command(["stats"]))
+        request_count = self.server.request_count
+        self.run_explorer(["Other-Org", "-c", "pull_requests"])
+        self.assertEqual(self.server.request_count, request_count)
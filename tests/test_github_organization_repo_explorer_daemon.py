@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from github_organization_repo_explorer_daemon import ExplorerDaemon
+from tests.helpers import use_temporary_cache_directory
+from tests.mock_github_server import MockGithubServer, MockRepo
+from utilities.cache_utilities import get_github_data_cache
+from utilities.daemon_utilities import DaemonServer, is_daemon_running, try_run_with_daemon
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_REPOS = [
+    MockRepo("MostStars", stars_count=1, forks_count=0, pull_requests_count=1),
+    MockRepo("MostPullRequests", stars_count=0, forks_count=1, pull_requests_count=3),
+]
+
+class TestGithubOrganizationRepoExplorerDaemon(unittest.TestCase):
+    def setUp(self):
+        cache_directory = use_temporary_cache_directory(self)
+        self.socket_path = os.path.join(cache_directory, "daemon.sock")
+        self.server = MockGithubServer({"Amy-Testing": MOCK_REPOS}).start()
+        self.addCleanup(self.server.stop)
+
+        # the cache can only be used from the thread that opened it, so the daemon opens it on its own thread like it
+        # would in its own process
+        github_client = self.server.create_client()
+        daemon_servers = []
+        daemon_started = threading.Event()
+        def run_daemon():
+            with get_github_data_cache() as cache, DaemonServer(ExplorerDaemon(github_client, cache).answer_query, self.socket_path) as daemon_server:
+                daemon_servers.append(daemon_server)
+                daemon_started.set()
+                daemon_server.serve_forever()
+        thread = threading.Thread(target=run_daemon)
+        thread.start()
+        self.assertTrue(daemon_started.wait(timeout=10))
+        self.addCleanup(thread.join)
+        self.addCleanup(daemon_servers[0].shutdown)
+
+    def run_client(self, argv: list[str]) -> subprocess.CompletedProcess:
+        # the client runs in its own process, like it would from the command line, since the daemon redirects this
+        # process' stdout while it answers a query
+        client_code = f"import sys; from utilities.daemon_utilities import try_run_with_daemon; sys.exit(try_run_with_daemon(sys.argv[1:], {self.socket_path!r}))"
+        return subprocess.run([sys.executable, "-c", client_code, *argv], cwd=ROOT_DIRECTORY, capture_output=True, text=True, timeout=30)
+
+    def test_daemon_answers_queries_from_its_warm_cache(self):
+        result = self.run_client(["Amy-Testing", "-n", "1", "-c", "pull_requests"])
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("Top 1 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n", result.stdout)
+
+        request_count = self.server.request_count
+        result = self.run_client(["Amy-Testing", "-n", "1", "-c", "pull_requests"])
+        self.assertIn("Top 1 repos in Amy-Testing based on pull_requests:\n\t- MostPullRequests (3 pull requests)\n", result.stdout)
+        self.assertEqual(self.server.request_count, request_count)
+
+    def test_daemon_passes_back_errors_and_exit_codes(self):
+        result = self.run_client(["Amy-Testing", "-c", "watchers"])
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("invalid choice: 'watchers'", result.stderr)
+
+        result = self.run_client(["Missing-Org", "-c", "pull_requests"])
+        self.assertEqual(result.returncode, 1)
+
+        # the daemon keeps answering queries after one fails
+        result = self.run_client(["Amy-Testing", "-n", "1", "-c", "stars", "--full-scan"])
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("\t- MostStars (1 star)\n", result.stdout)
+
+    def test_no_daemon_running(self):
+        self.assertTrue(is_daemon_running(self.socket_path))
+        missing_socket_path = os.path.join(os.path.dirname(self.socket_path), "missing.sock")
+        self.assertFalse(is_daemon_running(missing_socket_path))
+        self.assertIsNone(try_run_with_daemon(["Amy-Testing", "-c", "stars"], missing_socket_path))
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import patch
 
-from utilities.authentication_utilities import get_personal_access_token, PERSONAL_ACCESS_TOKEN_KEY
+from utilities.authentication_utilities import get_personal_access_token, get_personal_access_tokens, PERSONAL_ACCESS_TOKEN_KEY, PERSONAL_ACCESS_TOKENS_KEY
 
 class TestAuthenticationUtilities(unittest.TestCase):
     @patch("utilities.authentication_utilities.get_key")
@@ -29,4 +29,18 @@ class TestAuthenticationUtilities(unittest.TestCase):
         mock_get_key.return_value = None
         mock_prompt_for_personal_access_token.return_value = None
         self.assertEqual(get_personal_access_token(), None)
-        mock_set_key.assert_not_called()
\ No newline at end of file
+        mock_set_key.assert_not_called()
+
+    @patch("utilities.authentication_utilities.dotenv_values")
+    @patch("utilities.authentication_utilities.get_personal_access_token")
+    def test_get_personal_access_tokens(self, mock_get_personal_access_token, mock_dotenv_values):
+        mock_dotenv_values.return_value = {PERSONAL_ACCESS_TOKENS_KEY: "abc, def,,abc", PERSONAL_ACCESS_TOKEN_KEY: "ghi"}
+        self.assertEqual(get_personal_access_tokens(), ["abc", "def", "ghi"])
+        mock_get_personal_access_token.assert_not_called()
+
+        # without a pool, we fall back to the single token, prompting for it if need be
+        mock_dotenv_values.return_value = {}
+        mock_get_personal_access_token.return_value = "ghi"
+        self.assertEqual(get_personal_access_tokens(), ["ghi"])
+        mock_get_personal_access_token.return_value = None
+        self.assertEqual(get_personal_access_tokens(), [])
@@ -1,10 +1,20 @@
+from contextlib import redirect_stdout
+import io
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
 import unittest
-from unittest.mock import patch, mock_open
-import pickle 
+from unittest.mock import patch
 
+from models.metric import Metric
 from models.repo_data import RepoData
-from tests.helpers import create_mock_repository, assertRepoDataIsEqual
-from utilities.cache_utilities import GithubDataCache, get_github_data_cache, CACHE_DIRECTORY
+from models.repo_listing_page import RepoListingPage
+from models.validators import Validators
+from tests.helpers import create_mock_repository, create_repo_record, assertRepoDataIsEqual, use_temporary_cache_directory
+from utilities.cache_utilities import CHECKPOINT_INTERVAL_SECONDS, CHECKPOINT_INTERVAL_WRITES, DEFAULT_MAX_CACHE_BYTES, DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, MAX_CACHE_ENTRY_AGE_SECONDS, MAX_INCREMENTAL_REFRESH_AGE_SECONDS, GithubDataCache, get_github_data_cache, PICKLE_CACHE_VERSION
+from utilities.profiling_utilities import start_profiler
 
 class TestGithubDataCache(unittest.TestCase):
     def test_get_repos_for_org_with_no_data(self):
@@ -14,7 +24,7 @@ class TestGithubDataCache(unittest.TestCase):
     def test_update_repos_for_org(self):
         cache = GithubDataCache()
         organization_name = "cool-org"
-        repos = [create_mock_repository(organization_name, "RepoA"), create_mock_repository(organization_name, "AnotherRepo1")]
+        repos = [create_repo_record(organization_name, "RepoA", stargazers_count=3), create_repo_record(organization_name, "AnotherRepo1", forks_count=2)]
         
         cache.update_repos_for_org(organization_name, repos)
         self.assertCountEqual(cache.try_get_repos_for_org(organization_name), repos)
@@ -24,7 +34,7 @@ class TestGithubDataCache(unittest.TestCase):
         time_mock.return_value = 1697943670.604693
         cache = GithubDataCache()
         organization_name = "hello"
-        repos = [create_mock_repository(organization_name, "there")]
+        repos = [create_repo_record(organization_name, "there")]
 
         cache.update_repos_for_org(organization_name, repos)
         time_mock.return_value = 1697943670.604693 + 500
@@ -35,14 +45,29 @@ class TestGithubDataCache(unittest.TestCase):
         time_mock.return_value = 1234.3210
         cache = GithubDataCache()
         organization_name = "cool-cats"
-        repos = [create_mock_repository(organization_name, "123")]
+        repos = [create_repo_record(organization_name, "123")]
 
         cache.update_repos_for_org(organization_name, repos)
         self.assertCountEqual(cache.try_get_repos_for_org(organization_name), repos)
 
-        time_mock.return_value = 1234.3210 + 3700 # todo don't ahrdcode this
+        time_mock.return_value = 1234.3210 + DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.STARS] + 1
         self.assertEqual(cache.try_get_repos_for_org(organization_name), None)
 
+    @patch("time.time")
+    def test_get_repos_for_org_uses_the_time_to_live_of_the_metrics_we_need(self, time_mock):
+        time_mock.return_value = 1234.3210
+        cache = GithubDataCache(time_to_live_seconds_by_metric={Metric.STARS: 60, Metric.FORKS: 600})
+        organization_name = "cool-cats"
+        repos = [create_repo_record(organization_name, "123")]
+        cache.update_repos_for_org(organization_name, repos)
+
+        time_mock.return_value = 1234.3210 + 300
+        self.assertEqual(cache.try_get_repos_for_org(organization_name, frozenset({Metric.STARS})), None)
+        self.assertCountEqual(cache.try_get_repos_for_org(organization_name, frozenset({Metric.FORKS})), repos)
+        self.assertCountEqual(cache.try_get_repos_for_org(organization_name, frozenset({Metric.PULL_REQUESTS, Metric.FORKS})), repos)
+        # we still need the listing to know which repos there are, so it can't be older than any of its counts
+        self.assertEqual(cache.try_get_repos_for_org(organization_name, frozenset({Metric.PULL_REQUESTS})), None)
+
     def test_get_data_for_repo_with_no_data(self):
         cache = GithubDataCache()
         mock_repo = create_mock_repository("org", "repo-name")
@@ -85,73 +110,380 @@ class TestGithubDataCache(unittest.TestCase):
 
         time_mock.return_value = starting_time + 5000
         self.assertEqual(cache.try_get_data_for_repo(mock_repo), None)
-    
-    @patch("os.path.exists")
-    def test_get_github_data_cache_loads_existing_data(self, mock_exists):
-        mock_exists.return_value = True
+
+    @patch("time.time")
+    def test_get_metric_and_validators_for_repo_with_stale_data(self, time_mock):
         cache = GithubDataCache()
         mock_repo = create_mock_repository("org", "repo-name2")
-        repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
-        cache.update_data_for_repo(mock_repo, repo_data)
-        pickled_cache = pickle.dumps(cache)
 
-        with patch("builtins.open", mock_open(read_data=pickled_cache)):
-            with get_github_data_cache(refresh=False) as loaded_cache:
-                assertRepoDataIsEqual(loaded_cache.try_get_data_for_repo(mock_repo), repo_data)
+        starting_time = 1697944486.3507898
+        time_mock.return_value = starting_time
+        cache.update_metric_for_repo(mock_repo, Metric.PULL_REQUESTS, 13, Validators(etag='W/"abc"', last_modified=None))
+
+        time_mock.return_value = starting_time + 5000
+        self.assertEqual(cache.try_get_metric_for_repo(mock_repo, Metric.PULL_REQUESTS), None)
+        (stale_count, validators) = cache.try_get_metric_and_validators_for_repo(mock_repo, Metric.PULL_REQUESTS)
+        self.assertEqual(stale_count, 13)
+        self.assertEqual(validators.get_conditional_request_headers(), {"If-None-Match": 'W/"abc"'})
+
+    @patch("time.time")
+    def test_get_stale_ok_data_up_to_the_max_age(self, time_mock):
+        cache = GithubDataCache()
+        organization_name = "org"
+        mock_repo = create_repo_record(organization_name, "repo-name2")
+
+        starting_time = 1697944486.3507898
+        time_mock.return_value = starting_time
+        cache.update_repos_for_org(organization_name, [mock_repo])
+        cache.update_metric_for_repo(mock_repo, Metric.PULL_REQUESTS, 13)
+        self.assertEqual(cache.try_get_stale_ok_repos_for_org(organization_name, frozenset([Metric.PULL_REQUESTS]), 24 * 60 * 60), ([mock_repo], False))
+        self.assertEqual(cache.try_get_stale_ok_metric_for_repo(mock_repo, Metric.PULL_REQUESTS, 24 * 60 * 60), (13, False))
+
+        time_mock.return_value = starting_time + max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+        self.assertEqual(cache.try_get_stale_ok_repos_for_org(organization_name, frozenset([Metric.PULL_REQUESTS]), 24 * 60 * 60), ([mock_repo], True))
+        self.assertEqual(cache.try_get_stale_ok_metric_for_repo(mock_repo, Metric.PULL_REQUESTS, 24 * 60 * 60), (13, True))
+
+        time_mock.return_value = starting_time + 24 * 60 * 60 + 1
+        self.assertEqual(cache.try_get_stale_ok_repos_for_org(organization_name, frozenset([Metric.PULL_REQUESTS]), 24 * 60 * 60), None)
+        self.assertEqual(cache.try_get_stale_ok_metric_for_repo(mock_repo, Metric.PULL_REQUESTS, 24 * 60 * 60), None)
+
+    @patch("time.time")
+    def test_iterate_repos_with_metric_for_org(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        repos = [create_repo_record("cool-org", "RepoA", stargazers_count=3), create_repo_record("cool-org", "RepoB", forks_count=2)]
+        cache.update_repos_for_org("cool-org", repos)
+        cache.update_metric_for_repo(repos[1], Metric.PULL_REQUESTS, 5)
+        self.assertEqual(list(cache.iterate_repos_with_metric_for_org("random-org", Metric.PULL_REQUESTS)), [])
+        self.assertEqual(cache.try_get_repos_checked_time_for_org("random-org"), None)
+
+        # stale entries are still exported, in listing order
+        time_mock.return_value += MAX_CACHE_ENTRY_AGE_SECONDS
+        self.assertEqual(list(cache.iterate_repos_with_metric_for_org("cool-org", Metric.PULL_REQUESTS)), [(repos[0], None), (repos[1], 5)])
+        self.assertEqual(cache.try_get_repos_checked_time_for_org("cool-org"), 1697943670.6)
+
+    @patch("time.time")
+    def test_get_unchanged_metric_for_repo(self, time_mock):
+        cache = GithubDataCache()
+        repo = create_repo_record("org", "repo", updated_at="2023-10-01T00:00:00Z", pushed_at="2023-10-02T00:00:00Z")
+
+        starting_time = 1697944486.3507898
+        time_mock.return_value = starting_time
+        cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 13)
+
+        time_mock.return_value = starting_time + 5000
+        self.assertEqual(cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS), None)
+        self.assertEqual(cache.try_get_unchanged_metric_for_repo(repo, Metric.PULL_REQUESTS), 13)
+        self.assertEqual(cache.try_get_unchanged_metric_for_repo(create_repo_record("org", "repo", updated_at="2023-10-01T00:00:00Z", pushed_at="2023-10-03T00:00:00Z"), Metric.PULL_REQUESTS), None)
+        self.assertEqual(cache.try_get_unchanged_metric_for_repo(create_repo_record("org", "repo"), Metric.PULL_REQUESTS), None)
+
+        # past a certain age, we check the repo again even if it looks unchanged
+        time_mock.return_value = starting_time + MAX_INCREMENTAL_REFRESH_AGE_SECONDS + 1
+        self.assertEqual(cache.try_get_unchanged_metric_for_repo(repo, Metric.PULL_REQUESTS), None)
+
+    @patch("time.time")
+    def test_metrics_go_stale_independently(self, time_mock):
+        cache = GithubDataCache(time_to_live_seconds_by_metric={Metric.PULL_REQUESTS: 60})
+        mock_repo = create_mock_repository("org", "repo-name2")
+
+        starting_time = 1697944486.3507898
+        time_mock.return_value = starting_time
+        cache.update_data_for_repo(mock_repo, RepoData(stars_count=1, forks_count=2, pull_requests_count=3))
+
+        time_mock.return_value = starting_time + 120
+        self.assertEqual(cache.try_get_metric_for_repo(mock_repo, Metric.STARS), 1)
+        self.assertEqual(cache.try_get_metric_for_repo(mock_repo, Metric.FORKS), 2)
+        self.assertEqual(cache.try_get_metric_for_repo(mock_repo, Metric.PULL_REQUESTS), None)
+        self.assertEqual(cache.try_get_data_for_repo(mock_repo), None)
+
+        cache.update_metric_for_repo(mock_repo, Metric.PULL_REQUESTS, 4)
+        assertRepoDataIsEqual(cache.try_get_data_for_repo(mock_repo), RepoData(stars_count=1, forks_count=2, pull_requests_count=4))
+
+    @patch("time.time")
+    def test_get_repo_listing_pages_for_org_with_stale_data(self, time_mock):
+        time_mock.return_value = 1234.3210
+        cache = GithubDataCache()
+        organization_name = "cool-cats"
+        pages = [
+            RepoListingPage([create_repo_record(organization_name, "a"), create_repo_record(organization_name, "b")], Validators(etag='"1"', last_modified=None), has_next_page=True),
+            RepoListingPage([create_repo_record(organization_name, "c")], Validators(etag=None, last_modified="Wed, 21 Oct 2015 07:28:00 GMT"), has_next_page=False),
+        ]
+        cache.update_repo_listing_pages_for_org(organization_name, pages)
+        self.assertEqual(cache.try_get_repos_for_org(organization_name), pages[0].repos + pages[1].repos)
+
+        time_mock.return_value = 1234.3210 + DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.STARS] + 1
+        self.assertEqual(cache.try_get_repos_for_org(organization_name), None)
+        stale_pages = cache.try_get_repo_listing_pages_for_org(organization_name)
+        self.assertEqual([page.repos for page in stale_pages], [page.repos for page in pages])
+        self.assertEqual([page.has_next_page for page in stale_pages], [True, False])
+        self.assertEqual([page.validators.get_conditional_request_headers() for page in stale_pages], [{"If-None-Match": '"1"'}, {"If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"}])
+
+    @patch("time.time")
+    def test_compact_drops_entries_that_are_too_old(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        old_repo = create_repo_record("old-org", "old")
+        cache.update_repos_for_org("old-org", [old_repo])
+        cache.update_metric_for_repo(old_repo, Metric.PULL_REQUESTS, 1)
+
+        time_mock.return_value += MAX_CACHE_ENTRY_AGE_SECONDS + 1
+        new_repo = create_repo_record("new-org", "new")
+        cache.update_repos_for_org("new-org", [new_repo])
+        cache.update_metric_for_repo(new_repo, Metric.PULL_REQUESTS, 2)
+
+        self.assertEqual(cache.compact(), 2)
+        self.assertEqual(cache.try_get_repo_listing_pages_for_org("old-org"), None)
+        self.assertEqual(cache.try_get_metric_and_validators_for_repo(old_repo, Metric.PULL_REQUESTS), None)
+        self.assertEqual(cache.try_get_repos_for_org("new-org"), [new_repo])
+        self.assertEqual(cache.try_get_metric_for_repo(new_repo, Metric.PULL_REQUESTS), 2)
+
+    @patch("time.time")
+    def test_compact_evicts_the_least_recently_used_orgs(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache(max_entries=4)
+        repos_by_organization_name = {organization_name: create_repo_record(organization_name, "repo") for organization_name in ["a", "b", "c"]}
+        for (organization_name, repo) in repos_by_organization_name.items():
+            time_mock.return_value += 1
+            cache.update_repos_for_org(organization_name, [repo])
+            cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 1)
+        # using "a" makes "b" the least recently used
+        time_mock.return_value += 1
+        cache.try_get_repos_for_org("a")
+
+        time_mock.return_value += 1
+        cache.start_session()
+        self.assertEqual(cache.compact(), 2)
+        self.assertEqual(cache.get_organization_counts(), (2, 2))
+        self.assertEqual(cache.try_get_repos_for_org("b"), None)
+        self.assertEqual(cache.try_get_metric_and_validators_for_repo(repos_by_organization_name["b"], Metric.PULL_REQUESTS), None)
+        self.assertEqual(cache.get_entry_count(), 4)
+
+        # orgs used in the current session aren't evicted, even past the limits
+        cache.set_limits(max_entries=1, max_bytes=DEFAULT_MAX_CACHE_BYTES)
+        cache.try_get_repos_for_org("a")
+        cache.compact()
+        self.assertEqual(cache.get_organization_counts(), (1, 1))
+        self.assertEqual(cache.try_get_repos_for_org("a"), [repos_by_organization_name["a"]])
+
+    def test_add_lookup_counts(self):
+        cache = GithubDataCache()
+        cache.add_lookup_counts({"pull_requests": {"hit": 2, "miss": 1, "stale": 0}})
+        cache.add_lookup_counts({"pull_requests": {"hit": 1, "miss": 0, "stale": 3}, "organization_repos": {"hit": 0, "miss": 1, "stale": 0}})
+        self.assertEqual(cache.get_lookup_counts(), {"organization_repos": {"hit": 0, "miss": 1, "stale": 0}, "pull_requests": {"hit": 3, "miss": 1, "stale": 3}})
     
-    @patch("os.path.exists")
-    def test_get_github_data_cache_creates_new_cache_if_no_cached_data(self, mock_exists):
-        mock_exists.return_value = False
+class TestGetGithubDataCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_directory = use_temporary_cache_directory(self)
+        self.cache_file = os.path.join(self.cache_directory, "github_data.sqlite3")
+        self.pickle_cache_file = os.path.join(self.cache_directory, "github_data.pkl")
+
+    def get_committed_metric_count(self) -> int:
+        # another connection only sees what's been committed
+        connection = sqlite3.connect(self.cache_file)
+        metric_count = connection.execute("SELECT COUNT(*) FROM repo_metrics").fetchone()[0]
+        connection.close()
+        return metric_count
+
+    def test_get_github_data_cache_loads_existing_data(self):
+        mock_repo = create_mock_repository("org", "repo-name2")
+        repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
+        with get_github_data_cache(refresh=False) as cache:
+            cache.update_data_for_repo(mock_repo, repo_data)
+
+        with get_github_data_cache(refresh=False) as loaded_cache:
+            assertRepoDataIsEqual(loaded_cache.try_get_data_for_repo(mock_repo), repo_data)
+
+    def test_get_github_data_cache_creates_new_cache_if_no_cached_data(self):
         cache = GithubDataCache()
         mock_repo = create_mock_repository("org", "repo-name2")
         repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
         cache.update_data_for_repo(mock_repo, repo_data)
         with get_github_data_cache(refresh=False) as loaded_cache:
             self.assertEqual(loaded_cache.try_get_data_for_repo(mock_repo), None)
-    
-    @patch("os.path.exists")
-    def test_git_github_data_cache_creates_new_cache_if_refresh(self, mock_exists):
-        mock_exists.return_value = True
-        cache = GithubDataCache()
+
+    def test_git_github_data_cache_creates_new_cache_if_refresh(self):
         mock_repo = create_mock_repository("org", "repo-name2")
         repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
-        cache.update_data_for_repo(mock_repo, repo_data)
-        pickled_cache = pickle.dumps(cache)
+        with get_github_data_cache(refresh=False) as cache:
+            cache.update_data_for_repo(mock_repo, repo_data)
 
-        with patch("builtins.open", mock_open(read_data=pickled_cache)):
-            with get_github_data_cache(refresh=True) as loaded_cache:
-                self.assertEqual(loaded_cache.try_get_data_for_repo(mock_repo), None) 
-    
-    # _pickle.PicklingError: Can't pickle <class 'unittest.mock.MagicMock'>: it's not the same object as unittest.mock.MagicMock
-    # @patch("os.path.exists")
-    # @patch("utilities.cache_utilities.CACHE_VERSION")
-    # def test_get_github_data_cache_creates_new_cache_if_cache_version_has_changed(self, mock_cache_version, mock_exists):
-    #     mock_exists.return_value = True
-    #     mock_cache_version.return_value = 12
-
-    #     cache = GithubDataCache()
-    #     mock_repo = create_mock_repository("org", "repo-name2")
-    #     repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
-    #     cache.update_data_for_repo(mock_repo, repo_data)
-    #     pickled_cache = pickle.dumps(cache)
-
-    #     mock_cache_version.return_value = 13
-    #     with patch("builtins.open", mock_open(read_data=pickled_cache)):
-    #         with get_github_data_cache(refresh=False) as loaded_cache:
-    #             self.assertEqual(loaded_cache.try_get_data_for_repo(mock_repo), None) 
-    
-    @patch("os.path.exists")
-    @patch("os.makedirs")
-    @patch("pickle.dump")
-    def test_get_github_data_cache_stores_cache_data(self, mock_dump, mock_makedirs, mock_exists):
-        mock_exists.return_value = False
-
-        with patch("builtins.open", mock_open()):
-            with get_github_data_cache(refresh=True) as cache:
-                mock_repo = create_mock_repository("org", "repo-name2")
-                repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
+        with get_github_data_cache(refresh=True) as loaded_cache:
+            self.assertEqual(loaded_cache.try_get_data_for_repo(mock_repo), None)
+        with get_github_data_cache(refresh=False) as loaded_cache:
+            self.assertEqual(loaded_cache.try_get_data_for_repo(mock_repo), None)
+
+    def test_get_github_data_cache_creates_new_cache_if_cache_version_has_changed(self):
+        mock_repo = create_mock_repository("org", "repo-name2")
+        repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
+        with patch("utilities.cache_utilities.CACHE_VERSION", 12):
+            with get_github_data_cache(refresh=False) as cache:
                 cache.update_data_for_repo(mock_repo, repo_data)
-        mock_makedirs.assert_called_once_with(CACHE_DIRECTORY, exist_ok=True)
-        mock_dump.assert_called_once() # todo: try to make this more specific
+
+        with patch("utilities.cache_utilities.CACHE_VERSION", 13):
+            with get_github_data_cache(refresh=False) as loaded_cache:
+                self.assertEqual(loaded_cache.try_get_data_for_repo(mock_repo), None)
+
+    def test_get_github_data_cache_stores_cache_data(self):
+        with get_github_data_cache(refresh=True) as cache:
+            mock_repo = create_mock_repository("org", "repo-name2")
+            repo_data = RepoData(stars_count=0, forks_count=0, pull_requests_count=13)
+            cache.update_data_for_repo(mock_repo, repo_data)
+        self.assertTrue(os.path.exists(self.cache_file))
+
+        connection = sqlite3.connect(self.cache_file)
+        self.assertEqual(
+            connection.execute("SELECT metric, value FROM repo_metrics WHERE repo_full_name = 'org/repo-name2' ORDER BY metric").fetchall(),
+            [("forks", 0), ("pull_requests", 13), ("stars", 0)],
+        )
+        connection.close()
+
+    def test_get_github_data_cache_stores_cache_data_on_error(self):
+        mock_repo = create_mock_repository("org", "repo-name2")
+        for error in [ValueError, KeyboardInterrupt, SystemExit]:
+            with self.assertRaises(error), redirect_stdout(io.StringIO()) as output:
+                with get_github_data_cache(refresh=True) as cache:
+                    cache.update_data_for_repo(mock_repo, RepoData(stars_count=0, forks_count=0, pull_requests_count=13))
+                    raise error()
+            self.assertIn("Saved the data fetched so far", output.getvalue())
+
+            with redirect_stdout(io.StringIO()), get_github_data_cache(refresh=False) as loaded_cache:
+                assertRepoDataIsEqual(loaded_cache.try_get_data_for_repo(mock_repo), RepoData(stars_count=0, forks_count=0, pull_requests_count=13))
+
+    def test_get_github_data_cache_checkpoints_during_a_run(self):
+        repos = [create_repo_record("org", f"repo-{i}") for i in range(CHECKPOINT_INTERVAL_WRITES + 1)]
+        with get_github_data_cache(refresh=False) as cache:
+            for repo in repos:
+                cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 1)
+            self.assertEqual(self.get_committed_metric_count(), CHECKPOINT_INTERVAL_WRITES)
+
+    @patch("time.monotonic")
+    def test_get_github_data_cache_checkpoints_after_an_interval(self, monotonic_mock):
+        monotonic_mock.return_value = 100
+        with get_github_data_cache(refresh=False) as cache:
+            cache.update_metric_for_repo(create_repo_record("org", "repo-0"), Metric.PULL_REQUESTS, 1)
+            monotonic_mock.return_value += CHECKPOINT_INTERVAL_SECONDS
+            cache.update_metric_for_repo(create_repo_record("org", "repo-1"), Metric.PULL_REQUESTS, 1)
+            cache.update_metric_for_repo(create_repo_record("org", "repo-2"), Metric.PULL_REQUESTS, 1)
+            self.assertEqual(self.get_committed_metric_count(), 2)
+
+    @patch("time.time")
+    def test_get_github_data_cache_compacts_on_save_every_so_often(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        with get_github_data_cache(refresh=False) as cache:
+            cache.update_metric_for_repo(create_repo_record("org", "old"), Metric.PULL_REQUESTS, 1)
+            self.assertTrue(cache.is_due_for_compaction())
+
+        time_mock.return_value += MAX_CACHE_ENTRY_AGE_SECONDS + 1
+        with patch("utilities.cache_utilities.COMPACTION_INTERVAL_SECONDS", MAX_CACHE_ENTRY_AGE_SECONDS * 2), redirect_stdout(io.StringIO()):
+            with get_github_data_cache(refresh=False) as cache:
+                self.assertFalse(cache.is_due_for_compaction())
+        with redirect_stdout(io.StringIO()), get_github_data_cache(refresh=False) as cache:
+            self.assertTrue(cache.is_due_for_compaction())
+            self.assertEqual(cache.get_entry_count(), 1)
+        with redirect_stdout(io.StringIO()), get_github_data_cache(refresh=False) as cache:
+            self.assertEqual(cache.get_entry_count(), 0)
+
+    def test_get_github_data_cache_stores_lookup_counts(self):
+        start_profiler()
+        with get_github_data_cache(refresh=False) as cache:
+            cache.try_get_repos_for_org("org")
+        with redirect_stdout(io.StringIO()), get_github_data_cache(refresh=True) as cache:
+            self.assertEqual(cache.get_lookup_counts(), {"organization_repos": {"hit": 0, "miss": 1, "stale": 0}})
+
+    def test_fetch_claims_are_shared_between_runs(self):
+        repo = create_repo_record("org", "repo")
+        (cache, other_cache) = (GithubDataCache(self.cache_file), GithubDataCache(self.cache_file))
+        self.addCleanup(cache.close)
+        self.addCleanup(other_cache.close)
+
+        self.assertTrue(cache.try_claim_fetch(repo, Metric.PULL_REQUESTS))
+        self.assertFalse(other_cache.try_claim_fetch(repo, Metric.PULL_REQUESTS))
+        # other metrics and repos aren't claimed
+        self.assertTrue(other_cache.try_claim_fetch(repo, Metric.STARS))
+        self.assertTrue(other_cache.try_claim_fetch(create_repo_record("org", "other-repo"), Metric.PULL_REQUESTS))
+
+        cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 5)
+        cache.release_fetch(repo, Metric.PULL_REQUESTS)
+        self.assertEqual(other_cache.wait_for_fetch(repo, Metric.PULL_REQUESTS), 5)
+        self.assertTrue(other_cache.try_claim_fetch(repo, Metric.PULL_REQUESTS))
+
+    @patch("utilities.cache_utilities.FETCH_CLAIM_SECONDS", 0.1)
+    def test_fetch_claims_expire(self):
+        repo = create_repo_record("org", "repo")
+        (cache, other_cache) = (GithubDataCache(self.cache_file), GithubDataCache(self.cache_file))
+        self.addCleanup(cache.close)
+        self.addCleanup(other_cache.close)
+
+        self.assertTrue(cache.try_claim_fetch(repo, Metric.PULL_REQUESTS))
+        # the run that claimed it never finishes, so there's nothing to wait for
+        self.assertEqual(other_cache.wait_for_fetch(repo, Metric.PULL_REQUESTS), None)
+        self.assertTrue(other_cache.try_claim_fetch(repo, Metric.PULL_REQUESTS))
+
+    def test_get_github_data_cache_is_shared_between_processes(self):
+        # each process writes its own repos' metrics while the others are writing theirs
+        write_code = (
+            "import sys; from tests.helpers import create_repo_record; from models.metric import Metric; from utilities.cache_utilities import GithubDataCache\n"
+            "cache = GithubDataCache(sys.argv[1])\n"
+            "for i in range(300):\n"
+            "    cache.update_metric_for_repo(create_repo_record(sys.argv[2], f'repo-{i}'), Metric.PULL_REQUESTS, i)\n"
+            "    cache.commit()\n"
+            "cache.close()\n"
+        )
+        GithubDataCache(self.cache_file).close()
+        root_directory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        processes = [subprocess.Popen([sys.executable, "-c", write_code, self.cache_file, organization_name], cwd=root_directory) for organization_name in ["org-a", "org-b", "org-c"]]
+        self.assertEqual([process.wait(timeout=60) for process in processes], [0, 0, 0])
+
+        with redirect_stdout(io.StringIO()), get_github_data_cache(refresh=False) as cache:
+            self.assertEqual(cache.get_entry_count(), 900)
+            self.assertEqual(cache.try_get_metric_for_repo(create_repo_record("org-b", "repo-299"), Metric.PULL_REQUESTS), 299)
+
+    def test_get_github_data_cache_recovers_from_corrupted_cache_file(self):
+        with open(self.cache_file, "wb") as f:
+            f.write(b"not a database")
+
+        mock_repo = create_mock_repository("org", "repo-name2")
+        repo_data = RepoData(stars_count=3, forks_count=2, pull_requests_count=1)
+        with get_github_data_cache(refresh=False) as cache:
+            self.assertEqual(cache.try_get_data_for_repo(mock_repo), None)
+            cache.update_data_for_repo(mock_repo, repo_data)
+        with get_github_data_cache(refresh=False) as loaded_cache:
+            assertRepoDataIsEqual(loaded_cache.try_get_data_for_repo(mock_repo), repo_data)
+
+    @patch("time.time")
+    def test_get_github_data_cache_migrates_pickle_cache(self, time_mock):
+        time_mock.return_value = 1697944486.35
+        # this is how the old GithubDataCache and RepoData classes looked to pickle. RepoData didn't have __slots__ yet,
+        # so its attributes were pickled as a dict
+        LegacyGithubDataCache = type("GithubDataCache", (), {"__module__": "utilities.cache_utilities"})
+        LegacyRepoData = type("RepoData", (), {"__module__": "models.repo_data", "__init__": lambda self, **kwargs: self.__dict__.update(kwargs)})
+        pickled_cache = LegacyGithubDataCache()
+        pickled_cache.version = PICKLE_CACHE_VERSION
+        pickled_cache.repos_by_organization_name = {"org": "pretend this is a PaginatedList"}
+        pickled_cache.last_checked_time_by_organization_name = {"org": 1697944486.35 - 100}
+        pickled_cache.repo_data_by_repo_full_name = {
+            "org/fresh-repo": LegacyRepoData(stars_count=5, forks_count=6, pull_requests_count=7),
+            "org/stale-repo": LegacyRepoData(stars_count=1, forks_count=1, pull_requests_count=1),
+        }
+        pickled_cache.last_checked_time_by_repo_full_name = {
+            "org/fresh-repo": 1697944486.35 - 100,
+            "org/stale-repo": 1697944486.35 - 5000,
+        }
+        with open(self.pickle_cache_file, "wb") as f, patch("utilities.cache_utilities.GithubDataCache", LegacyGithubDataCache), patch("models.repo_data.RepoData", LegacyRepoData):
+            pickle.dump(pickled_cache, f)
+
+        with get_github_data_cache(refresh=False) as cache:
+            self.assertEqual(cache.try_get_repos_for_org("org"), None)
+            assertRepoDataIsEqual(cache.try_get_data_for_repo(create_mock_repository("org", "fresh-repo")), RepoData(stars_count=5, forks_count=6, pull_requests_count=7))
+            self.assertEqual(cache.try_get_data_for_repo(create_mock_repository("org", "stale-repo")), None)
+        self.assertFalse(os.path.exists(self.pickle_cache_file))
+
+    def test_get_github_data_cache_ignores_corrupted_pickle_cache(self):
+        with open(self.pickle_cache_file, "wb") as f:
+            f.write(b"not a pickle")
+
+        with get_github_data_cache(refresh=False) as cache:
+            self.assertEqual(cache.try_get_repos_for_org("org"), None)
+        self.assertFalse(os.path.exists(self.pickle_cache_file))
 
 # todo: consider tests with more than one org/one repo in the cache
\ No newline at end of file
@@ -0,0 +1,65 @@
+import csv
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+from models.repo_data import RepoData
+from tests.helpers import create_repo_record
+from utilities.export_utilities import CSV_FORMAT, JSONL_FORMAT, PARQUET_FORMAT, RepoDataExporter, get_export_format, open_exporter
+
+REPOS_WITH_DATA = [
+    (create_repo_record("org", "Counted"), RepoData(stars_count=3, forks_count=1, pull_requests_count=4)),
+    # e.g. exported from the cache before we had its pull requests count
+    (create_repo_record("org", "Uncounted"), RepoData(stars_count=0, forks_count=2, pull_requests_count=None)),
+]
+
+class TestExportUtilities(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = temporary_directory.name
+
+    def export(self, file_name: str, export_format: str | None = None) -> str:
+        path = os.path.join(self.directory, file_name)
+        with open_exporter(path, export_format) as exporter:
+            for (repo, repo_data) in REPOS_WITH_DATA:
+                exporter.write("org", repo, repo_data)
+        self.assertEqual(exporter.row_count, len(REPOS_WITH_DATA))
+        return path
+
+    def test_get_export_format(self):
+        self.assertEqual(get_export_format("repos.csv"), CSV_FORMAT)
+        self.assertEqual(get_export_format("repos.PARQUET"), PARQUET_FORMAT)
+        self.assertEqual(get_export_format("repos.ndjson"), JSONL_FORMAT)
+        self.assertEqual(get_export_format("repos"), JSONL_FORMAT)
+
+    def test_exporter_without_close_cannot_be_created(self):
+        class _UnclosableExporter(RepoDataExporter):
+            def _write_row(self, row: dict) -> None:
+                pass
+
+        with self.assertRaises(TypeError):
+            _UnclosableExporter(os.path.join(self.directory, "repos.jsonl"))
+
+    def test_export_to_jsonl(self):
+        with open(self.export("repos.jsonl")) as export_file:
+            rows = [json.loads(line) for line in export_file]
+        self.assertEqual(rows, [
+            {"organization_name": "org", "name": "Counted", "full_name": "org/Counted", "stars_count": 3, "forks_count": 1, "pull_requests_count": 4, "contribution_percentage": 200.0},
+            {"organization_name": "org", "name": "Uncounted", "full_name": "org/Uncounted", "stars_count": 0, "forks_count": 2, "pull_requests_count": None, "contribution_percentage": None},
+        ])
+
+    def test_export_to_csv(self):
+        # the format given wins over the extension
+        with open(self.export("repos.txt", CSV_FORMAT), newline="") as export_file:
+            rows = list(csv.DictReader(export_file))
+        self.assertEqual([(row["name"], row["pull_requests_count"], row["contribution_percentage"]) for row in rows], [("Counted", "4", "200.0"), ("Uncounted", "", "")])
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow") is not None, "pyarrow isn't installed")
+    def test_export_to_parquet(self):
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(self.export("repos.parquet"))
+        self.assertEqual(table.column("name").to_pylist(), ["Counted", "Uncounted"])
+        self.assertEqual(table.column("pull_requests_count").to_pylist(), [4, None])
@@ -0,0 +1,117 @@
+import unittest
+from unittest.mock import patch
+
+from models.criteria import Criteria
+from tests.helpers import create_repo_record
+from tests.mock_github_server import MockGithubServer, MockRepo, create_synthetic_organization
+from utilities.cache_utilities import GithubDataCache, DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC
+from utilities.github_utilities import get_repos, get_pull_requests_count, try_get_top_repo_candidates_from_search
+from utilities.repo_utilities import get_top_repos_by_criteria
+
+class TestGithubUtilities(unittest.TestCase):
+    def setUp(self):
+        self.repos = create_synthetic_organization(250)
+        self.server = MockGithubServer({"org": self.repos}).start()
+        self.addCleanup(self.server.stop)
+        self.github = self.server.create_client()
+
+    def test_get_repos_pages_through_the_listing(self):
+        repo_records = get_repos(self.github, "org", GithubDataCache())
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 3)
+        self.assertEqual([(repo.full_name, repo.stargazers_count, repo.forks_count) for repo in repo_records], [(f"org/{repo.name}", repo.stars_count, repo.forks_count) for repo in self.repos])
+
+    def test_get_repos_uses_fresh_cached_listing(self):
+        cache = GithubDataCache()
+        repo_records = get_repos(self.github, "org", cache)
+        self.assertEqual(get_repos(self.github, "org", cache), repo_records)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 3)
+
+    @patch("time.time")
+    def test_get_repos_revalidates_stale_cached_listing(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        repo_records = get_repos(self.github, "org", cache)
+
+        time_mock.return_value = 1697943670.6 + max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+        self.assertEqual(get_repos(self.github, "org", cache), repo_records)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 6)
+        self.assertEqual(self.server.not_modified_count_by_endpoint["repos"], 3)
+
+        # revalidating counts as checking, so the listing is fresh again
+        self.assertEqual(get_repos(self.github, "org", cache), repo_records)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 6)
+
+    @patch("time.time")
+    def test_get_repos_refetches_changed_pages_of_stale_cached_listing(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        get_repos(self.github, "org", cache)
+
+        self.repos[150].stars_count += 10
+        time_mock.return_value = 1697943670.6 + max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+        repo_records = get_repos(self.github, "org", cache)
+        self.assertEqual(self.server.not_modified_count_by_endpoint["repos"], 2)
+        self.assertEqual(repo_records[150].stargazers_count, self.repos[150].stars_count)
+
+    def test_get_pull_requests_count_revalidates_cached_count(self):
+        repo = MockRepo("repo", stars_count=0, forks_count=0, pull_requests_count=3)
+        self.server.repos_by_organization_name["org"].append(repo)
+        repo_record = create_repo_record("org", "repo")
+
+        # there's nothing to revalidate the first time around, but we pick up the validators for next time
+        (count, validators) = get_pull_requests_count(self.github, repo_record)
+        self.assertEqual(count, 3)
+        self.assertIsNotNone(validators)
+        self.assertEqual(self.server.request_count_by_endpoint["pulls"], 2)
+
+        # so the first revalidation is already a single 304
+        for not_modified_count in [1, 2]:
+            request_count = self.server.request_count_by_endpoint["pulls"]
+            (count, validators) = get_pull_requests_count(self.github, repo_record, count, validators)
+            self.assertEqual(count, 3)
+            self.assertEqual(self.server.request_count_by_endpoint["pulls"], request_count + 1)
+            self.assertEqual(self.server.not_modified_count_by_endpoint["pulls"], not_modified_count)
+
+        # closing a PR changes the count even though the first open PR stays the same
+        repo.update_pull_requests(pull_requests_count=2, closed_pull_requests_count=1, updated_at="2023-10-02T00:00:00Z")
+        (count, validators) = get_pull_requests_count(self.github, repo_record, count, validators)
+        self.assertEqual(count, 2)
+
+    def test_try_get_top_repo_candidates_from_search_reads_only_the_first_page(self):
+        candidates = try_get_top_repo_candidates_from_search(self.github, "org", 5, Criteria.STARS)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(self.server.request_count_by_endpoint["repos"], 0)
+
+        top_repos = get_top_repos_by_criteria(candidates, 5, Criteria.STARS, GithubDataCache())
+        expected_top_repos = get_top_repos_by_criteria(get_repos(self.github, "org", GithubDataCache()), 5, Criteria.STARS, GithubDataCache())
+        self.assertEqual([(repo.name, repo.value) for repo in top_repos], [(repo.name, repo.value) for repo in expected_top_repos])
+
+    def test_try_get_top_repo_candidates_from_search_keeps_reading_until_past_ties(self):
+        # the top 3 are clear, but the 4th and 5th places tie with 150 other repos that span two pages of results
+        repos = [MockRepo(f"repo-{i:03d}", stars_count=0, forks_count=100 - i if i < 3 else 1, pull_requests_count=0) for i in range(153)]
+        repos += [MockRepo(f"small-{i:03d}", stars_count=0, forks_count=0, pull_requests_count=0) for i in range(100)]
+        self.server.repos_by_organization_name["tied-org"] = repos
+
+        candidates = try_get_top_repo_candidates_from_search(self.github, "tied-org", 5, Criteria.FORKS)
+        self.assertEqual(self.server.request_count_by_endpoint["search"], 2)
+        top_repos = get_top_repos_by_criteria(candidates, 5, Criteria.FORKS, GithubDataCache())
+        # the search server orders ties backwards by name, but we still break them alphabetically
+        self.assertEqual([repo.name for repo in top_repos], ["repo-000", "repo-001", "repo-002", "repo-003", "repo-004"])
+
+    def test_try_get_top_repo_candidates_from_search_returns_every_repo_in_a_small_org(self):
+        candidates = try_get_top_repo_candidates_from_search(self.github, "org", 500, Criteria.STARS)
+        self.assertEqual(len(candidates), len(self.repos))
+        self.assertEqual(self.server.request_count_by_endpoint["search"], 3)
+
+    def test_try_get_top_repo_candidates_from_search_gives_up_on_incomplete_results(self):
+        self.server.search_incomplete_results = True
+        self.assertIsNone(try_get_top_repo_candidates_from_search(self.github, "org", 5, Criteria.STARS))
+
+    def test_try_get_top_repo_candidates_from_search_gives_up_past_the_search_result_limit(self):
+        # every repo ties, so we'd need to see all of them but search stops at 1000
+        self.server.repos_by_organization_name["huge-org"] = [MockRepo(f"repo-{i:04d}", stars_count=1, forks_count=0, pull_requests_count=0) for i in range(1200)]
+        self.assertIsNone(try_get_top_repo_candidates_from_search(self.github, "huge-org", 5, Criteria.STARS))
+        self.assertEqual(self.server.request_count_by_endpoint["search"], 10)
+
+    def test_try_get_top_repo_candidates_from_search_gives_up_on_unknown_org(self):
+        self.assertIsNone(try_get_top_repo_candidates_from_search(self.github, "not-an-org", 5, Criteria.STARS))
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+from models.criteria import Criteria
+from models.metric import Metric
+from models.repo_data import RepoData
+from tests.helpers import assertRepoDataIsEqual
+from tests.mock_github_server import MockGithubServer, MockRepo, create_synthetic_organization
+from utilities.cache_utilities import GithubDataCache
+from utilities.graphql_utilities import get_repos_with_data
+from utilities.repo_utilities import get_top_repos_by_criteria
+
+class TestGraphqlUtilities(unittest.TestCase):
+    def test_get_repos_with_data_pages_through_the_organization(self):
+        repos = create_synthetic_organization(250)
+        with MockGithubServer({"big-org": repos}) as server:
+            github = server.create_client()
+            cache = GithubDataCache()
+            repo_records = get_repos_with_data(github, "big-org", cache)
+
+            self.assertEqual(server.request_count_by_endpoint["graphql"], 3)
+            self.assertEqual([repo.full_name for repo in repo_records], [f"big-org/{repo.name}" for repo in repos])
+            for repo, repo_record in zip(repos, repo_records):
+                assertRepoDataIsEqual(
+                    cache.try_get_data_for_repo(repo_record),
+                    RepoData(stars_count=repo.stars_count, forks_count=repo.forks_count, pull_requests_count=repo.pull_requests_count),
+                )
+
+    def test_get_repos_with_data_refetches_when_pull_requests_counts_are_missing(self):
+        with MockGithubServer({"org": create_synthetic_organization(10)}) as server:
+            github = server.create_client()
+            cache = GithubDataCache()
+            repo_records = get_repos_with_data(github, "org", cache)
+            self.assertEqual(get_repos_with_data(github, "org", cache, frozenset({Metric.PULL_REQUESTS})), repo_records)
+            self.assertEqual(server.request_count_by_endpoint["graphql"], 1)
+
+            # e.g. the listing came from the REST backend, which doesn't fetch the pull requests
+            cache.update_repos_for_org("org", repo_records)
+            cache._connection.execute("DELETE FROM repo_metrics WHERE metric = ?", (Metric.PULL_REQUESTS.value,))
+            self.assertEqual(get_repos_with_data(github, "org", cache, frozenset({Metric.STARS})), repo_records)
+            self.assertEqual(server.request_count_by_endpoint["graphql"], 1)
+            self.assertEqual(get_repos_with_data(github, "org", cache, frozenset({Metric.PULL_REQUESTS})), repo_records)
+            self.assertEqual(server.request_count_by_endpoint["graphql"], 2)
+
+    def test_get_repos_with_data_fills_cache_for_ranking(self):
+        repos = [
+            MockRepo("MostStars", stars_count=1, forks_count=0, pull_requests_count=1),
+            MockRepo("MostForks", stars_count=0, forks_count=3, pull_requests_count=0),
+            MockRepo("MostPullRequests", stars_count=0, forks_count=1, pull_requests_count=3),
+            MockRepo("HighestContributionPercentage", stars_count=0, forks_count=0, pull_requests_count=2),
+        ]
+        with MockGithubServer({"Amy-Testing": repos}) as server:
+            github = server.create_client()
+            cache = GithubDataCache()
+            repo_records = get_repos_with_data(github, "Amy-Testing", cache)
+
+            top_repos = get_top_repos_by_criteria(repo_records, n=2, criteria=Criteria.CONTRIBUTION_PERCENTAGE, cache=cache)
+            self.assertEqual([repo.name for repo in top_repos], ["HighestContributionPercentage", "MostPullRequests"])
+            self.assertEqual(server.request_count, 1)
+
+    def test_get_repos_with_data_exits_if_organization_does_not_exist(self):
+        with MockGithubServer({}) as server:
+            github = server.create_client()
+            with self.assertRaises(SystemExit):
+                get_repos_with_data(github, "missing-org", GithubDataCache())
+
+    def test_get_repos_with_data_exits_if_unauthenticated(self):
+        with MockGithubServer({"org": create_synthetic_organization(1)}) as server:
+            github = server.create_client(token=None)
+            with self.assertRaises(SystemExit):
+                get_repos_with_data(github, "org", GithubDataCache())
+
+    @patch("utilities.graphql_utilities.get_requester")
+    def test_get_repos_with_data_passes_along_errors_without_a_status(self, get_requester_mock):
+        get_requester_mock.return_value.requestJsonAndCheck.side_effect = ConnectionError("connection reset")
+        with self.assertRaises(ConnectionError):
+            get_repos_with_data(None, "org", GithubDataCache())
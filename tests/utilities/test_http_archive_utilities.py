@@ -0,0 +1,91 @@
+from contextlib import redirect_stdout
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from tests.mock_github_server import MockGithubServer, MockRepo, create_synthetic_organization
+from utilities.cache_utilities import DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, GithubDataCache
+from utilities.github_utilities import get_pull_requests_count, get_repos
+from utilities.http_archive_utilities import HttpRecording, HttpReplay, use_http_archive
+
+class TestHttpArchiveUtilities(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.path = os.path.join(temporary_directory.name, "recording.sqlite3")
+
+    def test_replays_a_recording_through_pygithub_without_a_network(self):
+        with MockGithubServer({"org": create_synthetic_organization(250, seed=3)}) as server:
+            github = server.create_client()
+            with use_http_archive(HttpRecording(self.path)) as recording:
+                repos = get_repos(github, "org", GithubDataCache())
+                pull_requests_counts = [get_pull_requests_count(github, repo)[0] for repo in repos[:5]]
+            self.assertEqual(recording.exchange_count, server.request_count)
+            request_count = server.request_count
+
+        # the server is gone, and the replay's client doesn't have a token
+        with use_http_archive(HttpReplay(self.path)) as replay:
+            github = server.create_client(token=None)
+            self.assertEqual(get_repos(github, "org", GithubDataCache()), repos)
+            self.assertEqual([get_pull_requests_count(github, repo)[0] for repo in repos[:5]], pull_requests_counts)
+        self.assertEqual(replay.base_url, server.base_url)
+        self.assertEqual(replay.exchange_count, request_count)
+        # the listing's 3 pages and 2 pages of pull requests per repo
+        self.assertEqual(request_count, 3 + 2 * 5)
+
+    @patch("time.time")
+    def test_replays_conditional_requests_in_order(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        mock_repos = [MockRepo("Repo", stars_count=1, forks_count=0, pull_requests_count=0)]
+        with MockGithubServer({"org": mock_repos}) as server:
+            github = server.create_client()
+            cache = GithubDataCache()
+            with use_http_archive(HttpRecording(self.path)):
+                get_repos(github, "org", cache)
+                time_mock.return_value += max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+                # revalidating sends the listing's ETag, so it's a different request from the first. the third is the
+                # same request as the second, but gets a different answer
+                get_repos(github, "org", cache)
+                mock_repos[0].stars_count = 2
+                time_mock.return_value += max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+                get_repos(github, "org", cache)
+            self.assertEqual(server.not_modified_count_by_endpoint["repos"], 1)
+
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        with use_http_archive(HttpReplay(self.path)):
+            github = server.create_client(token=None)
+            self.assertEqual(get_repos(github, "org", cache)[0].stargazers_count, 1)
+            for stars_count in [1, 2]:
+                time_mock.return_value += max(DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC.values()) + 1
+                self.assertEqual(get_repos(github, "org", cache)[0].stargazers_count, stars_count)
+            # the unconditional request was only recorded once, so asking again gets the same answer
+            self.assertEqual(get_repos(github, "org", GithubDataCache())[0].stargazers_count, 1)
+
+    def test_replay_simulates_the_recorded_latency(self):
+        with MockGithubServer({"org": [MockRepo("Repo", stars_count=1, forks_count=0, pull_requests_count=0)]}, latency_seconds=0.2) as server:
+            with use_http_archive(HttpRecording(self.path)):
+                get_repos(server.create_client(), "org", GithubDataCache())
+
+        for simulate_latency in [False, True]:
+            with use_http_archive(HttpReplay(self.path, simulate_latency)):
+                started_at = time.perf_counter()
+                get_repos(server.create_client(token=None), "org", GithubDataCache())
+                elapsed_seconds = time.perf_counter() - started_at
+            if simulate_latency:
+                self.assertGreaterEqual(elapsed_seconds, 0.2)
+            else:
+                self.assertLess(elapsed_seconds, 0.2)
+
+    def test_replay_exits_on_a_request_that_was_not_recorded(self):
+        with MockGithubServer({"org": [], "other-org": []}) as server:
+            with use_http_archive(HttpRecording(self.path)):
+                get_repos(server.create_client(), "org", GithubDataCache())
+
+        output = io.StringIO()
+        with redirect_stdout(output), use_http_archive(HttpReplay(self.path)), self.assertRaises(SystemExit):
+            get_repos(server.create_client(token=None), "other-org", GithubDataCache())
+        self.assertIn("doesn't have a response for GET /orgs/other-org", output.getvalue())
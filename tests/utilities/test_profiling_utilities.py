@@ -0,0 +1,72 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from models.metric import Metric
+from tests.helpers import create_repo_record
+from tests.mock_github_server import MockGithubServer, MockRepo
+from utilities.cache_utilities import DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, GithubDataCache
+from utilities.github_utilities import get_repos
+from utilities.profiling_utilities import CHROME_TRACE_FORMAT, Profiler, get_endpoint, get_profiler, start_profiler
+
+class TestProfilingUtilities(unittest.TestCase):
+    def setUp(self):
+        start_profiler()
+
+    def test_get_endpoint(self):
+        self.assertEqual(get_endpoint("https://api.github.com/orgs/Netflix/repos?per_page=100&page=2"), "/orgs/{org}/repos")
+        self.assertEqual(get_endpoint("http://127.0.0.1:8080/repos/Netflix/zuul/pulls"), "/repos/{owner}/{repo}/pulls")
+        self.assertEqual(get_endpoint("https://api.github.com/search/repositories?q=org:Netflix"), "/search/repositories")
+        self.assertEqual(get_endpoint("https://api.github.com/graphql"), "/graphql")
+
+    def test_record_requests(self):
+        profiler = Profiler()
+        for (url, status, elapsed_seconds) in [("/repos/a/b/pulls", 200, 0.005), ("/repos/a/c/pulls", 304, 0.03), ("/repos/a/d/pulls", 200, 0.2), ("/orgs/a/repos", 200, 6)]:
+            profiler.record_request("GET", url, status, 0, elapsed_seconds)
+
+        results = profiler.get_results()
+        self.assertEqual(results["requests"]["count"], 4)
+        pulls_results = results["requests"]["by_endpoint"]["/repos/{owner}/{repo}/pulls"]
+        self.assertEqual(pulls_results["count"], 3)
+        self.assertEqual(pulls_results["status_counts"], {"200": 2, "304": 1})
+        self.assertEqual(pulls_results["latency_histogram"], {"<=10ms": 1, "<=50ms": 1, "<=250ms": 1})
+        self.assertAlmostEqual(pulls_results["p50_ms"], 30)
+        self.assertAlmostEqual(pulls_results["p95_ms"], 200)
+        self.assertEqual(results["requests"]["by_endpoint"]["/orgs/{org}/repos"]["latency_histogram"], {">5000ms": 1})
+        self.assertIn("4 request(s) (/repos/{owner}/{repo}/pulls 3, /orgs/{org}/repos 1)", profiler.get_summary())
+
+    @patch("time.time")
+    def test_record_cache_lookups(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        repo = create_repo_record("cool-org", "RepoA")
+        cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS)
+        cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, 3)
+        cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS)
+        time_mock.return_value += DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.PULL_REQUESTS] + 1
+        cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS)
+
+        self.assertEqual(get_profiler().get_results()["cache"], {"pull_requests": {"hit": 1, "miss": 1, "stale": 1}})
+
+    def test_record_requests_and_phases_against_the_mock_server(self):
+        with MockGithubServer({"cool-org": [MockRepo("RepoA", 1, 0, 0), MockRepo("RepoB", 2, 0, 0)]}) as server:
+            cache = GithubDataCache()
+            get_repos(server.create_client(), "cool-org", cache)
+            get_repos(server.create_client(), "cool-org", cache)
+
+        results = get_profiler().get_results()
+        self.assertEqual(results["requests"]["by_endpoint"]["/orgs/{org}/repos"]["count"], 1)
+        self.assertEqual(results["cache"]["organization_repos"], {"hit": 1, "miss": 1, "stale": 0})
+        self.assertEqual(results["phases"]["get_repos"]["count"], 2)
+
+    def test_write_chrome_trace(self):
+        profiler = Profiler()
+        with profiler.phase("rank"):
+            profiler.record_request("GET", "/orgs/a/repos", 200, profiler._start_time, 0.01)
+
+        with tempfile.NamedTemporaryFile(suffix=".json") as profile_file:
+            profiler.write(profile_file.name, CHROME_TRACE_FORMAT)
+            trace = json.load(open(profile_file.name))
+        self.assertEqual([(event["name"], event["cat"], event["ph"]) for event in trace["traceEvents"]], [("GET /orgs/{org}/repos", "request", "X"), ("rank", "phase", "X")])
+        self.assertEqual(trace["otherData"]["requests"]["count"], 1)
@@ -0,0 +1,187 @@
+from contextlib import redirect_stdout
+import io
+import threading
+import unittest
+from unittest.mock import patch
+
+from models.criteria import Criteria
+from tests.mock_github_server import MockGithubServer, MockRepo, SECONDARY_RATE_LIMIT_MESSAGE
+from utilities.cache_utilities import GithubDataCache
+from utilities.github_utilities import ERROR_MESSAGE_BY_ERROR_CODE, get_repos
+from utilities.http_utilities import get_token_pool
+from utilities.rate_limit_utilities import MAX_RATE_LIMIT_RETRIES, RESUME_JITTER_SECONDS, SECONDARY_RATE_LIMIT_BACKOFF_SECONDS, RateLimitScheduler, TokenPool, get_resource
+from utilities.repo_utilities import get_top_repos_by_criteria
+
+STARTING_TIME = 1697943670.6
+
+# stands in for the wall clock so that tests can wait out rate limits without actually sleeping. sleeping threads
+# move the clock forward to when they'd have woken up
+class FakeClock(object):
+    def __init__(self, now: float):
+        self.now = now
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self.now += seconds
+
+def create_mock_repos(count: int) -> list[MockRepo]:
+    # lots of open issues means that none of the repos can be ruled out of the top n without fetching them, so every
+    # repo costs a request
+    return [MockRepo(f"repo-{i:02d}", stars_count=0, forks_count=0, pull_requests_count=i, issues_count=100) for i in range(count)]
+
+class TestRateLimitScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(STARTING_TIME)
+        for (name, replacement) in [("time.time", self.clock.time), ("time.sleep", self.clock.sleep)]:
+            patcher = patch(name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_server(self, repos: list[MockRepo], **kwargs) -> MockGithubServer:
+        server = MockGithubServer({"org": repos}, **kwargs).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def get_top_repos(self, server: MockGithubServer, concurrency: int = 4, tokens: list[str] | None = None) -> list[str]:
+        github = server.create_client(tokens=tokens, pool_size=concurrency)
+        cache = GithubDataCache()
+        with redirect_stdout(io.StringIO()):
+            repos = get_repos(github, "org", cache)
+            top_repos = get_top_repos_by_criteria(repos, 3, Criteria.PULL_REQUESTS, cache, concurrency, github)
+        return [repo.name for repo in top_repos]
+
+    def test_get_resource(self):
+        self.assertEqual(get_resource("/repos/org/repo/pulls?per_page=1"), "core")
+        self.assertEqual(get_resource("/graphql"), "graphql")
+        self.assertEqual(get_resource("/search/repositories?q=org:netflix"), "search")
+
+    def test_waits_for_the_rate_limit_to_reset_when_the_budget_is_used_up(self):
+        repos = create_mock_repos(30)
+        server = self.create_server(repos, rate_limit=10, rate_limit_window_seconds=60)
+
+        self.assertEqual(self.get_top_repos(server), ["repo-29", "repo-28", "repo-27"])
+        # 61 requests (the listing and 2 per repo) at 10 per window means waiting out at least 6 windows, without ever
+        # running into the limit
+        self.assertEqual(server.request_count, 61)
+        self.assertEqual(server.rate_limited_count, 0)
+        self.assertGreaterEqual(self.clock.now - STARTING_TIME, 6 * 60)
+
+    def test_spreads_requests_across_tokens(self):
+        repos = create_mock_repos(30)
+        server = self.create_server(repos, rate_limit=24, rate_limit_window_seconds=60)
+
+        self.assertEqual(self.get_top_repos(server, tokens=["token-a", "token-b", "token-c"]), ["repo-29", "repo-28", "repo-27"])
+        # 61 requests would have to wait with one token, but with 3 tokens' worth of budget we never have to
+        self.assertEqual(server.request_count, 61)
+        self.assertEqual(server.rate_limited_count, 0)
+        self.assertEqual(self.clock.now, STARTING_TIME)
+        self.assertEqual(set(server.request_count_by_token), {"token-a", "token-b", "token-c"})
+        self.assertLessEqual(max(server.request_count_by_token.values()), 24)
+
+    def test_drops_tokens_that_github_rejects(self):
+        repos = create_mock_repos(10)
+        server = self.create_server(repos)
+        server.revoked_tokens.add("revoked")
+
+        self.assertEqual(self.get_top_repos(server, tokens=["revoked", "token"]), ["repo-09", "repo-08", "repo-07"])
+        self.assertEqual(server.request_count_by_token["revoked"], 1)
+        self.assertEqual(server.request_count_by_token["token"], 21)
+
+    def test_exits_when_github_rejects_every_token(self):
+        server = self.create_server(create_mock_repos(1))
+        server.revoked_tokens.update(["revoked-a", "revoked-b"])
+
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit):
+            get_repos(server.create_client(tokens=["revoked-a", "revoked-b"]), "org", GithubDataCache())
+        self.assertIn("Github rejected one of the tokens, so we'll carry on with the other 1", output.getvalue())
+        self.assertIn(ERROR_MESSAGE_BY_ERROR_CODE[401], output.getvalue())
+
+    def test_token_pool_picks_the_token_with_the_most_budget_left(self):
+        token_pool = TokenPool(["token-a", "token-b", "token-c"])
+        for (expected_token, remaining) in [("token-a", 40), ("token-b", 90)]:
+            (token, scheduler) = token_pool.choose_token("/orgs/org/repos")
+            self.assertEqual(token, expected_token)
+            resource = scheduler.wait_for_budget("/orgs/org/repos")
+            scheduler.record_response(resource, 0.1, 200, {
+                "x-ratelimit-limit": "100",
+                "x-ratelimit-remaining": str(remaining),
+                "x-ratelimit-reset": str(int(STARTING_TIME) + 600),
+            }, "[]", attempt=0)
+
+        # we haven't heard about token-c's budget yet, so it goes first
+        self.assertEqual(token_pool.choose_token("/orgs/org/repos")[0], "token-c")
+        self.assertIsNone(token_pool.get_remaining_count())
+        token_pool.drop_token("token-c")
+        self.assertEqual(token_pool.choose_token("/orgs/org/repos")[0], "token-b")
+        self.assertEqual(token_pool.get_remaining_count(), 130)
+        # the last token is kept so that the request fails with its error
+        self.assertTrue(token_pool.drop_token("token-b"))
+        self.assertFalse(token_pool.drop_token("token-a"))
+        self.assertEqual(token_pool.get_token_count(), 1)
+
+    def test_retries_after_a_secondary_rate_limit_with_retry_after(self):
+        repos = create_mock_repos(10)
+        server = self.create_server(repos)
+        server.trigger_secondary_rate_limit(3, retry_after_seconds=30)
+
+        self.assertEqual(self.get_top_repos(server), ["repo-09", "repo-08", "repo-07"])
+        self.assertEqual(server.rate_limited_count, 3)
+        self.assertEqual(server.request_count, 21 + 3)
+        self.assertGreaterEqual(self.clock.now - STARTING_TIME, 30)
+
+    def test_backs_off_with_jitter_after_a_secondary_rate_limit_without_retry_after(self):
+        repos = create_mock_repos(10)
+        server = self.create_server(repos)
+        server.trigger_secondary_rate_limit(1)
+
+        self.assertEqual(self.get_top_repos(server, concurrency=1), ["repo-09", "repo-08", "repo-07"])
+        self.assertEqual(server.rate_limited_count, 1)
+        waited_seconds = self.clock.now - STARTING_TIME
+        self.assertGreaterEqual(waited_seconds, SECONDARY_RATE_LIMIT_BACKOFF_SECONDS)
+        self.assertLessEqual(waited_seconds, SECONDARY_RATE_LIMIT_BACKOFF_SECONDS * 1.5 + RESUME_JITTER_SECONDS)
+
+    def test_gives_up_after_max_retries(self):
+        server = self.create_server([MockRepo("repo", stars_count=0, forks_count=0, pull_requests_count=1)])
+        server.trigger_secondary_rate_limit(MAX_RATE_LIMIT_RETRIES + 1, retry_after_seconds=1)
+
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit):
+            get_repos(server.create_client(), "org", GithubDataCache())
+        self.assertIn(ERROR_MESSAGE_BY_ERROR_CODE[403], output.getvalue())
+        self.assertEqual(server.rate_limited_count, MAX_RATE_LIMIT_RETRIES + 1)
+
+    def test_does_not_retry_forbidden_responses_that_are_not_rate_limits(self):
+        scheduler = RateLimitScheduler()
+        resource = scheduler.wait_for_budget("/orgs/org/repos")
+        self.assertFalse(scheduler.record_response(resource, 0.1, 403, {}, '{"message": "Resource not accessible by integration"}', attempt=0))
+        resource = scheduler.wait_for_budget("/orgs/org/repos")
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(scheduler.record_response(resource, 0.1, 403, {}, f'{{"message": "{SECONDARY_RATE_LIMIT_MESSAGE}"}}', attempt=0))
+
+    def test_get_projected_seconds(self):
+        scheduler = RateLimitScheduler()
+        for _ in range(2):
+            resource = scheduler.wait_for_budget("/orgs/org/repos")
+            scheduler.record_response(resource, 0.5, 200, {
+                "x-ratelimit-limit": "100",
+                "x-ratelimit-remaining": "50",
+                "x-ratelimit-reset": str(int(STARTING_TIME) + 600),
+            }, "[]", attempt=0)
+        self.assertEqual(scheduler.get_remaining_count(), 50)
+
+        # 40 requests fit in the budget, so they take 10 rounds of 4 requests at 0.5s each
+        self.assertEqual(scheduler.get_projected_seconds(40, 4), 5)
+        # 200 requests need the rest of this window plus another full one
+        self.assertAlmostEqual(scheduler.get_projected_seconds(200, 4), 25 + (int(STARTING_TIME) + 600 - STARTING_TIME) + 60 * 60)
+
+    def test_creating_a_client_starts_a_fresh_scheduler(self):
+        server = self.create_server([])
+        token_pool = get_token_pool()
+        server.create_client()
+        self.assertIsNot(get_token_pool(), token_pool)
@@ -1,10 +1,18 @@
+from contextlib import redirect_stdout
+import io
+import random
+import time
 import unittest
 from unittest.mock import patch
 
 from models.criteria import Criteria
-from tests.helpers import create_mock_repository
-from utilities.cache_utilities import GithubDataCache
-from utilities.repo_utilities import get_top_repos_by_criteria
+from models.repo_record import RepoRecord
+from models.metric import METRICS_BY_CRITERIA, Metric
+from tests.helpers import create_mock_repository, create_repo_record
+from tests.mock_github_server import MockGithubServer, MockRepo, create_synthetic_organization
+from utilities.cache_utilities import DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, GithubDataCache
+from utilities.github_utilities import get_repos
+from utilities.repo_utilities import export_cached_data_for_repos, export_data_for_repos, get_top_repos_by_criteria, try_get_top_repos_from_cache
 
 MOCK_REPO_DATA = {
     "ManyStarsRepo": {
@@ -37,8 +45,8 @@ def get_mock_stars_count(repo) -> int:
 def get_mock_forks_count(repo) -> int:
     return MOCK_REPO_DATA[repo.name][Criteria.FORKS.value]
 
-def get_mock_pull_requests_count(repo) -> int:
-    return MOCK_REPO_DATA[repo.name][Criteria.PULL_REQUESTS.value]
+def get_mock_pull_requests_count(github, repo, cached_count=None, validators=None) -> tuple[int, None]:
+    return (MOCK_REPO_DATA[repo.name][Criteria.PULL_REQUESTS.value], None)
 
 class TestRepoUtilities(unittest.TestCase):
     def set_up_mocks(self, mock_get_stars_count, mock_get_forks_count, mock_get_pull_requests_count):
@@ -81,5 +89,187 @@ class TestRepoUtilities(unittest.TestCase):
 
         top_repos_by_contribution_percentage = get_top_repos_by_criteria(MOCK_REPOS, n=3, criteria=Criteria.CONTRIBUTION_PERCENTAGE, cache=GithubDataCache())
         self.assertEqual([repo.name for repo in top_repos_by_contribution_percentage], ["ManyContributionsRepo", "ManyPullsRepo", "ManyStarsRepo"])
-        
+
+    @patch("utilities.repo_utilities.get_stars_count")
+    @patch("utilities.repo_utilities.get_forks_count")
+    @patch("utilities.repo_utilities.get_pull_requests_count")
+    def test_get_top_repos_by_criteria_is_deterministic_with_concurrent_fetches(self, mock_get_pull_requests_count, mock_get_forks_count, mock_get_stars_count):
+        # lots of ties so the result depends on the name tie breaker, and random latency so fetches finish out of order
+        repo_names = [f"Repo{i}" for i in range(40)]
+        repos = [create_mock_repository("org_name", repo_name) for repo_name in repo_names]
+        def get_count_with_latency(repo) -> int:
+            time.sleep(random.uniform(0, 0.005))
+            return int(repo.name.removeprefix("Repo")) % 3
+        mock_get_stars_count.side_effect = get_count_with_latency
+        mock_get_forks_count.side_effect = get_count_with_latency
+        mock_get_pull_requests_count.side_effect = lambda github, repo, cached_count, validators: (get_count_with_latency(repo), None)
+
+        for criteria in METRICS_BY_CRITERIA:
+            serial_top_repos = get_top_repos_by_criteria(repos, n=7, criteria=criteria, cache=GithubDataCache(), concurrency=1)
+            concurrent_top_repos = get_top_repos_by_criteria(repos, n=7, criteria=criteria, cache=GithubDataCache(), concurrency=8)
+            self.assertEqual([(repo.name, repo.value) for repo in concurrent_top_repos], [(repo.name, repo.value) for repo in serial_top_repos])
+        self.assertEqual(
+            [repo.name for repo in serial_top_repos],
+            ["Repo11", "Repo14", "Repo17", "Repo2", "Repo20", "Repo23", "Repo26"],
+        )
+
+    @patch("utilities.repo_utilities.get_stars_count")
+    @patch("utilities.repo_utilities.get_forks_count")
+    @patch("utilities.repo_utilities.get_pull_requests_count")
+    def test_get_top_repos_by_criteria_only_fetches_repos_missing_from_cache(self, mock_get_pull_requests_count, mock_get_forks_count, mock_get_stars_count):
+        self.set_up_mocks(mock_get_stars_count, mock_get_forks_count, mock_get_pull_requests_count)
+        cache = GithubDataCache()
+        get_top_repos_by_criteria(MOCK_REPOS, n=2, criteria=Criteria.PULL_REQUESTS, cache=cache, concurrency=4)
+        self.assertEqual(mock_get_pull_requests_count.call_count, len(MOCK_REPOS))
+
+        top_repos_by_contribution_percentage = get_top_repos_by_criteria(MOCK_REPOS, n=2, criteria=Criteria.CONTRIBUTION_PERCENTAGE, cache=cache, concurrency=4)
+        self.assertEqual(mock_get_pull_requests_count.call_count, len(MOCK_REPOS))
+        self.assertEqual([repo.name for repo in top_repos_by_contribution_percentage], ["ManyContributionsRepo", "ManyPullsRepo"])
+
+    @patch("utilities.repo_utilities.get_stars_count")
+    @patch("utilities.repo_utilities.get_forks_count")
+    @patch("utilities.repo_utilities.get_pull_requests_count")
+    def test_get_top_repos_by_criteria_uses_listing_data_for_stars_and_forks(self, mock_get_pull_requests_count, mock_get_forks_count, mock_get_stars_count):
+        self.set_up_mocks(mock_get_stars_count, mock_get_forks_count, mock_get_pull_requests_count)
+        cache = GithubDataCache()
+
+        top_repos_by_stars = get_top_repos_by_criteria(MOCK_REPOS, n=2, criteria=Criteria.STARS, cache=cache)
+        self.assertEqual([repo.name for repo in top_repos_by_stars], ["ManyStarsRepo", "ManyForksRepo"])
+        top_repos_by_forks = get_top_repos_by_criteria(MOCK_REPOS, n=2, criteria=Criteria.FORKS, cache=cache)
+        self.assertEqual([repo.name for repo in top_repos_by_forks], ["ManyForksRepo", "ManyStarsRepo"])
+
+        mock_get_pull_requests_count.assert_not_called()
+        for repo in MOCK_REPOS:
+            self.assertIsNone(cache.try_get_data_for_repo(repo))
+
+    @patch("utilities.repo_utilities.get_stars_count")
+    @patch("utilities.repo_utilities.get_forks_count")
+    @patch("utilities.repo_utilities.get_pull_requests_count")
+    def test_get_top_repos_by_criteria_skips_repos_that_cannot_make_the_top_n(self, mock_get_pull_requests_count, mock_get_forks_count, mock_get_stars_count):
+        self.set_up_mocks(mock_get_stars_count, mock_get_forks_count, mock_get_pull_requests_count)
+        # the open issues count is an upper bound on the pull requests count
+        repos = [create_mock_repository("org_name", repo_name) for repo_name in MOCK_REPO_DATA.keys()]
+        for repo in repos:
+            repo.open_issues_count = MOCK_REPO_DATA[repo.name][Criteria.PULL_REQUESTS.value] + 1
+
+        top_repos_by_pull_requests = get_top_repos_by_criteria(repos, n=1, criteria=Criteria.PULL_REQUESTS, cache=GithubDataCache(), concurrency=1)
+        self.assertEqual([repo.name for repo in top_repos_by_pull_requests], ["ManyPullsRepo"])
+        # ManyContributionsRepo could still have 100 pull requests, and wins the tie on name, so it has to be fetched too
+        self.assertEqual([call.args[1].name for call in mock_get_pull_requests_count.call_args_list], ["ManyPullsRepo", "ManyContributionsRepo"])
+
+        mock_get_pull_requests_count.reset_mock()
+        top_repos_by_contribution_percentage = get_top_repos_by_criteria(repos, n=2, criteria=Criteria.CONTRIBUTION_PERCENTAGE, cache=GithubDataCache(), concurrency=1)
+        self.assertEqual([repo.name for repo in top_repos_by_contribution_percentage], ["ManyContributionsRepo", "ManyPullsRepo"])
+        self.assertEqual([call.args[1].name for call in mock_get_pull_requests_count.call_args_list], ["ManyContributionsRepo", "ManyPullsRepo"])
+
+    def test_get_top_repos_by_criteria_skipping_repos_gives_the_same_ranking_as_fetching_every_repo(self):
+        mock_repos = create_synthetic_organization(200, seed=1)
+        with MockGithubServer({"org": mock_repos}) as server:
+            github = server.create_client(pool_size=8)
+            repos = get_repos(github, "org", GithubDataCache())
+            # without the open issues count, nothing can be skipped
+            repos_without_bounds = [RepoRecord(repo.name, repo.full_name, repo.stargazers_count, repo.forks_count) for repo in repos]
+            for criteria in [Criteria.PULL_REQUESTS, Criteria.CONTRIBUTION_PERCENTAGE]:
+                with redirect_stdout(io.StringIO()):
+                    expected_top_repos = get_top_repos_by_criteria(repos_without_bounds, 10, criteria, GithubDataCache(), 8, github)
+                for n in [1, 10]:
+                    pulls_request_count = server.request_count_by_endpoint["pulls"]
+                    with redirect_stdout(io.StringIO()):
+                        top_repos = get_top_repos_by_criteria(repos, n, criteria, GithubDataCache(), 8, github)
+                    self.assertEqual([(repo.name, repo.value) for repo in top_repos], [(repo.name, repo.value) for repo in expected_top_repos[:n]])
+                    # each fetch is 2 requests, so fewer than a quarter of the repos were fetched
+                    self.assertLess((server.request_count_by_endpoint["pulls"] - pulls_request_count) / 2, len(repos) / 4)
+
+    @patch("time.time")
+    def test_get_top_repos_by_criteria_does_not_skip_repos_with_a_listing_older_than_the_pull_requests(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        mock_repos = [
+            MockRepo("a", stars_count=0, forks_count=0, pull_requests_count=1),
+            MockRepo("b", stars_count=0, forks_count=0, pull_requests_count=5, issues_count=5),
+        ]
+        with MockGithubServer({"org": mock_repos}) as server:
+            github = server.create_client()
+            cache = GithubDataCache()
+            for criteria in [Criteria.PULL_REQUESTS, Criteria.CONTRIBUTION_PERCENTAGE]:
+                with redirect_stdout(io.StringIO()):
+                    top_repos = get_top_repos_by_criteria(get_repos(github, "org", cache), 1, criteria, cache, 1, github, organization_name="org")
+                # a's open issues count says it can't beat b, so it isn't fetched
+                self.assertEqual([repo.name for repo in top_repos], ["b"])
+                self.assertIsNone(cache.try_get_metric_for_repo(create_repo_record("org", "a"), Metric.PULL_REQUESTS))
+
+            # the listing (and a's open issues count in it) is still fresh after the pull requests counts have expired,
+            # but a has more pull requests than its count says it can have
+            mock_repos[0].update_pull_requests(pull_requests_count=50, closed_pull_requests_count=0, updated_at="2023-10-02T00:00:00Z")
+            time_mock.return_value += DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.PULL_REQUESTS] + 60
+            listing_request_count = server.request_count_by_endpoint["repos"]
+            for criteria in [Criteria.PULL_REQUESTS, Criteria.CONTRIBUTION_PERCENTAGE]:
+                with redirect_stdout(io.StringIO()):
+                    top_repos = get_top_repos_by_criteria(get_repos(github, "org", cache), 1, criteria, cache, 1, github, organization_name="org")
+                self.assertEqual([repo.name for repo in top_repos], ["a"])
+            self.assertEqual(server.request_count_by_endpoint["repos"], listing_request_count)
+
+    @patch("time.time")
+    def test_get_top_repos_by_criteria_checks_the_listing_under_the_org_name_it_was_cached_with(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        mock_repos = [
+            MockRepo("a", stars_count=0, forks_count=0, pull_requests_count=50),
+            MockRepo("b", stars_count=0, forks_count=0, pull_requests_count=5, issues_count=5),
+        ]
+        with MockGithubServer({"Org": mock_repos}) as server:
+            github = server.create_client()
+            # the repos' full names have Github's casing (Org/a), but the listing is cached under the name we were
+            # given (org). a's open issues count is out of date, and the listing is older than the pull requests TTL
+            repos = [RepoRecord(repo.name, repo.full_name, repo.stargazers_count, repo.forks_count, 1 if repo.name == "a" else repo.open_issues_count) for repo in get_repos(github, "Org", GithubDataCache())]
+            cache = GithubDataCache()
+            cache.update_repos_for_org("org", repos)
+            time_mock.return_value += DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.PULL_REQUESTS] + 60
+            with redirect_stdout(io.StringIO()):
+                top_repos = get_top_repos_by_criteria(repos, 1, Criteria.PULL_REQUESTS, cache, 1, github, organization_name="org")
+        self.assertEqual([(repo.name, repo.value) for repo in top_repos], [("a", 50)])
+
+    def test_export_data_for_repos_writes_every_repo_and_ranks_them(self):
+        mock_repos = create_synthetic_organization(50, seed=2)
+        with MockGithubServer({"org": mock_repos}) as server:
+            github = server.create_client(pool_size=4)
+            cache = GithubDataCache()
+            repos = get_repos(github, "org", cache)
+            # a repo with a fresh cached count is written without a request
+            cache.update_metric_for_repo(repos[0], Metric.PULL_REQUESTS, 1000)
+            written = []
+            with redirect_stdout(io.StringIO()):
+                top_repos = export_data_for_repos(repos, 3, Criteria.PULL_REQUESTS, cache, lambda repo, repo_data: written.append((repo.name, repo_data.pull_requests_count)), 4, github)
+
+            self.assertEqual(written[0], (repos[0].name, 1000))
+            self.assertCountEqual([name for (name, _) in written], [repo.name for repo in repos])
+            # 2 requests (the count and its validators) for each of the others
+            self.assertEqual(server.request_count_by_endpoint["pulls"], 2 * (len(repos) - 1))
+            self.assertEqual([(repo.name, repo.value) for repo in top_repos], sorted(written, key=lambda name_and_count: (-name_and_count[1], name_and_count[0]))[:3])
+
+    def test_export_cached_data_for_repos_leaves_repos_without_a_count_out_of_the_ranking(self):
+        repos = [create_repo_record("org", "Counted", forks_count=1), create_repo_record("org", "Uncounted", forks_count=5)]
+        written = []
+        top_repos = export_cached_data_for_repos([(repos[0], 2), (repos[1], None)], 2, Criteria.PULL_REQUESTS, lambda repo, repo_data: written.append((repo.name, repo_data.pull_requests_count)))
+        self.assertEqual(written, [("Counted", 2), ("Uncounted", None)])
+        self.assertEqual([(repo.name, repo.value) for repo in top_repos], [("Counted", 2)])
+        # but it still ranks by the counts from the listing
+        top_repos = export_cached_data_for_repos([(repos[0], 2), (repos[1], None)], 2, Criteria.FORKS, lambda repo, repo_data: None)
+        self.assertEqual([(repo.name, repo.value) for repo in top_repos], [("Uncounted", 5), ("Counted", 1)])
+
+    @patch("time.time")
+    def test_try_get_top_repos_from_cache_only_answers_when_the_missing_repos_cannot_make_the_top_n(self, time_mock):
+        time_mock.return_value = 1697943670.6
+        cache = GithubDataCache()
+        repos = [create_repo_record("org", "StaleRepo", open_issues_count=10), create_repo_record("org", "FreshRepo", open_issues_count=10), create_repo_record("org", "MissingRepo", open_issues_count=4)]
+        cache.update_metric_for_repo(repos[0], Metric.PULL_REQUESTS, 8)
+        time_mock.return_value += DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC[Metric.PULL_REQUESTS] + 1
+        cache.update_metric_for_repo(repos[1], Metric.PULL_REQUESTS, 5)
+
+        (top_repos, stale_count) = try_get_top_repos_from_cache(repos, 2, Criteria.PULL_REQUESTS, cache, max_age_seconds=24 * 60 * 60)
+        self.assertEqual([(repo.name, repo.value) for repo in top_repos], [("StaleRepo", 8), ("FreshRepo", 5)])
+        self.assertEqual(stale_count, 1)
+        # MissingRepo could have up to 4 pull requests, which is enough for the top 3
+        self.assertIsNone(try_get_top_repos_from_cache(repos, 3, Criteria.PULL_REQUESTS, cache, max_age_seconds=24 * 60 * 60))
+        # and once StaleRepo's count is too old to use, it could make the top 2 too
+        self.assertIsNone(try_get_top_repos_from_cache(repos, 2, Criteria.PULL_REQUESTS, cache, max_age_seconds=60))
+
 # todo: consider tests with cache
\ No newline at end of file
@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import patch
+
+from models.metric import Metric
+from tests.helpers import create_repo_record
+from utilities.cache_utilities import GithubDataCache
+from utilities.snapshot_utilities import SECONDS_PER_DAY, SNAPSHOT_INTERVAL_SECONDS, SnapshotStore, _decode_varints, _encode_varints, record_scan
+
+STARTING_TIME = 1697943670.6
+
+class TestSnapshotUtilities(unittest.TestCase):
+    def test_encoding_varints_round_trips(self):
+        values = [0, 1, -1, 63, -64, 64, 300, -300, 2 ** 40, -(2 ** 40)]
+        self.assertEqual(_decode_varints(_encode_varints(values)), values)
+        # small changes take a byte each
+        self.assertEqual(len(_encode_varints([1, -1, 63, -64])), 4)
+
+    @patch("time.time")
+    def test_only_appends_values_that_changed(self, time_mock):
+        time_mock.return_value = STARTING_TIME
+        snapshot_store = SnapshotStore()
+        self.assertEqual(snapshot_store.append_scan("org", {Metric.STARS: [("org/a", 10, STARTING_TIME), ("org/b", 3, STARTING_TIME)]}), 2)
+
+        time_mock.return_value += SNAPSHOT_INTERVAL_SECONDS
+        self.assertEqual(snapshot_store.append_scan("org", {Metric.STARS: [("org/a", 12, time_mock.return_value), ("org/b", 3, time_mock.return_value)]}), 1)
+        # a value from before the latest sample doesn't add anything either
+        self.assertEqual(snapshot_store.append_scan("org", {Metric.STARS: [("org/a", 11, STARTING_TIME)]}), 0)
+        self.assertEqual(snapshot_store.get_first_scan_time("org"), int(STARTING_TIME))
+        self.assertEqual(snapshot_store.get_last_scan_time("org"), int(time_mock.return_value))
+
+    @patch("time.time")
+    def test_get_growth_over_a_window(self, time_mock):
+        snapshot_store = SnapshotStore()
+        for (days, stars_counts) in [(0, {"org/a": 10, "org/b": 50}), (5, {"org/a": 15, "org/b": 50}), (20, {"org/a": 40, "org/b": 49, "org/c": 7}), (30, {"org/a": 41, "org/b": 60, "org/c": 9})]:
+            time_mock.return_value = STARTING_TIME + days * SECONDS_PER_DAY
+            snapshot_store.append_scan("org", {Metric.STARS: [(repo_full_name, stars_count, time_mock.return_value) for (repo_full_name, stars_count) in stars_counts.items()]})
+
+        # org/c only showed up 10 days ago, so its growth is since then
+        self.assertCountEqual(snapshot_store.get_growth("org", Metric.STARS, 7 * SECONDS_PER_DAY), [("org/a", 41, 1), ("org/b", 60, 11), ("org/c", 9, 2)])
+        self.assertCountEqual(snapshot_store.get_growth("org", Metric.STARS, 28 * SECONDS_PER_DAY), [("org/a", 41, 31), ("org/b", 60, 10), ("org/c", 9, 2)])
+        self.assertEqual(snapshot_store.get_growth("org", Metric.FORKS, 7 * SECONDS_PER_DAY), [])
+        self.assertEqual(snapshot_store.get_growth("other-org", Metric.STARS, 7 * SECONDS_PER_DAY), [])
+
+    @patch("time.time")
+    def test_record_scan(self, time_mock):
+        time_mock.return_value = STARTING_TIME
+        cache = GithubDataCache()
+        snapshot_store = SnapshotStore()
+        repos = [create_repo_record("org", "a", stargazers_count=3, forks_count=1), create_repo_record("org", "b", stargazers_count=5)]
+        cache.update_metric_for_repo(repos[0], Metric.PULL_REQUESTS, 4)
+
+        self.assertTrue(snapshot_store.is_due_for_scan("org"))
+        # stars and forks for both repos, and the pull requests count we have for one of them
+        self.assertEqual(record_scan(snapshot_store, "org", repos, cache), 5)
+        self.assertFalse(snapshot_store.is_due_for_scan("org"))
+        self.assertEqual(snapshot_store.get_growth("org", Metric.PULL_REQUESTS, SECONDS_PER_DAY), [("org/a", 4, 0)])
+
+        time_mock.return_value += SNAPSHOT_INTERVAL_SECONDS
+        self.assertTrue(snapshot_store.is_due_for_scan("org"))
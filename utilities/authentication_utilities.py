@@ -1,8 +1,10 @@
 import os
-from dotenv import get_key, set_key
+from dotenv import dotenv_values, get_key, set_key
 
 DOTENV_PATH = os.path.join(os.path.dirname(__file__), '.env')
 PERSONAL_ACCESS_TOKEN_KEY = "GITHUB_PERSONAL_ACCESS_TOKEN"
+# more tokens to spread requests across, separated by commas
+PERSONAL_ACCESS_TOKENS_KEY = "GITHUB_PERSONAL_ACCESS_TOKENS"
 
 def get_personal_access_token():
     personal_access_token = get_key(DOTENV_PATH, PERSONAL_ACCESS_TOKEN_KEY)
@@ -14,6 +16,16 @@ def get_personal_access_token():
             set_key(DOTENV_PATH, PERSONAL_ACCESS_TOKEN_KEY, personal_access_token)
         return personal_access_token
 
+# the tokens in GITHUB_PERSONAL_ACCESS_TOKENS followed by GITHUB_PERSONAL_ACCESS_TOKEN, without duplicates. we only
+# prompt for a token if neither is set
+def get_personal_access_tokens() -> list[str]:
+    # unlike get_key, dotenv_values doesn't warn about keys that aren't set, and most people won't have set these
+    values = dotenv_values(DOTENV_PATH)
+    tokens = [token.strip() for token in (values.get(PERSONAL_ACCESS_TOKENS_KEY) or "").split(",") if token.strip() != ""]
+    personal_access_token = get_personal_access_token() if len(tokens) == 0 else values.get(PERSONAL_ACCESS_TOKEN_KEY)
+    if personal_access_token is not None:
+        tokens.append(personal_access_token)
+    return list(dict.fromkeys(tokens))
 
 def _prompt_for_personal_access_token() -> str | None:
     should_use_personal_access_token = input("We could not find a Github personal access token in the .env file. Without one, you may not be able to request certain information and you have a lower limit for requests per hour. Do you want to add one? (y/n): ")
@@ -1,94 +1,701 @@
-from contextlib import contextmanager
+from contextlib import contextmanager, suppress
 import os
 import pickle
+import sqlite3
 import time
+from typing import Iterator
+import uuid
 
-from github import PaginatedList, Repository
-
+from models.metric import LISTING_METRICS, Metric
 from models.repo_data import RepoData
+from models.repo_listing_page import RepoListingPage
+from models.repo_record import RepoRecord
+from models.validators import Validators
+from utilities.profiling_utilities import CACHE_HIT, CACHE_MISS, CACHE_STALE, get_profiler
 
 CACHE_DIRECTORY = os.path.join(os.path.dirname(__file__), ".cache")
-CACHE_FILE = os.path.join(CACHE_DIRECTORY, "github_data.pkl")
-CACHE_VERSION = 1
-TIME_TO_LIVE_SECONDS = 60 * 60
+CACHE_FILE = os.path.join(CACHE_DIRECTORY, "github_data.sqlite3")
+CACHE_VERSION = 9
+CACHE_TABLE_NAMES = ["organization_repos", "organization_repo_pages", "repo_records", "repo_metrics", "fetch_claims"]
+# tables that describe how the cache has been used rather than Github data, which survive `--refresh-cache`
+STATS_TABLE_NAMES = ["lookup_counts"]
+# tables from older cache versions, which we drop along with the current ones when the version changes
+RETIRED_CACHE_TABLE_NAMES = ["repo_data"]
+# stars and forks change slowly, but pull requests are opened and closed all the time
+DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC = {
+    Metric.STARS: 6 * 60 * 60,
+    Metric.FORKS: 6 * 60 * 60,
+    Metric.PULL_REQUESTS: 60 * 60,
+}
+# in an incremental refresh, we reuse a stale metric for a repo that hasn't changed since we fetched it, but only up to
+# this age, since some changes (e.g. a pull request from a fork being closed) don't show up in the repo's timestamps
+MAX_INCREMENTAL_REFRESH_AGE_SECONDS = 24 * 60 * 60
+
+# we normally hold on to stale entries so that they can be revalidated, but ones that haven't been checked in this long
+# are dropped when the cache is compacted
+MAX_CACHE_ENTRY_AGE_SECONDS = 30 * 24 * 60 * 60
+# an entry is a repo in an org's listing or a metric for a repo. past either limit, the least recently used orgs are
+# evicted first
+DEFAULT_MAX_CACHE_ENTRIES = 1_000_000
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+# during a scan, we commit what we've fetched so far every this many writes or seconds (whichever comes first), so that
+# a run that dies partway through (e.g. on a rate limit or Ctrl-C) doesn't lose it
+CHECKPOINT_INTERVAL_WRITES = 100
+CHECKPOINT_INTERVAL_SECONDS = 10
+# several runs (e.g. cron jobs and people on the same machine) can share the cache at once. a run that's waiting to write
+# waits this long for the others before giving up
+BUSY_TIMEOUT_SECONDS = 30
+# a run claims a repo's metric before fetching it, so that other runs wait for its result rather than fetching it too. a
+# claim that isn't released (e.g. because the run crashed) expires after this long
+FETCH_CLAIM_SECONDS = 60
+FETCH_CLAIM_POLL_SECONDS = 0.05
+# how often saving the cache also compacts it, since compacting has to look through every entry
+COMPACTION_INTERVAL_SECONDS = 60 * 60
+# once this much of the database file is free pages (e.g. after compacting), we rebuild it to give the space back
+VACUUM_FREE_FRACTION = 0.25
+
+CACHE_UNAVAILABLE_ERROR_MESSAGE = "Couldn't open the cache, possibly because another run is holding on to it. Please try again."
+
+# before we moved to sqlite, the whole cache was pickled to a single file. we migrate it on first run.
+PICKLE_CACHE_FILE = os.path.join(CACHE_DIRECTORY, "github_data.pkl")
+PICKLE_CACHE_VERSION = 1
+
+'''
+The cache is stored in a sqlite database with a row per org and per repo metric, so reads and writes only touch the
+entries that a run actually needs and opening the cache doesn't depend on how much data is in it.
+
+Each metric goes stale on its own schedule. The stars and forks counts come from the org's listing, so the listing is
+fresh as long as the counts we need from it are, while the pull requests count is cached per repo.
+
+Several runs can share the cache at once (e.g. cron jobs and people on the same machine). sqlite takes care of locking,
+and since each entry is its own row, runs add to each other's data rather than overwriting it. To keep two runs from
+fetching the same repo at the same time, a run claims each repo before fetching it, and the other runs wait for its
+result instead.
+
+Writes are committed every so often during a run rather than only at the end, and whatever a run got through is saved
+even if it errors out, so a run that dies partway through a scan doesn't have to start over.
+
+Saving the cache compacts it every so often: entries that haven't been checked in a long time are dropped, and if the
+cache is over its size limits, the least recently used orgs (along with their repos' metrics) are evicted. It also keeps
+a running count of cache hits and misses from the profiler, which `github_organization_repo_explorer_cache.py` reports.
+'''
+
+def _record_lookup(kind: str, is_cached: bool, is_stale: bool) -> None:
+    get_profiler().record_cache_lookup(kind, CACHE_MISS if not is_cached else CACHE_STALE if is_stale else CACHE_HIT)
 
 class GithubDataCache:
-    def __init__(self):
-        self.repos_by_organization_name = {}
-        self.last_checked_time_by_organization_name = {}
-        self.repo_data_by_repo_full_name = {}
-        self.last_checked_time_by_repo_full_name  = {}
-        self.version = CACHE_VERSION
-    
-    def _is_stale(self, current_time: int, last_checked_time: int) -> bool:
-        return current_time - last_checked_time > TIME_TO_LIVE_SECONDS
-    
+    # by default the cache only lives in memory, see get_github_data_cache for the on-disk cache. any metrics missing
+    # from `time_to_live_seconds_by_metric` use the default time to live.
+    def __init__(self, database_path: str = ":memory:", time_to_live_seconds_by_metric: dict[Metric, int] | None = None, max_entries: int = DEFAULT_MAX_CACHE_ENTRIES, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.set_time_to_live_seconds_by_metric(time_to_live_seconds_by_metric)
+        self.set_limits(max_entries, max_bytes)
+        self._connection = sqlite3.connect(database_path, timeout=BUSY_TIMEOUT_SECONDS)
+        if database_path != ":memory:":
+            # in WAL mode, runs can read while another one writes, and commits are cheap enough to make often
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+        # identifies this run's fetch claims
+        self._owner = uuid.uuid4().hex
+        # the number of writes this session, and since the last commit
+        self.write_count = 0
+        self._uncommitted_write_count = 0
+        self._last_commit_time = time.monotonic()
+        self.start_session()
+        self._create_tables()
+
+    def set_time_to_live_seconds_by_metric(self, time_to_live_seconds_by_metric: dict[Metric, int] | None) -> None:
+        self.time_to_live_seconds_by_metric = {**DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC, **(time_to_live_seconds_by_metric or {})}
+
+    # orgs used since the session started are never evicted, since the run that's using them would just re-fetch them.
+    # a session starts when the cache is opened, or with each query for a cache that stays open (see the daemon)
+    def start_session(self) -> None:
+        self._session_start_time = time.time()
+        self.write_count = 0
+
+    def set_limits(self, max_entries: int, max_bytes: int) -> None:
+        (self.max_entries, self.max_bytes) = (max_entries, max_bytes)
+
+    def _create_tables(self) -> None:
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            version_row = self._connection.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()
+            if version_row is not None and int(version_row[0]) != CACHE_VERSION:
+                # the data we care about has changed, so none of the cached data can be used
+                for table_name in CACHE_TABLE_NAMES + STATS_TABLE_NAMES + RETIRED_CACHE_TABLE_NAMES:
+                    self._connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+            self._connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('version', ?)", (str(CACHE_VERSION),))
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS organization_repos (
+                    organization_name TEXT PRIMARY KEY,
+                    last_checked_time REAL NOT NULL,
+                    last_used_time REAL NOT NULL
+                )
+            """)
+            # each page of an org's listing along with the validators Github sent for it
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS organization_repo_pages (
+                    organization_name TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    has_next_page INTEGER NOT NULL,
+                    PRIMARY KEY (organization_name, page)
+                )
+            """)
+            # the repos from each org's listing, in listing order
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS repo_records (
+                    organization_name TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    page INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    full_name TEXT NOT NULL,
+                    stargazers_count INTEGER NOT NULL,
+                    forks_count INTEGER NOT NULL,
+                    open_issues_count INTEGER,
+                    updated_at TEXT,
+                    pushed_at TEXT,
+                    PRIMARY KEY (organization_name, position)
+                )
+            """)
+            # each metric we've fetched for a repo, along with the validators Github sent for it (if any) and the
+            # repo's timestamps as of when we fetched it
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS repo_metrics (
+                    repo_full_name TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    repo_updated_at TEXT,
+                    repo_pushed_at TEXT,
+                    last_checked_time REAL NOT NULL,
+                    PRIMARY KEY (repo_full_name, metric)
+                )
+            """)
+            # the repo metrics that a run is fetching right now (see try_claim_fetch)
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS fetch_claims (
+                    repo_full_name TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    expires_time REAL NOT NULL,
+                    PRIMARY KEY (repo_full_name, metric)
+                )
+            """)
+            # the running totals of the profiler's cache lookups (see utilities/profiling_utilities.py)
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS lookup_counts (
+                    kind TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (kind, result)
+                )
+            """)
+
+    def _is_stale(self, current_time: int, last_checked_time: int, time_to_live_seconds: int) -> bool:
+        return current_time - last_checked_time > time_to_live_seconds
+
+    def _get_listing_time_to_live_seconds(self, metrics: frozenset[Metric]) -> int:
+        # the listing is fresh as long as the counts we need from it are. the set of repos in the org comes from the
+        # listing too, so if we don't need any of its counts, it's fresh as long as all of them are
+        listing_metrics = (metrics & LISTING_METRICS) or LISTING_METRICS
+        return min(self.time_to_live_seconds_by_metric[metric] for metric in listing_metrics)
+
     # we use the repo full name in case there are collisions across orgs
-    def _get_repo_key(self, repo: Repository.Repository) -> str:
+    def _get_repo_key(self, repo: RepoRecord) -> str:
         return repo.full_name
-    
-    def update_repos_for_org(self, organization_name: str, repos: PaginatedList.PaginatedList[Repository.Repository]) -> None:
-        self.repos_by_organization_name[organization_name] = repos
-        self.last_checked_time_by_organization_name[organization_name] = time.time()
-    
-    def try_get_repos_for_org(self, organization_name: str) -> PaginatedList.PaginatedList[Repository.Repository] | None:
+
+    def _set_metric_for_repo(self, repo_key: str, metric: Metric, value: int, last_checked_time: float, validators: Validators | None = None, repo: RepoRecord | None = None) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO repo_metrics (repo_full_name, metric, value, etag, last_modified, repo_updated_at, repo_pushed_at, last_checked_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                repo_key,
+                metric.value,
+                value,
+                validators.etag if validators is not None else None,
+                validators.last_modified if validators is not None else None,
+                repo.updated_at if repo is not None else None,
+                repo.pushed_at if repo is not None else None,
+                last_checked_time,
+            ),
+        )
+
+    def _mark_org_as_used(self, organization_name: str) -> None:
+        self._connection.execute("UPDATE organization_repos SET last_used_time = ? WHERE organization_name = ?", (time.time(), organization_name))
+
+    def _delete_repos_for_org(self, organization_name: str) -> None:
+        self._connection.execute("DELETE FROM organization_repos WHERE organization_name = ?", (organization_name,))
+        self._connection.execute("DELETE FROM organization_repo_pages WHERE organization_name = ?", (organization_name,))
+        self._connection.execute("DELETE FROM repo_records WHERE organization_name = ?", (organization_name,))
+
+    def _get_repo_records(self, organization_name: str) -> list[tuple[int, RepoRecord]]:
+        return [
+            (page, RepoRecord(name=name, full_name=full_name, stargazers_count=stargazers_count, forks_count=forks_count, open_issues_count=open_issues_count, updated_at=updated_at, pushed_at=pushed_at))
+            for (page, name, full_name, stargazers_count, forks_count, open_issues_count, updated_at, pushed_at) in self._connection.execute(
+                "SELECT page, name, full_name, stargazers_count, forks_count, open_issues_count, updated_at, pushed_at FROM repo_records WHERE organization_name = ? ORDER BY position",
+                (organization_name,),
+            )
+        ]
+
+    def update_repos_for_org(self, organization_name: str, repos: list[RepoRecord]) -> None:
+        self.update_repo_listing_pages_for_org(organization_name, [RepoListingPage(repos, validators=None, has_next_page=False)])
+
+    def _record_write(self) -> None:
+        self.write_count += 1
+        self._uncommitted_write_count += 1
+        if self._uncommitted_write_count >= CHECKPOINT_INTERVAL_WRITES or time.monotonic() - self._last_commit_time >= CHECKPOINT_INTERVAL_SECONDS:
+            with get_profiler().phase("cache_checkpoint"):
+                self.commit()
+
+    def update_repo_listing_pages_for_org(self, organization_name: str, pages: list[RepoListingPage]) -> None:
+        self._delete_repos_for_org(organization_name)
+        self._connection.execute(
+            "INSERT INTO organization_repos (organization_name, last_checked_time, last_used_time) VALUES (?, ?, ?)",
+            (organization_name, time.time(), time.time()),
+        )
+        self._connection.executemany(
+            "INSERT INTO organization_repo_pages (organization_name, page, etag, last_modified, has_next_page) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    organization_name,
+                    page_index,
+                    page.validators.etag if page.validators is not None else None,
+                    page.validators.last_modified if page.validators is not None else None,
+                    page.has_next_page,
+                )
+                for page_index, page in enumerate(pages)
+            ],
+        )
+        self._connection.executemany(
+            "INSERT INTO repo_records (organization_name, position, page, name, full_name, stargazers_count, forks_count, open_issues_count, updated_at, pushed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (organization_name, position, page_index, repo.name, repo.full_name, repo.stargazers_count, repo.forks_count, repo.open_issues_count, repo.updated_at, repo.pushed_at)
+                for position, (page_index, repo) in enumerate((page_index, repo) for page_index, page in enumerate(pages) for repo in page.repos)
+            ],
+        )
+        self._record_write()
+
+    # `metrics` are the metrics we need from the listing, which decides how old it can be
+    def try_get_repos_for_org(self, organization_name: str, metrics: frozenset[Metric] = LISTING_METRICS) -> list[RepoRecord] | None:
         current_time = time.time()
-        
+
         repos = None
-        if organization_name in self.repos_by_organization_name:
-            if self._is_stale(current_time, self.last_checked_time_by_organization_name[organization_name]):
-                del self.repos_by_organization_name[organization_name]
-                del self.last_checked_time_by_organization_name[organization_name]
-            else:
-                repos = self.repos_by_organization_name[organization_name]
-        
+        row = self._connection.execute(
+            "SELECT last_checked_time FROM organization_repos WHERE organization_name = ?", (organization_name,)
+        ).fetchone()
+        # we hold on to stale listings so that they can be revalidated (see try_get_repo_listing_pages_for_org)
+        is_stale = row is not None and self._is_stale(current_time, row[0], self._get_listing_time_to_live_seconds(metrics))
+        if row is not None and not is_stale:
+            repos = [repo for (_, repo) in self._get_repo_records(organization_name)]
+            self._mark_org_as_used(organization_name)
+
+        _record_lookup("organization_repos", row is not None, is_stale)
         return repos
-    
-    def update_data_for_repo(self, repo: Repository.Repository, repo_data: RepoData) -> None:
+
+    # for --stale-ok: returns the org's listing even if it's stale, as long as it's at most `max_age_seconds` old, along
+    # with whether it's stale. these lookups aren't counted in the hit rates since the run looks everything up again
+    # when it refreshes
+    def try_get_stale_ok_repos_for_org(self, organization_name: str, metrics: frozenset[Metric], max_age_seconds: int) -> tuple[list[RepoRecord], bool] | None:
         current_time = time.time()
-        repo_key = self._get_repo_key(repo)
-        self.repo_data_by_repo_full_name[repo_key] = repo_data
-        self.last_checked_time_by_repo_full_name[repo_key] = current_time
+        row = self._connection.execute(
+            "SELECT last_checked_time FROM organization_repos WHERE organization_name = ?", (organization_name,)
+        ).fetchone()
+        if row is None or self._is_stale(current_time, row[0], max_age_seconds):
+            return None
+        repos = [repo for (_, repo) in self._get_repo_records(organization_name)]
+        return (repos, self._is_stale(current_time, row[0], self._get_listing_time_to_live_seconds(metrics)))
+
+    # for exporting straight from the cache (see utilities/export_utilities.py): yields each repo in the org's cached
+    # listing along with its cached `metric` (or None if we don't have it), even if they're stale. unlike the other
+    # lookups, the rows are streamed from a single query rather than loading the whole listing first, so this doesn't
+    # need much memory however big the org is
+    def iterate_repos_with_metric_for_org(self, organization_name: str, metric: Metric) -> Iterator[tuple[RepoRecord, int | None]]:
+        for (name, full_name, stargazers_count, forks_count, open_issues_count, updated_at, pushed_at, value) in self._connection.execute(
+            """
+                SELECT repo_records.name, repo_records.full_name, stargazers_count, forks_count, open_issues_count, updated_at, pushed_at, repo_metrics.value
+                FROM repo_records
+                LEFT JOIN repo_metrics ON repo_metrics.repo_full_name = repo_records.full_name AND repo_metrics.metric = ?
+                WHERE organization_name = ?
+                ORDER BY position
+            """,
+            (metric.value, organization_name),
+        ):
+            yield (RepoRecord(name=name, full_name=full_name, stargazers_count=stargazers_count, forks_count=forks_count, open_issues_count=open_issues_count, updated_at=updated_at, pushed_at=pushed_at), value)
+
+    # when the org's listing was last checked, even if it's stale, or None if it isn't cached
+    def try_get_repos_checked_time_for_org(self, organization_name: str) -> float | None:
+        row = self._connection.execute("SELECT last_checked_time FROM organization_repos WHERE organization_name = ?", (organization_name,)).fetchone()
+        return row[0] if row is not None else None
+
+    # whether the org's listing was last checked within `metric`'s TTL. an org we don't have a listing for doesn't have
+    # a stale one either
+    def is_listing_fresh_for_metric(self, organization_name: str, metric: Metric) -> bool:
+        checked_time = self.try_get_repos_checked_time_for_org(organization_name)
+        return checked_time is None or not self._is_stale(time.time(), checked_time, self.time_to_live_seconds_by_metric[metric])
+
+    # returns the cached pages of the org's listing, even if they're stale
+    def try_get_repo_listing_pages_for_org(self, organization_name: str) -> list[RepoListingPage] | None:
+        page_rows = self._connection.execute(
+            "SELECT etag, last_modified, has_next_page FROM organization_repo_pages WHERE organization_name = ? ORDER BY page",
+            (organization_name,),
+        ).fetchall()
+        if len(page_rows) == 0:
+            return None
+        self._mark_org_as_used(organization_name)
 
-    def try_get_data_for_repo(self, repo: Repository.Repository) -> int | None:
+        pages = [
+            RepoListingPage([], Validators(etag, last_modified) if etag is not None or last_modified is not None else None, bool(has_next_page))
+            for (etag, last_modified, has_next_page) in page_rows
+        ]
+        for (page_index, repo) in self._get_repo_records(organization_name):
+            pages[page_index].repos.append(repo)
+        return pages
+
+    # `repo` should be the record the metric was fetched for, so that we know which version of the repo it's from
+    def update_metric_for_repo(self, repo: RepoRecord, metric: Metric, value: int, validators: Validators | None = None) -> None:
+        self._set_metric_for_repo(self._get_repo_key(repo), metric, value, time.time(), validators, repo)
+        self._record_write()
+
+    def try_get_metric_for_repo(self, repo: RepoRecord, metric: Metric) -> int | None:
         current_time = time.time()
-        repo_key = self._get_repo_key(repo)
-
-        data = None
-        if repo_key in self.repo_data_by_repo_full_name:
-            if self._is_stale(current_time, self.last_checked_time_by_repo_full_name[repo_key]):
-                del self.repo_data_by_repo_full_name[repo_key]
-                del self.last_checked_time_by_repo_full_name[repo_key]
-            else:
-                data = self.repo_data_by_repo_full_name[repo_key]
-        
-        return data
-    
-def _try_load_github_data_cache(refresh: bool) -> GithubDataCache:
-    if not os.path.exists(CACHE_FILE) or refresh:
-        return GithubDataCache()
-    else:
-        try:
-            with open(CACHE_FILE, "rb") as f:
-                cache = pickle.load(f)
-                if cache.version == CACHE_VERSION:
-                    print("Note: Found cached data that will be used if not stale. If you want to re-fetch all data, re-run this command with `--refresh-cache`.\n")
-                    return cache
-                else:
-                    return GithubDataCache()
-        except Exception:
-            # if we run into an unexpected error loading the cache (e.g because the pickle file is corrupted),
-            # just return and empty cache
-            return GithubDataCache()
+
+        value = None
+        is_stale = False
+        cached_metric = self._try_get_cached_metric(repo, metric)
+        # we hold on to stale metrics so that they can be revalidated (see try_get_metric_and_validators_for_repo)
+        if cached_metric is not None:
+            (cached_value, _, last_checked_time) = cached_metric
+            is_stale = self._is_stale(current_time, last_checked_time, self.time_to_live_seconds_by_metric[metric])
+            if not is_stale:
+                value = cached_value
+
+        _record_lookup(metric.value, cached_metric is not None, is_stale)
+        return value
+
+    # returns the cached metric for the repo, even if it's stale, along with when it was last checked (for the snapshot
+    # store, see utilities/snapshot_utilities.py)
+    def try_get_metric_and_checked_time_for_repo(self, repo: RepoRecord, metric: Metric) -> tuple[int, float] | None:
+        cached_metric = self._try_get_cached_metric(repo, metric)
+        if cached_metric is None:
+            return None
+        (value, _, last_checked_time) = cached_metric
+        return (value, last_checked_time)
+
+    # the metric version of try_get_stale_ok_repos_for_org
+    def try_get_stale_ok_metric_for_repo(self, repo: RepoRecord, metric: Metric, max_age_seconds: int) -> tuple[int, bool] | None:
+        current_time = time.time()
+        cached_metric = self._try_get_cached_metric(repo, metric)
+        if cached_metric is None:
+            return None
+        (value, _, last_checked_time) = cached_metric
+        if self._is_stale(current_time, last_checked_time, max_age_seconds):
+            return None
+        return (value, self._is_stale(current_time, last_checked_time, self.time_to_live_seconds_by_metric[metric]))
+
+    # returns the cached metric for the repo, even if it's stale, along with the validators for the request it came from
+    def try_get_metric_and_validators_for_repo(self, repo: RepoRecord, metric: Metric) -> tuple[int, Validators | None] | None:
+        cached_metric = self._try_get_cached_metric(repo, metric)
+        if cached_metric is None:
+            return None
+        (value, validators, _) = cached_metric
+        return (value, validators)
+
+    # returns the cached metric for the repo even if it's stale, as long as the repo's timestamps in `repo` (from a fresh
+    # listing) match the ones it had when we fetched the metric, i.e. the repo hasn't changed since then
+    def try_get_unchanged_metric_for_repo(self, repo: RepoRecord, metric: Metric) -> int | None:
+        if repo.updated_at is None or repo.pushed_at is None:
+            return None
+
+        row = self._connection.execute(
+            "SELECT value, last_checked_time FROM repo_metrics WHERE repo_full_name = ? AND metric = ? AND repo_updated_at = ? AND repo_pushed_at = ?",
+            (self._get_repo_key(repo), metric.value, repo.updated_at, repo.pushed_at),
+        ).fetchone()
+        if row is None or self._is_stale(time.time(), row[1], MAX_INCREMENTAL_REFRESH_AGE_SECONDS):
+            return None
+        return row[0]
+
+    def _try_get_cached_metric(self, repo: RepoRecord, metric: Metric) -> tuple[int, Validators | None, float] | None:
+        row = self._connection.execute(
+            "SELECT value, etag, last_modified, last_checked_time FROM repo_metrics WHERE repo_full_name = ? AND metric = ?",
+            (self._get_repo_key(repo), metric.value),
+        ).fetchone()
+        if row is None:
+            return None
+
+        (value, etag, last_modified, last_checked_time) = row
+        validators = Validators(etag, last_modified) if etag is not None or last_modified is not None else None
+        return (value, validators, last_checked_time)
+
+    # stores each of the metrics in `repo_data` that we have. `validators` are for the pull requests count.
+    def update_data_for_repo(self, repo: RepoRecord, repo_data: RepoData, validators: Validators | None = None) -> None:
+        self.update_metric_for_repo(repo, Metric.STARS, repo_data.stars_count)
+        self.update_metric_for_repo(repo, Metric.FORKS, repo_data.forks_count)
+        if repo_data.pull_requests_count is not None:
+            self.update_metric_for_repo(repo, Metric.PULL_REQUESTS, repo_data.pull_requests_count, validators)
+
+    # returns the repo's data only if every one of its metrics is cached and fresh
+    def try_get_data_for_repo(self, repo: RepoRecord) -> RepoData | None:
+        value_by_metric = {metric: self.try_get_metric_for_repo(repo, metric) for metric in Metric}
+        if None in value_by_metric.values():
+            return None
+        return RepoData(
+            stars_count=value_by_metric[Metric.STARS],
+            forks_count=value_by_metric[Metric.FORKS],
+            pull_requests_count=value_by_metric[Metric.PULL_REQUESTS],
+        )
+
+    def clear(self) -> None:
+        for table_name in CACHE_TABLE_NAMES:
+            self._connection.execute(f"DELETE FROM {table_name}")
+
+    # claims the metric for this run to fetch, unless another run has already claimed it. the claim is committed right
+    # away so that other runs see it
+    def try_claim_fetch(self, repo: RepoRecord, metric: Metric) -> bool:
+        current_time = time.time()
+        is_claimed = self._connection.execute("""
+            INSERT INTO fetch_claims (repo_full_name, metric, owner, expires_time) VALUES (?, ?, ?, ?)
+            ON CONFLICT (repo_full_name, metric) DO UPDATE SET owner = excluded.owner, expires_time = excluded.expires_time
+            WHERE fetch_claims.expires_time < ? OR fetch_claims.owner = excluded.owner
+        """, (self._get_repo_key(repo), metric.value, self._owner, current_time + FETCH_CLAIM_SECONDS, current_time)).rowcount == 1
+        self.commit()
+        return is_claimed
+
+    # should come after the fetched metric is written, so that the runs waiting on it find it
+    def release_fetch(self, repo: RepoRecord, metric: Metric) -> None:
+        self._connection.execute(
+            "DELETE FROM fetch_claims WHERE repo_full_name = ? AND metric = ? AND owner = ?",
+            (self._get_repo_key(repo), metric.value, self._owner),
+        )
+        self.commit()
+
+    def release_fetches(self) -> None:
+        self._connection.execute("DELETE FROM fetch_claims WHERE owner = ?", (self._owner,))
+
+    # waits for the run that claimed the metric to release it, and returns what it fetched. returns None if it gave up
+    # on the metric or its claim expired first, in which case we should fetch it ourselves
+    def wait_for_fetch(self, repo: RepoRecord, metric: Metric) -> int | None:
+        # we wouldn't see what the other run commits from inside our own transaction
+        self.commit()
+        deadline = time.monotonic() + FETCH_CLAIM_SECONDS
+        while time.monotonic() < deadline:
+            row = self._connection.execute(
+                "SELECT expires_time FROM fetch_claims WHERE repo_full_name = ? AND metric = ?",
+                (self._get_repo_key(repo), metric.value),
+            ).fetchone()
+            if row is None or row[0] < time.time():
+                break
+            time.sleep(FETCH_CLAIM_POLL_SECONDS)
+        return self.try_get_metric_for_repo(repo, metric)
+
+    def get_entry_count(self) -> int:
+        return sum(self._connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0] for table_name in ["repo_records", "repo_metrics"])
+
+    # the bytes used by the database, not counting free pages that haven't been given back to the file system yet
+    def get_size_bytes(self) -> int:
+        (page_count, freelist_count, page_size) = (self._connection.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ["page_count", "freelist_count", "page_size"])
+        return (page_count - freelist_count) * page_size
+
+    def get_file_size_bytes(self) -> int:
+        return self._connection.execute("PRAGMA page_count").fetchone()[0] * self._connection.execute("PRAGMA page_size").fetchone()[0]
+
+    def _is_over_limits(self) -> bool:
+        return self.get_entry_count() > self.max_entries or self.get_size_bytes() > self.max_bytes
+
+    def _evict_org(self, organization_name: str) -> None:
+        self._connection.execute(
+            "DELETE FROM repo_metrics WHERE repo_full_name IN (SELECT full_name FROM repo_records WHERE organization_name = ?)",
+            (organization_name,),
+        )
+        self._delete_repos_for_org(organization_name)
+
+    # drops the entries that are too old to be worth revalidating, and then evicts the least recently used orgs until
+    # the cache is within its limits. metrics for repos that aren't in any org's listing (e.g. from search) go after that,
+    # oldest first. returns the number of entries that were removed
+    def compact(self) -> int:
+        current_time = time.time()
+        entry_count = self.get_entry_count()
+
+        self._connection.execute("DELETE FROM repo_metrics WHERE last_checked_time < ?", (current_time - MAX_CACHE_ENTRY_AGE_SECONDS,))
+        for (organization_name,) in self._connection.execute("SELECT organization_name FROM organization_repos WHERE last_checked_time < ?", (current_time - MAX_CACHE_ENTRY_AGE_SECONDS,)).fetchall():
+            self._delete_repos_for_org(organization_name)
+
+        least_recently_used_organization_names = [
+            organization_name
+            for (organization_name,) in self._connection.execute(
+                "SELECT organization_name FROM organization_repos WHERE last_used_time < ? ORDER BY last_used_time", (self._session_start_time,)
+            )
+        ]
+        for organization_name in least_recently_used_organization_names:
+            if not self._is_over_limits():
+                break
+            self._evict_org(organization_name)
+
+        while self._is_over_limits():
+            deleted_count = self._connection.execute("""
+                DELETE FROM repo_metrics WHERE rowid IN (
+                    SELECT rowid FROM repo_metrics
+                    WHERE repo_full_name NOT IN (SELECT full_name FROM repo_records) AND last_checked_time < ?
+                    ORDER BY last_checked_time LIMIT 1000
+                )
+            """, (self._session_start_time,)).rowcount
+            if deleted_count == 0:
+                break
+
+        self._connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('last_compacted_time', ?)", (str(current_time),))
+        return entry_count - self.get_entry_count()
+
+    def get_last_compacted_time(self) -> float | None:
+        row = self._connection.execute("SELECT value FROM metadata WHERE key = 'last_compacted_time'").fetchone()
+        return float(row[0]) if row is not None else None
+
+    def is_due_for_compaction(self) -> bool:
+        last_compacted_time = self.get_last_compacted_time()
+        return last_compacted_time is None or time.time() - last_compacted_time > COMPACTION_INTERVAL_SECONDS
+
+    # `lookup_counts_by_kind` looks like the "cache" part of the profiler's results
+    def add_lookup_counts(self, lookup_counts_by_kind: dict[str, dict[str, int]]) -> None:
+        self._connection.executemany(
+            "INSERT INTO lookup_counts (kind, result, count) VALUES (?, ?, ?) ON CONFLICT (kind, result) DO UPDATE SET count = count + excluded.count",
+            [(kind, result, count) for (kind, counts) in lookup_counts_by_kind.items() for (result, count) in counts.items() if count > 0],
+        )
+
+    def get_lookup_counts(self) -> dict[str, dict[str, int]]:
+        lookup_counts_by_kind = {}
+        for (kind, result, count) in self._connection.execute("SELECT kind, result, count FROM lookup_counts ORDER BY kind"):
+            lookup_counts_by_kind.setdefault(kind, {CACHE_HIT: 0, CACHE_MISS: 0, CACHE_STALE: 0})[result] = count
+        return lookup_counts_by_kind
+
+    # the number of orgs and the number of repos in their listings
+    def get_organization_counts(self) -> tuple[int, int]:
+        return (
+            self._connection.execute("SELECT COUNT(*) FROM organization_repos").fetchone()[0],
+            self._connection.execute("SELECT COUNT(*) FROM repo_records").fetchone()[0],
+        )
+
+    # the number of cached values for each metric and how many of them are stale
+    def get_metric_counts(self) -> dict[Metric, tuple[int, int]]:
+        current_time = time.time()
+        return {
+            metric: self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(last_checked_time < ?), 0) FROM repo_metrics WHERE metric = ?",
+                (current_time - self.time_to_live_seconds_by_metric[metric], metric.value),
+            ).fetchone()
+            for metric in Metric
+        }
+
+    # rebuilds the database file if enough of it is free pages. this can't run in the middle of a transaction, so it
+    # should come after commit
+    def vacuum_if_fragmented(self) -> bool:
+        (page_count, freelist_count) = (self._connection.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ["page_count", "freelist_count"])
+        if page_count == 0 or freelist_count / page_count < VACUUM_FREE_FRACTION:
+            return False
+        self._connection.execute("VACUUM")
+        return True
+
+    def commit(self) -> None:
+        self._connection.commit()
+        self._uncommitted_write_count = 0
+        self._last_commit_time = time.monotonic()
+
+    def close(self) -> None:
+        # anything that wasn't committed is discarded
+        self._connection.close()
+
+class _PickledGithubDataCache:
+    # the shape of the pickled cache from before we moved to sqlite. pickle looks the class up by name, so we
+    # redirect it here (see _LegacyCacheUnpickler) rather than to the current GithubDataCache
+    pass
+
+class _PickledRepoData:
+    # the old RepoData was pickled with its attributes in a __dict__, which the current one (with __slots__) can't be
+    # unpickled from
+    pass
+
+class _LegacyCacheUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str):
+        if module == __name__ and name == "GithubDataCache":
+            return _PickledGithubDataCache
+        if module == "models.repo_data" and name == "RepoData":
+            return _PickledRepoData
+        return super().find_class(module, name)
+
+def _migrate_pickle_cache(cache: GithubDataCache) -> None:
+    try:
+        with open(PICKLE_CACHE_FILE, "rb") as f:
+            pickled_cache = _LegacyCacheUnpickler(f).load()
+        if pickled_cache.version == PICKLE_CACHE_VERSION:
+            # the old cache stored each org's repos as a pygithub PaginatedList, which could only be materialized by
+            # making requests, so we only carry over the per-repo data and let the org listings be re-fetched
+            for repo_key, repo_data in pickled_cache.repo_data_by_repo_full_name.items():
+                last_checked_time = pickled_cache.last_checked_time_by_repo_full_name[repo_key]
+                cache._set_metric_for_repo(repo_key, Metric.STARS, repo_data.stars_count, last_checked_time)
+                cache._set_metric_for_repo(repo_key, Metric.FORKS, repo_data.forks_count, last_checked_time)
+                if repo_data.pull_requests_count is not None:
+                    cache._set_metric_for_repo(repo_key, Metric.PULL_REQUESTS, repo_data.pull_requests_count, last_checked_time)
+            cache.commit()
+    except Exception:
+        # if we run into an unexpected error loading the old cache (e.g because the pickle file is corrupted),
+        # just start from an empty cache
+        pass
+    # another run may have migrated it at the same time
+    with suppress(FileNotFoundError):
+        os.remove(PICKLE_CACHE_FILE)
+
+def _try_load_github_data_cache(refresh: bool, time_to_live_seconds_by_metric: dict[Metric, int] | None, max_entries: int, max_bytes: int) -> GithubDataCache:
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    cache_exists = os.path.exists(CACHE_FILE)
+    try:
+        cache = GithubDataCache(CACHE_FILE, time_to_live_seconds_by_metric, max_entries, max_bytes)
+    except sqlite3.OperationalError as e:
+        # e.g. another run has held on to the database for longer than the busy timeout, which doesn't mean that anything
+        # is wrong with it
+        print(f"{CACHE_UNAVAILABLE_ERROR_MESSAGE} ({e})")
+        exit(1)
+    except sqlite3.DatabaseError:
+        # if the database file is corrupted, start over with an empty one
+        for path in [CACHE_FILE, f"{CACHE_FILE}-wal", f"{CACHE_FILE}-shm"]:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+        cache_exists = False
+        cache = GithubDataCache(CACHE_FILE, time_to_live_seconds_by_metric, max_entries, max_bytes)
+
+    if os.path.exists(PICKLE_CACHE_FILE):
+        _migrate_pickle_cache(cache)
+        cache_exists = True
+
+    if refresh:
+        cache.clear()
+    elif cache_exists:
+        print("Note: Found cached data that will be used if not stale. If you want to re-fetch all data, re-run this command with `--refresh-cache`.\n")
+    return cache
+
+# commits the cache along with this run's lookup counts, compacting it first if it's been a while
+def save_github_data_cache(cache: GithubDataCache) -> None:
+    with get_profiler().phase("cache_save"):
+        cache.release_fetches()
+        cache.add_lookup_counts(get_profiler().get_cache_lookup_counts())
+        is_compacting = cache.is_due_for_compaction()
+        if is_compacting:
+            cache.compact()
+        cache.commit()
+        if is_compacting:
+            cache.vacuum_if_fragmented()
 
 @contextmanager
-def get_github_data_cache(refresh=False):
-    cache = _try_load_github_data_cache(refresh)
+def get_github_data_cache(refresh=False, time_to_live_seconds_by_metric: dict[Metric, int] | None = None, max_entries: int = DEFAULT_MAX_CACHE_ENTRIES, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+    with get_profiler().phase("cache_load"):
+        cache = _try_load_github_data_cache(refresh, time_to_live_seconds_by_metric, max_entries, max_bytes)
     try:
         yield cache
-    except Exception as e:
-        raise e
+    except BaseException:
+        # everything we've written is complete on its own, so we keep what the run got through (including on Ctrl-C
+        # or an exit from the github utilities) and the next run picks up from there
+        save_github_data_cache(cache)
+        if cache.write_count > 0:
+            print("Saved the data fetched so far, so running this again will pick up where it left off.")
+        raise
     else:
-        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
-        with open(CACHE_FILE, "wb") as f:
-            pickle.dump(cache, f)
+        save_github_data_cache(cache)
+    finally:
+        cache.close()
@@ -0,0 +1,118 @@
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from typing import Callable
+
+from utilities.cache_utilities import CACHE_DIRECTORY
+
+'''
+This file contains the protocol between the explorer and its daemon (see github_organization_repo_explorer_daemon.py).
+
+The client sends its arguments and working directory over a Unix socket as one line of JSON. The daemon answers the
+query as if it had been run from the command line, streaming back what it prints as lines of JSON, and finishes with
+the exit code.
+'''
+
+DAEMON_SOCKET_PATH = os.path.join(CACHE_DIRECTORY, "daemon.sock")
+
+def _send_message(file: io.TextIOBase, message: dict) -> None:
+    file.write(json.dumps(message) + "\n")
+    file.flush()
+
+def _get_exit_code(e: SystemExit) -> int:
+    # mirrors how python turns the argument to exit() into an exit code
+    if e.code is None:
+        return 0
+    elif isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+# returns the exit code of the query if the daemon answered it, or None if there's no daemon running
+def try_run_with_daemon(argv: list[str], socket_path: str | None = None) -> int | None:
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client_socket.connect(socket_path or DAEMON_SOCKET_PATH)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # a socket file that nobody's listening on is left over from a daemon that didn't shut down cleanly
+        client_socket.close()
+        return None
+
+    with client_socket, client_socket.makefile("rw", encoding="utf-8") as socket_file:
+        _send_message(socket_file, {"argv": argv, "cwd": os.getcwd()})
+        for line in socket_file:
+            message = json.loads(line)
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+            elif "exit_code" in message:
+                sys.stdout.flush()
+                return message["exit_code"]
+    # the daemon went away partway through the query
+    print("The daemon stopped before answering the query", file=sys.stderr)
+    return 1
+
+def is_daemon_running(socket_path: str | None = None) -> bool:
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client_socket:
+        try:
+            client_socket.connect(socket_path or DAEMON_SOCKET_PATH)
+            return True
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+
+class _MessageWriter(io.TextIOBase):
+    # forwards what's printed to the client. the fetch workers print from their own threads, so writes are serialized
+    def __init__(self, socket_file: io.TextIOBase, stream_name: str, lock: threading.Lock):
+        self._socket_file = socket_file
+        self._stream_name = stream_name
+        self._lock = lock
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            _send_message(self._socket_file, {self._stream_name: text})
+        return len(text)
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        socket_file = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+        request = json.loads(self.rfile.readline())
+        lock = threading.Lock()
+        with redirect_stdout(_MessageWriter(socket_file, "stdout", lock)), redirect_stderr(_MessageWriter(socket_file, "stderr", lock)):
+            try:
+                self.server.answer_query(request["argv"], request["cwd"])
+                exit_code = 0
+            except SystemExit as e:
+                exit_code = _get_exit_code(e)
+            except Exception:
+                # one bad query shouldn't take the daemon down with it
+                traceback.print_exc()
+                exit_code = 1
+        _send_message(socket_file, {"exit_code": exit_code})
+        socket_file.detach()
+
+# answers one query at a time, since queries share the cache and redirect the daemon's stdout
+class DaemonServer(socketserver.UnixStreamServer):
+    def __init__(self, answer_query: Callable[[list[str], str], None], socket_path: str | None = None):
+        self.answer_query = answer_query
+        self.socket_path = socket_path or DAEMON_SOCKET_PATH
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        # callers check is_daemon_running first, so this is left over from a daemon that didn't shut down cleanly
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        super().__init__(self.socket_path, _QueryHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
@@ -0,0 +1,140 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import csv
+import json
+import os
+
+from models.criteria import Criteria
+from models.repo_data import RepoData
+from models.repo_record import RepoRecord
+
+'''
+This file contains the exporters for `--export`, which write every repo's data to a file rather than only printing the
+top n.
+
+Rows are written as the data comes in (from the cache or as each fetch finishes), and nothing is held on to after a row
+is written, so exporting doesn't need more memory for a bigger org. JSONL and CSV are written a line at a time.
+Parquet is written in row groups of PARQUET_ROW_GROUP_SIZE rows, so that's the most it holds on to at once. It needs
+pyarrow, which is only imported when exporting to Parquet so that nothing else depends on it.
+'''
+
+JSONL_FORMAT = "jsonl"
+CSV_FORMAT = "csv"
+PARQUET_FORMAT = "parquet"
+EXPORT_FORMATS = [JSONL_FORMAT, CSV_FORMAT, PARQUET_FORMAT]
+EXPORT_FIELDS = ["organization_name", "name", "full_name", "stars_count", "forks_count", "pull_requests_count", "contribution_percentage"]
+PARQUET_ROW_GROUP_SIZE = 10_000
+PARQUET_UNAVAILABLE_ERROR_MESSAGE = "ERROR: Exporting to Parquet needs pyarrow. Please install it (e.g. `pip install pyarrow`) or export to jsonl or csv instead."
+
+# the format from the file's extension, e.g. repos.csv is exported as CSV. anything we don't recognize is exported as JSONL
+def get_export_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in EXPORT_FORMATS else JSONL_FORMAT
+
+# the pull requests count (and so the contribution percentage) is None for a repo we don't have it for, which is only
+# the case when exporting straight from the cache
+def _get_row(organization_name: str, repo: RepoRecord, repo_data: RepoData) -> dict:
+    return {
+        "organization_name": organization_name,
+        "name": repo.name,
+        "full_name": repo.full_name,
+        "stars_count": repo_data.stars_count,
+        "forks_count": repo_data.forks_count,
+        "pull_requests_count": repo_data.pull_requests_count,
+        "contribution_percentage": repo_data.get_data_for_criteria(Criteria.CONTRIBUTION_PERCENTAGE) if repo_data.pull_requests_count is not None else None,
+    }
+
+# each format only has to write a row and close its file. an exporter missing either one can't be created
+class RepoDataExporter(ABC):
+    def __init__(self, path: str):
+        self.path = path
+        self.row_count = 0
+
+    def write(self, organization_name: str, repo: RepoRecord, repo_data: RepoData) -> None:
+        self._write_row(_get_row(organization_name, repo, repo_data))
+        self.row_count += 1
+
+    @abstractmethod
+    def _write_row(self, row: dict) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+class _JsonLinesExporter(RepoDataExporter):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write_row(self, row: dict) -> None:
+        self._file.write(json.dumps(row) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+class _CsvExporter(RepoDataExporter):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=EXPORT_FIELDS)
+        self._writer.writeheader()
+
+    def _write_row(self, row: dict) -> None:
+        # a missing pull requests count is left empty
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._file.close()
+
+class _ParquetExporter(RepoDataExporter):
+    def __init__(self, path: str):
+        super().__init__(path)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print(PARQUET_UNAVAILABLE_ERROR_MESSAGE)
+            exit(1)
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            ("organization_name", pyarrow.string()),
+            ("name", pyarrow.string()),
+            ("full_name", pyarrow.string()),
+            ("stars_count", pyarrow.int64()),
+            ("forks_count", pyarrow.int64()),
+            ("pull_requests_count", pyarrow.int64()),
+            ("contribution_percentage", pyarrow.float64()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._columns = {field: [] for field in EXPORT_FIELDS}
+
+    def _write_row(self, row: dict) -> None:
+        for (field, value) in row.items():
+            self._columns[field].append(value)
+        if len(self._columns["name"]) >= PARQUET_ROW_GROUP_SIZE:
+            self._write_row_group()
+
+    def _write_row_group(self) -> None:
+        self._writer.write_table(self._pyarrow.Table.from_pydict(self._columns, schema=self._schema))
+        self._columns = {field: [] for field in EXPORT_FIELDS}
+
+    def close(self) -> None:
+        if len(self._columns["name"]) > 0:
+            self._write_row_group()
+        self._writer.close()
+
+EXPORTER_CLASS_BY_FORMAT = {
+    JSONL_FORMAT: _JsonLinesExporter,
+    CSV_FORMAT: _CsvExporter,
+    PARQUET_FORMAT: _ParquetExporter,
+}
+
+# `export_format` is one of EXPORT_FORMATS, or None to go by the file's extension
+@contextmanager
+def open_exporter(path: str, export_format: str | None = None):
+    exporter = EXPORTER_CLASS_BY_FORMAT[export_format or get_export_format(path)](path)
+    try:
+        yield exporter
+    finally:
+        exporter.close()
@@ -1,6 +1,23 @@
-from github import Github, Organization, PaginatedList, Repository
+from __future__ import annotations
 
+import json
+import re
+from typing import Any, TYPE_CHECKING
+from urllib.parse import parse_qs, urlparse
+
+from models.criteria import Criteria
+from models.metric import LISTING_METRICS, Metric
+from models.repo_listing_page import RepoListingPage
+from models.repo_record import RepoRecord
+from models.validators import Validators
 from utilities.cache_utilities import GithubDataCache
+from utilities.profiling_utilities import profiled
+
+# pygithub takes a while to import, and a query that the cache can answer doesn't need it, so we only import it for
+# the type hints here. the client itself is created in github_organization_repo_explorer.py once a request is needed
+if TYPE_CHECKING:
+    from github import Github
+    from github.Requester import Requester
 
 '''
 This file contains all the methods that might need to reach out to the Github API.
@@ -8,57 +25,169 @@ This file contains all the methods that might need to reach out to the Github AP
 We wrap and centralize them for simplified mocking in tests.
 '''
 
+# the largest page size the Github REST API allows
+MAX_PER_PAGE = 100
+NOT_MODIFIED_STATUS = 304
+PULL_REQUESTS_CHANGE_PARAMETERS = {"state": "all", "sort": "updated", "direction": "desc", "per_page": 1}
+# the search API won't return more than the first 1000 results of a query
+MAX_SEARCH_RESULTS = 1000
+# search answers with a 422 if e.g. the org doesn't exist
+SEARCH_VALIDATION_FAILED_STATUS = 422
+SEARCH_SORT_BY_CRITERIA = {
+    Criteria.STARS: "stars",
+    Criteria.FORKS: "forks",
+}
+
 ERROR_MESSAGE_BY_ERROR_CODE = {
     401: "ERROR: Bad credentials. Please confirm your access token is entered correctly and that you have access to this organization.",
     403: "ERROR: You've exceeded the Github API rate limits. If you haven't set up a PAT, doing so will increase your allowed requests per hour.",
     404: "ERROR: The requested Github resource does not exist."
 }
 
-def get_organization(github: Github, organization_name: str) -> Organization.Organization:
+def get_requester(github: Github) -> Requester:
+    # pygithub (as of 2.1.1) doesn't expose the client's requester, but we need it for requests that pygithub
+    # doesn't wrap (e.g. GraphQL queries) so that they share the client's auth and connection pool
+    return github._Github__requester
+
+def _request_if_modified(github: Github, url: str, parameters: dict[str, Any], validators: Validators | None) -> tuple[int, dict[str, str], Any]:
+    requester = get_requester(github)
+    headers = validators.get_conditional_request_headers() if validators is not None else {}
     try:
-        return github.get_organization(organization_name)
+        (status, response_headers, output) = requester.requestJson("GET", url, parameters=parameters, headers=headers)
+        data = json.loads(output) if len(output) > 0 else None
+        if status >= 400:
+            raise requester.createException(status, response_headers, data)
     except Exception as e:
-        if e.status in ERROR_MESSAGE_BY_ERROR_CODE:
+        if getattr(e, "status", None) in ERROR_MESSAGE_BY_ERROR_CODE:
             print(ERROR_MESSAGE_BY_ERROR_CODE[e.status])
             exit(1)
         else:
             raise e
-        
-def get_repos(organization_name: str, organization: Organization.Organization, cache: GithubDataCache) -> PaginatedList.PaginatedList[Repository.Repository]:
-    cached_repos_or_none = cache.try_get_repos_for_org(organization_name)
+    return (status, response_headers, data)
+
+def _get_validators(response_headers: dict[str, str]) -> Validators | None:
+    if "etag" not in response_headers and "last-modified" not in response_headers:
+        return None
+    return Validators(etag=response_headers.get("etag"), last_modified=response_headers.get("last-modified"))
+
+def _get_link_urls_by_rel(response_headers: dict[str, str]) -> dict[str, str]:
+    link_urls_by_rel = {}
+    for link in response_headers.get("link", "").split(","):
+        match = re.fullmatch(r'\s*<([^>]*)>;\s*rel="([^"]*)"\s*', link)
+        if match:
+            link_urls_by_rel[match.group(2)] = match.group(1)
+    return link_urls_by_rel
+
+def _create_repo_record(repo_json: dict[str, Any]) -> RepoRecord:
+    # the org repo listing already includes the stargazers and forks counts for each repo, so we keep them rather
+    # than asking for them per repo (e.g. `repo.get_stargazers().totalCount` makes a request per repo)
+    return RepoRecord(
+        name=repo_json["name"],
+        full_name=repo_json["full_name"],
+        stargazers_count=repo_json["stargazers_count"],
+        forks_count=repo_json["forks_count"],
+        open_issues_count=repo_json["open_issues_count"],
+        updated_at=repo_json.get("updated_at"),
+        pushed_at=repo_json.get("pushed_at"),
+    )
+
+def _get_repo_listing_pages(github: Github, organization_name: str, cached_pages: list[RepoListingPage]) -> list[RepoListingPage]:
+    # we request each page with the validators we got for it last time. if Github says a page hasn't changed, we
+    # keep our cached copy of it
+    pages = []
+    while len(pages) == 0 or pages[-1].has_next_page:
+        page_index = len(pages)
+        cached_page = cached_pages[page_index] if page_index < len(cached_pages) else None
+        (status, response_headers, data) = _request_if_modified(
+            github,
+            f"/orgs/{organization_name}/repos",
+            {"per_page": MAX_PER_PAGE, "page": page_index + 1},
+            cached_page.validators if cached_page is not None else None,
+        )
+        if status == NOT_MODIFIED_STATUS:
+            pages.append(cached_page)
+        else:
+            pages.append(RepoListingPage(
+                repos=[_create_repo_record(repo_json) for repo_json in data],
+                validators=_get_validators(response_headers),
+                has_next_page="next" in _get_link_urls_by_rel(response_headers),
+            ))
+    return pages
+
+# if the cached listing for the org is fresh for the `metrics` we need from it, we return it without making any
+# requests. otherwise, or with `revalidate`, we revalidate (or fetch) the listing page by page.
+@profiled("get_repos")
+def get_repos(github: Github, organization_name: str, cache: GithubDataCache, metrics: frozenset[Metric] = LISTING_METRICS, revalidate: bool = False) -> list[RepoRecord]:
+    cached_repos_or_none = cache.try_get_repos_for_org(organization_name, metrics) if not revalidate else None
     if cached_repos_or_none is not None:
         return cached_repos_or_none
     else:
+        pages = _get_repo_listing_pages(github, organization_name, cache.try_get_repo_listing_pages_for_org(organization_name) or [])
+        cache.update_repo_listing_pages_for_org(organization_name, pages)
+        return [repo for page in pages for repo in page.repos]
+
+def get_stars_count(repo: RepoRecord) -> int:
+    return repo.stargazers_count
+
+def get_forks_count(repo: RepoRecord) -> int:
+    return repo.forks_count
+
+# ranks the org's repos with Github's repository search rather than listing all of them, which costs ~1 request
+# rather than ~1 per 100 repos. returns enough of the top repos to pick the top n from (including any that tie with
+# the nth repo), or None if search couldn't give us a complete answer and we need to fall back to the full listing.
+@profiled("search_repos")
+def try_get_top_repo_candidates_from_search(github: Github, organization_name: str, n: int, criteria: Criteria) -> list[RepoRecord] | None:
+    from github import GithubException
+
+    get_count = get_stars_count if criteria == Criteria.STARS else get_forks_count
+    candidates = []
+    for page in range(1, MAX_SEARCH_RESULTS // MAX_PER_PAGE + 1):
         try:
-            repos = organization.get_repos()
-        except Exception as e:
-            if e.status in ERROR_MESSAGE_BY_ERROR_CODE:
-                print(ERROR_MESSAGE_BY_ERROR_CODE[e.status])
-                exit(1)
-        cache.update_repos_for_org(organization_name, repos)
-        return repos
-
-def get_stars_count(repo: Repository.Repository) -> int:
-    try:
-        return repo.get_stargazers().totalCount
-    except Exception as e:
-        if e.status in ERROR_MESSAGE_BY_ERROR_CODE:
-            print(ERROR_MESSAGE_BY_ERROR_CODE[e.status])
-            exit(1)
+            (_, response_headers, data) = _request_if_modified(
+                github,
+                "/search/repositories",
+                # search leaves out forks unless we ask for them, but the org's listing includes them
+                {"q": f"org:{organization_name} fork:true", "sort": SEARCH_SORT_BY_CRITERIA[criteria], "order": "desc", "per_page": MAX_PER_PAGE, "page": page},
+                validators=None,
+            )
+        except GithubException as e:
+            if e.status == SEARCH_VALIDATION_FAILED_STATUS:
+                return None
+            raise e
+        if data["incomplete_results"]:
+            # the search timed out before it found every match
+            return None
 
-def get_forks_count(repo: Repository.Repository) -> int:
-    try:
-        return repo.get_forks().totalCount
-    except Exception as e:
-        if e.status in ERROR_MESSAGE_BY_ERROR_CODE:
-            print(ERROR_MESSAGE_BY_ERROR_CODE[e.status])
-            exit(1)
-    
+        candidates.extend(_create_repo_record(repo_json) for repo_json in data["items"])
+        # search doesn't order repos with the same count by name like RepoWithValue does, so we can only stop once
+        # we're past the nth repo's count and know we've seen every repo that ties with it
+        if len(candidates) > n and get_count(candidates[-1]) < get_count(candidates[n - 1]):
+            return candidates
+        if "next" not in _get_link_urls_by_rel(response_headers):
+            # if there are more matches than search will give us, we haven't seen all of the ties
+            return candidates if len(candidates) >= data["total_count"] else None
+    return None
 
-def get_pull_requests_count(repo: Repository.Repository) -> int:
-    try:
-        return repo.get_pulls().totalCount
-    except Exception as e:
-        if e.status in ERROR_MESSAGE_BY_ERROR_CODE:
-            print(ERROR_MESSAGE_BY_ERROR_CODE[e.status])
-            exit(1)
\ No newline at end of file
+def _get_total_count(github: Github, url: str, parameters: dict[str, Any]) -> int:
+    # like pygithub's PaginatedList.totalCount, we ask for 1 item per page so that the number of the last page is the count
+    (_, response_headers, data) = _request_if_modified(github, url, {**parameters, "per_page": 1}, validators=None)
+    last_page_url = _get_link_urls_by_rel(response_headers).get("last")
+    if last_page_url is not None:
+        return int(parse_qs(urlparse(last_page_url).query)["page"][0])
+    else:
+        return len(data)
+
+# returns the count along with the validators to check whether it has changed next time. if the repo's pull requests
+# haven't changed since we got `validators`, we return `cached_count` without counting them again.
+@profiled("get_pull_requests_count")
+def get_pull_requests_count(github: Github, repo: RepoRecord, cached_count: int | None = None, validators: Validators | None = None) -> tuple[int, Validators | None]:
+    pulls_url = f"/repos/{repo.full_name}/pulls"
+    # the validators for the count request itself wouldn't notice e.g. an older PR getting closed (the first page of
+    # 1 PR would look the same). instead, we validate the most recently updated PR in any state, which changes whenever
+    # any PR is opened, closed, or updated. we ask for it even when there's nothing to revalidate yet, so that the count
+    # can be revalidated with a single 304 once it expires. it's asked for before counting so that a change in between
+    # shows up next time
+    (status, response_headers, _) = _request_if_modified(github, pulls_url, PULL_REQUESTS_CHANGE_PARAMETERS, validators if cached_count is not None else None)
+    if status == NOT_MODIFIED_STATUS:
+        return (cached_count, validators)
+    return (_get_total_count(github, pulls_url, {}), _get_validators(response_headers))
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from models.metric import LISTING_METRICS, Metric
+from models.repo_data import RepoData
+from models.repo_record import RepoRecord
+from utilities.cache_utilities import GithubDataCache
+from utilities.github_utilities import ERROR_MESSAGE_BY_ERROR_CODE, get_requester
+from utilities.profiling_utilities import profiled
+
+# see utilities/github_utilities.py
+if TYPE_CHECKING:
+    from github import Github
+
+'''
+This file contains the methods that reach out to the Github GraphQL API.
+
+Unlike the REST API, GraphQL lets us ask for the stars, forks, and pull requests counts of up to 100 repos in a
+single request, so an org with r repos costs ~r/100 requests rather than ~r.
+'''
+
+GRAPHQL_URL = "/graphql"
+# the largest page size the Github GraphQL API allows for a connection
+REPOSITORIES_PAGE_SIZE = 100
+
+# we only count open pull requests to match the REST backend, where `repo.get_pulls()` defaults to state=open
+ORGANIZATION_REPOSITORIES_QUERY = """
+query($organization: String!, $pageSize: Int!, $after: String) {
+  organization(login: $organization) {
+    repositories(first: $pageSize, after: $after, orderBy: {field: NAME, direction: ASC}) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        nameWithOwner
+        stargazerCount
+        forkCount
+        updatedAt
+        pushedAt
+        pullRequests(states: OPEN) {
+          totalCount
+        }
+      }
+    }
+  }
+}
+"""
+
+GRAPHQL_AUTHENTICATION_ERROR_MESSAGE = "ERROR: The Github GraphQL API requires authentication. Please set up a PAT or use `--backend rest`."
+ERROR_CODE_BY_GRAPHQL_ERROR_TYPE = {
+    "FORBIDDEN": 403,
+    "RATE_LIMITED": 403,
+    "NOT_FOUND": 404,
+}
+
+def _request_repositories_page(github: Github, organization_name: str, after: str | None) -> dict:
+    query = {
+        "query": ORGANIZATION_REPOSITORIES_QUERY,
+        "variables": {"organization": organization_name, "pageSize": REPOSITORIES_PAGE_SIZE, "after": after},
+    }
+    try:
+        _, response = get_requester(github).requestJsonAndCheck("POST", GRAPHQL_URL, input=query)
+    except Exception as e:
+        # only Github's exceptions have a status. anything else (e.g. a connection error) is passed along as is
+        status = getattr(e, "status", None)
+        if status == 401:
+            print(GRAPHQL_AUTHENTICATION_ERROR_MESSAGE)
+            exit(1)
+        elif status in ERROR_MESSAGE_BY_ERROR_CODE:
+            print(ERROR_MESSAGE_BY_ERROR_CODE[e.status])
+            exit(1)
+        else:
+            raise e
+
+    # the GraphQL API reports most errors with a 200 status and an `errors` list in the body
+    for error in response.get("errors", []):
+        error_code = ERROR_CODE_BY_GRAPHQL_ERROR_TYPE.get(error.get("type"))
+        if error_code is not None:
+            print(ERROR_MESSAGE_BY_ERROR_CODE[error_code])
+            exit(1)
+        else:
+            raise RuntimeError(f"Github GraphQL API error: {error.get('message')}")
+
+    return response["data"]["organization"]["repositories"]
+
+# the query gets every metric at once, so we only skip it if the cache has everything we need: a fresh listing for
+# `metrics` and, if we need them, fresh pull requests counts for every repo
+@profiled("get_repos_with_data")
+def get_repos_with_data(github: Github, organization_name: str, cache: GithubDataCache, metrics: frozenset[Metric] = LISTING_METRICS) -> list[RepoRecord]:
+    cached_repos_or_none = cache.try_get_repos_for_org(organization_name, metrics)
+    if cached_repos_or_none is not None and (Metric.PULL_REQUESTS not in metrics or all(
+        cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS) is not None for repo in cached_repos_or_none
+    )):
+        return cached_repos_or_none
+
+    repos = []
+    after = None
+    while True:
+        page = _request_repositories_page(github, organization_name, after)
+        for node in page["nodes"]:
+            repo = RepoRecord(
+                name=node["name"],
+                full_name=node["nameWithOwner"],
+                stargazers_count=node["stargazerCount"],
+                forks_count=node["forkCount"],
+                updated_at=node["updatedAt"],
+                pushed_at=node["pushedAt"],
+            )
+            # we already have everything we rank on, so we fill the per-repo cache directly and
+            # get_top_repos_by_criteria won't need to make any more requests
+            cache.update_data_for_repo(repo, RepoData(
+                stars_count=repo.stargazers_count,
+                forks_count=repo.forks_count,
+                pull_requests_count=node["pullRequests"]["totalCount"],
+            ))
+            repos.append(repo)
+
+        if not page["pageInfo"]["hasNextPage"]:
+            cache.update_repos_for_org(organization_name, repos)
+            return repos
+        after = page["pageInfo"]["endCursor"]
@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utilities import http_utilities
+
+'''
+This file contains the HTTP archives for `--record` and `--replay`, which let us run a scan again without a network,
+e.g. to reproduce a slow scan or to compare fetch strategies on the same data.
+
+A recording keeps every exchange the run had with Github (the response's status, headers, including the pagination
+links and rate limit headers, and body, along with how long it took) in a sqlite database. Exchanges are indexed by
+their request, which is the method, the URL, a hash of the body (for GraphQL queries), and any conditional headers.
+Bodies are compressed and stored once however many exchanges they came back in. Tokens aren't part of the request key
+and are never stored. The API's base URL is kept too, since pygithub checks that the pagination links point at it.
+
+A replay answers each request with the next recorded exchange for it (repeating the last one if the run asks more
+times than the recording did), so it goes through pygithub, our connection classes, and the rate limit scheduler
+exactly like a live run. With `simulate_latency`, each answer takes as long as the original did.
+'''
+
+HTTP_ARCHIVE_VERSION = 1
+# the request headers that change what Github answers with, which are part of the request key
+CONDITIONAL_HEADER_NAMES = ["If-None-Match", "If-Modified-Since"]
+HTTP_ARCHIVE_VERSION_ERROR_MESSAGE = "ERROR: The recording is from a different version of this tool. Please record it again."
+
+def _get_request_key(verb: str, url: str, input, headers: dict[str, str]) -> str:
+    request_key = f"{verb} {url}"
+    if input is not None:
+        body = input.encode("utf-8") if isinstance(input, str) else input
+        request_key += f" body={hashlib.sha1(body).hexdigest()}"
+    for header_name in CONDITIONAL_HEADER_NAMES:
+        if header_name in headers:
+            request_key += f" {header_name}={headers[header_name]}"
+    return request_key
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # each distinct response body, compressed
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS bodies (
+                digest BLOB PRIMARY KEY,
+                data BLOB NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # the exchanges for each request key, in the order they happened. started_ms is when the request was sent,
+        # relative to the start of the recording
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS exchanges (
+                request_key TEXT NOT NULL,
+                sequence INTEGER NOT NULL,
+                status INTEGER NOT NULL,
+                headers BLOB NOT NULL,
+                body_digest BLOB NOT NULL,
+                started_ms REAL NOT NULL,
+                elapsed_ms REAL NOT NULL,
+                PRIMARY KEY (request_key, sequence)
+            ) WITHOUT ROWID
+        """)
+
+class HttpRecording:
+    def __init__(self, path: str):
+        # a recording always starts from scratch, so that it's only what one run saw
+        if os.path.exists(path):
+            os.remove(path)
+        # the fetch workers record from their own threads, so writes go through a lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        _create_tables(self._connection)
+        with self._connection:
+            self._connection.execute("INSERT INTO metadata (key, value) VALUES ('version', ?)", (str(HTTP_ARCHIVE_VERSION),))
+            self._connection.execute("INSERT INTO metadata (key, value) VALUES ('recorded_time', ?)", (str(time.time()),))
+        self._start_time = time.perf_counter()
+        self._sequence_by_request_key = {}
+        self.exchange_count = 0
+
+    # sends the request with `send_request` and records the exchange. `base_url` is the API's, e.g.
+    # https://api.github.com, which `url` is relative to
+    def send(self, verb: str, base_url: str, url: str, input, headers: dict[str, str], send_request: Callable[[], requests.Response]) -> requests.Response:
+        started_at = time.perf_counter()
+        response = send_request()
+        elapsed_seconds = time.perf_counter() - started_at
+
+        request_key = _get_request_key(verb, url, input, headers)
+        body = response.content
+        digest = hashlib.sha1(body).digest()
+        with self._lock:
+            sequence = self._sequence_by_request_key.get(request_key, 0)
+            self._sequence_by_request_key[request_key] = sequence + 1
+            self._connection.execute("INSERT OR IGNORE INTO metadata (key, value) VALUES ('base_url', ?)", (base_url,))
+            self._connection.execute("INSERT OR IGNORE INTO bodies (digest, data) VALUES (?, ?)", (digest, zlib.compress(body)))
+            self._connection.execute(
+                "INSERT INTO exchanges (request_key, sequence, status, headers, body_digest, started_ms, elapsed_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    request_key,
+                    sequence,
+                    response.status_code,
+                    zlib.compress(json.dumps(list(response.headers.items())).encode("utf-8")),
+                    digest,
+                    (started_at - self._start_time) * 1000,
+                    elapsed_seconds * 1000,
+                ),
+            )
+            self.exchange_count += 1
+        return response
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+class HttpReplay:
+    def __init__(self, path: str, simulate_latency: bool = False):
+        self.path = path
+        self.simulate_latency = simulate_latency
+        if not os.path.exists(path):
+            print(f"ERROR: There's no recording at {path}. Record one with --record first.")
+            exit(1)
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        version_row = self._connection.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()
+        if version_row is None or int(version_row[0]) != HTTP_ARCHIVE_VERSION:
+            print(HTTP_ARCHIVE_VERSION_ERROR_MESSAGE)
+            exit(1)
+        base_url_row = self._connection.execute("SELECT value FROM metadata WHERE key = 'base_url'").fetchone()
+        # a recording without any exchanges could be replayed against any API
+        self.base_url = base_url_row[0] if base_url_row is not None else None
+        self._sequence_by_request_key = {}
+        self.exchange_count = 0
+
+    # answers the request with the next recorded exchange for it, without sending it
+    def send(self, verb: str, base_url: str, url: str, input, headers: dict[str, str], send_request: Callable[[], requests.Response]) -> requests.Response:
+        request_key = _get_request_key(verb, url, input, headers)
+        with self._lock:
+            sequence = self._sequence_by_request_key.get(request_key, 0)
+            self._sequence_by_request_key[request_key] = sequence + 1
+            row = self._connection.execute(
+                """
+                    SELECT status, headers, data, elapsed_ms FROM exchanges
+                    JOIN bodies ON bodies.digest = exchanges.body_digest
+                    WHERE request_key = ? AND sequence <= ?
+                    ORDER BY sequence DESC
+                    LIMIT 1
+                """,
+                (request_key, sequence),
+            ).fetchone()
+            self.exchange_count += 1
+        if row is None:
+            print(f"ERROR: {self.path} doesn't have a response for {verb} {url}. Please record the run again with the same arguments.")
+            exit(1)
+
+        (status, headers, data, elapsed_ms) = row
+        if self.simulate_latency:
+            time.sleep(elapsed_ms / 1000)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(json.loads(zlib.decompress(headers)))
+        response._content = zlib.decompress(data)
+        response.encoding = "utf-8"
+        response.url = url
+        return response
+
+    def close(self) -> None:
+        self._connection.close()
+
+# sends every request through `http_archive` (an HttpRecording or HttpReplay) until the block exits
+@contextmanager
+def use_http_archive(http_archive: HttpRecording | HttpReplay):
+    http_utilities.set_http_archive(http_archive)
+    try:
+        yield http_archive
+    finally:
+        http_utilities.set_http_archive(None)
+        http_archive.close()
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester, RequestsResponse
+from urllib3.util.retry import Retry
+
+from utilities.profiling_utilities import get_profiler
+from utilities.rate_limit_utilities import TokenPool, get_token_pool, set_token_pool
+
+'''
+This file contains the connection classes that pygithub uses to talk to the Github API.
+
+pygithub shares one connection object per client and stashes the pending request on it between
+`request` and `getresponse`, which means two threads issuing requests through the same client can
+clobber each other's request. We keep the pending request per-thread instead so that a single client
+(and its connection pool) can be shared by all of our fetch workers.
+
+Since every request goes through these classes, they're also where we pick which token to send each request with
+(see TokenPool in utilities/rate_limit_utilities.py), run requests past that token's rate limit scheduler, and record
+them for profiling. With `--record` or `--replay`, the requests are also recorded to or answered from an HTTP archive
+(see utilities/http_archive_utilities.py).
+'''
+
+# like pygithub's default retry, we retry server errors up to 10 times
+SERVER_ERROR_RETRY_COUNT = 10
+
+# an HttpRecording or HttpReplay, if any
+_http_archive = None
+
+def set_http_archive(http_archive) -> None:
+    global _http_archive
+    _http_archive = http_archive
+
+def create_server_error_retry() -> Retry:
+    # pygithub's default GithubRetry also retries rate limited 403s, sleeping in whichever worker thread hit the limit
+    # while the others carry on into the same limit. the rate limit scheduler handles those for all of the workers at
+    # once, so we only let urllib3 retry server errors
+    return Retry(
+        total=SERVER_ERROR_RETRY_COUNT,
+        status_forcelist=list(range(500, 600)),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS.union({"GET", "POST"}),
+    )
+
+class _ThreadLocalRequestMixin:
+    def _get_thread_local_state(self) -> threading.local:
+        # connection objects are created lazily by pygithub, so we can't rely on __init__ running before use
+        if "_thread_local_state" not in self.__dict__:
+            self._thread_local_state = threading.local()
+        return self._thread_local_state
+
+    def _get_base_url(self) -> str:
+        # pygithub checks the port in the pagination links against the base URL's, so we leave out the default ones
+        if (self.protocol, self.port) in [("https", 443), ("http", 80)]:
+            return f"{self.protocol}://{self.host}"
+        return f"{self.protocol}://{self.host}:{self.port}"
+
+    def request(self, verb: str, url: str, input, headers: dict[str, str]) -> None:
+        self._get_thread_local_state().pending_request = (verb, url, input, headers)
+
+    def getresponse(self) -> RequestsResponse:
+        (verb, url, input, headers) = self._get_thread_local_state().pending_request
+        token_pool = get_token_pool()
+        attempt = 0
+        while True:
+            (token, scheduler) = token_pool.choose_token(url)
+            if token is not None:
+                headers = {**headers, "Authorization": f"token {token}"}
+            resource = scheduler.wait_for_budget(url)
+            send_request = lambda: self.session.request(
+                verb,
+                f"{self._get_base_url()}{url}",
+                headers=headers,
+                data=input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False,
+            )
+            started_at = time.perf_counter()
+            try:
+                response = send_request() if _http_archive is None else _http_archive.send(verb, self._get_base_url(), url, input, headers, send_request)
+            except Exception:
+                scheduler.record_failure(resource)
+                raise
+            elapsed_seconds = time.perf_counter() - started_at
+            get_profiler().record_request(verb, url, response.status_code, started_at, elapsed_seconds)
+            should_retry = scheduler.record_response(resource, elapsed_seconds, response.status_code, response.headers, response.text, attempt)
+            # a token that's been revoked or has expired shouldn't take the whole run down while we have others
+            if response.status_code == 401 and token_pool.drop_token(token):
+                print(f"\tGithub rejected one of the tokens, so we'll carry on with the other {token_pool.get_token_count()}")
+                continue
+            if not should_retry:
+                return RequestsResponse(response)
+            attempt += 1
+
+class ThreadSafeHTTPRequestsConnectionClass(_ThreadLocalRequestMixin, HTTPRequestsConnectionClass):
+    pass
+
+class ThreadSafeHTTPSRequestsConnectionClass(_ThreadLocalRequestMixin, HTTPSRequestsConnectionClass):
+    pass
+
+# each install starts with fresh schedulers, since the rate limits belong to the client's tokens. `tokens` are sent
+# in place of the client's own token, which is used if there aren't any
+def install_thread_safe_connection_classes(tokens: list[str] | None = None) -> None:
+    set_token_pool(TokenPool(tokens if tokens else [None]))
+    # pygithub's public `injectConnectionClasses` also turns off connection persistence (it's meant for its own
+    # test replay framework), so we swap the classes directly to keep the keep-alive connection pool
+    Requester._Requester__httpConnectionClass = ThreadSafeHTTPRequestsConnectionClass
+    Requester._Requester__httpsConnectionClass = ThreadSafeHTTPSRequestsConnectionClass
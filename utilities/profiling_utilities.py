@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+from functools import wraps
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable
+from urllib.parse import urlparse
+
+'''
+This file contains the instrumentation that tells us where a run spends its time.
+
+Every request goes through the connection classes in utilities/http_utilities.py, which report it here along with its
+status and latency. The cache reports whether each lookup was a hit, a miss, or stale, and the main steps of a run
+(e.g. listing the org's repos, fetching pull requests, loading and saving the cache) are timed as phases.
+
+With `--profile`, the results are written out as JSON or as a Chrome trace (which can be opened in chrome://tracing or
+https://ui.perfetto.dev), and a one line summary is printed at the end of the run.
+'''
+
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+# the entry was there but past its TTL, so we had to revalidate or re-fetch it
+CACHE_STALE = "stale"
+
+JSON_FORMAT = "json"
+CHROME_TRACE_FORMAT = "chrome-trace"
+PROFILE_FORMATS = [JSON_FORMAT, CHROME_TRACE_FORMAT]
+
+# the upper bounds of the latency histogram buckets, with everything slower in a last bucket
+LATENCY_BUCKET_UPPER_BOUNDS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# collapses the org, owner, and repo names in a request path so that we can count requests per endpoint
+def get_endpoint(url: str) -> str:
+    segments = urlparse(url).path.strip("/").split("/")
+    for (index, segment) in enumerate(segments):
+        if segment == "orgs" and index + 1 < len(segments):
+            segments[index + 1] = "{org}"
+            break
+        elif segment == "repos" and index + 2 < len(segments):
+            (segments[index + 1], segments[index + 2]) = ("{owner}", "{repo}")
+            break
+    return "/" + "/".join(segments)
+
+def _get_latency_bucket(latency_ms: float) -> str:
+    for upper_bound in LATENCY_BUCKET_UPPER_BOUNDS_MS:
+        if latency_ms <= upper_bound:
+            return f"<={upper_bound}ms"
+    return f">{LATENCY_BUCKET_UPPER_BOUNDS_MS[-1]}ms"
+
+def _get_percentile(sorted_values: list[float], percentile: float) -> float:
+    # nearest rank
+    return sorted_values[max(math.ceil(percentile / 100 * len(sorted_values)) - 1, 0)]
+
+class Profiler(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self._latencies_ms_by_endpoint = defaultdict(list)
+        self._status_counts_by_endpoint = defaultdict(Counter)
+        self._cache_lookup_counts_by_kind = defaultdict(Counter)
+        self._phase_counts = Counter()
+        self._phase_seconds = Counter()
+        # (name, category, start time, duration, thread id, args) for the trace
+        self._spans = []
+
+    def _record_span(self, name: str, category: str, start_time: float, duration_seconds: float, args: dict | None = None) -> None:
+        self._spans.append((name, category, start_time, duration_seconds, threading.get_ident(), args or {}))
+
+    # `start_time` should come from time.perf_counter
+    def record_request(self, method: str, url: str, status: int, start_time: float, elapsed_seconds: float) -> None:
+        endpoint = get_endpoint(url)
+        with self._lock:
+            self._latencies_ms_by_endpoint[endpoint].append(elapsed_seconds * 1000)
+            self._status_counts_by_endpoint[endpoint][status] += 1
+            self._record_span(f"{method} {endpoint}", "request", start_time, elapsed_seconds, {"url": url, "status": status})
+
+    def record_cache_lookup(self, kind: str, result: str) -> None:
+        with self._lock:
+            self._cache_lookup_counts_by_kind[kind][result] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_seconds = time.perf_counter() - start_time
+            with self._lock:
+                self._phase_counts[name] += 1
+                self._phase_seconds[name] += duration_seconds
+                self._record_span(name, "phase", start_time, duration_seconds)
+
+    def get_request_count(self) -> int:
+        with self._lock:
+            return sum(len(latencies_ms) for latencies_ms in self._latencies_ms_by_endpoint.values())
+
+    # the counts of each result for each kind of lookup since the profiler started
+    def get_cache_lookup_counts(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {kind: {result: counts[result] for result in [CACHE_HIT, CACHE_MISS, CACHE_STALE]} for (kind, counts) in self._cache_lookup_counts_by_kind.items()}
+
+    def get_results(self) -> dict:
+        cache_lookup_counts = self.get_cache_lookup_counts()
+        with self._lock:
+            all_latencies_ms = sorted(latency_ms for latencies_ms in self._latencies_ms_by_endpoint.values() for latency_ms in latencies_ms)
+            requests_by_endpoint = {}
+            for (endpoint, latencies_ms) in self._latencies_ms_by_endpoint.items():
+                sorted_latencies_ms = sorted(latencies_ms)
+                requests_by_endpoint[endpoint] = {
+                    "count": len(latencies_ms),
+                    "status_counts": {str(status): count for (status, count) in sorted(self._status_counts_by_endpoint[endpoint].items())},
+                    "latency_histogram": dict(Counter(_get_latency_bucket(latency_ms) for latency_ms in latencies_ms)),
+                    "p50_ms": _get_percentile(sorted_latencies_ms, 50),
+                    "p95_ms": _get_percentile(sorted_latencies_ms, 95),
+                    "max_ms": sorted_latencies_ms[-1],
+                }
+            return {
+                "wall_seconds": time.perf_counter() - self._start_time,
+                "requests": {
+                    "count": len(all_latencies_ms),
+                    "p50_ms": _get_percentile(all_latencies_ms, 50) if len(all_latencies_ms) > 0 else None,
+                    "p95_ms": _get_percentile(all_latencies_ms, 95) if len(all_latencies_ms) > 0 else None,
+                    "by_endpoint": requests_by_endpoint,
+                },
+                "cache": cache_lookup_counts,
+                # phases can run in parallel (e.g. per-repo fetches), so their total time can add up to more than the
+                # wall time
+                "phases": {name: {"count": self._phase_counts[name], "total_seconds": self._phase_seconds[name]} for name in self._phase_counts},
+            }
+
+    def get_chrome_trace(self) -> dict:
+        results = self.get_results()
+        with self._lock:
+            trace_events = [
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start_time - self._start_time) * 1_000_000,
+                    "dur": duration_seconds * 1_000_000,
+                    "pid": os.getpid(),
+                    "tid": thread_id,
+                    "args": args,
+                }
+                for (name, category, start_time, duration_seconds, thread_id, args) in self._spans
+            ]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": results}
+
+    def write(self, path: str, format: str = JSON_FORMAT) -> None:
+        with open(path, "w") as f:
+            json.dump(self.get_chrome_trace() if format == CHROME_TRACE_FORMAT else self.get_results(), f, indent=2)
+
+    def get_summary(self) -> str:
+        results = self.get_results()
+        requests = results["requests"]
+        summary = f"Profile: {results['wall_seconds']:.2f}s, {requests['count']} request(s)"
+        if requests["count"] > 0:
+            endpoint_counts = ", ".join(f"{endpoint} {endpoint_results['count']}" for (endpoint, endpoint_results) in sorted(requests["by_endpoint"].items(), key=lambda item: -item[1]["count"]))
+            summary += f" ({endpoint_counts}), p50 {requests['p50_ms']:.0f}ms, p95 {requests['p95_ms']:.0f}ms"
+        cache_counts = Counter()
+        for counts in results["cache"].values():
+            cache_counts.update(counts)
+        summary += f", cache {cache_counts[CACHE_HIT]} hit(s)/{cache_counts[CACHE_MISS]} miss(es)/{cache_counts[CACHE_STALE]} stale"
+        if len(results["phases"]) > 0:
+            (slowest_phase, slowest_phase_results) = max(results["phases"].items(), key=lambda item: item[1]["total_seconds"])
+            summary += f", most time in {slowest_phase} ({slowest_phase_results['total_seconds']:.2f}s)"
+        return summary
+
+_profiler = Profiler()
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+# starts recording into a fresh profiler, e.g. at the start of a run
+def start_profiler() -> Profiler:
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+# times each call to the decorated function as a phase
+def profiled(phase_name: str) -> Callable:
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_profiler().phase(phase_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,259 @@
+import json
+import math
+import random
+import threading
+import time
+
+'''
+This file contains the scheduler that keeps our requests within the Github API's rate limits.
+
+Every request goes through the scheduler (see utilities/http_utilities.py), so it sees the rate limit headers on
+every response. When we've used up the budget for the current window, it pauses all of the fetch workers until the
+window resets rather than letting them run into 403s. When Github tells us to slow down anyway (e.g. the secondary
+rate limit it applies to bursts of concurrent requests), it pauses all of the workers, backs off, and retries.
+
+Each token has its own rate limits, so with several tokens there's a scheduler per token, and the token pool sends
+each request with whichever token has the most budget left.
+'''
+
+# Github keeps separate budgets for e.g. the REST API, the GraphQL API, and search
+CORE_RESOURCE = "core"
+GRAPHQL_RESOURCE = "graphql"
+SEARCH_RESOURCE = "search"
+
+RATE_LIMITED_STATUSES = {403, 429}
+MAX_RATE_LIMIT_RETRIES = 5
+# Github suggests waiting at least a minute after a secondary rate limit that doesn't come with a Retry-After
+SECONDARY_RATE_LIMIT_BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 15 * 60
+BACKOFF_JITTER_FRACTION = 0.5
+# so that the workers don't all resume at the same instant after a pause
+RESUME_JITTER_SECONDS = 1
+# Github's reset times are in whole seconds, and it's not clear when in that second the reset happens
+RESET_PADDING_SECONDS = 1
+RATE_LIMIT_WINDOW_SECONDS = 60 * 60
+# until we've timed some requests, we assume they take about this long
+DEFAULT_REQUEST_SECONDS = 0.3
+
+def get_resource(url: str) -> str:
+    path = url.split("?")[0]
+    if path.endswith("/graphql"):
+        return GRAPHQL_RESOURCE
+    elif "/search/" in path:
+        return SEARCH_RESOURCE
+    return CORE_RESOURCE
+
+class _RateLimitBudget(object):
+    def __init__(self):
+        # these stay None until Github tells us what they are
+        self.limit = None
+        self.remaining = None
+        self.reset_time = None
+        # requests we've sent but haven't heard back about yet, which will come out of `remaining`
+        self.in_flight_count = 0
+
+    def get_available_count(self) -> int | None:
+        return self.remaining - self.in_flight_count if self.remaining is not None else None
+
+    def update(self, limit: int, remaining: int, reset_time: int) -> None:
+        # responses can come back out of order, so within a window we go with the lowest remaining count we've seen
+        if self.reset_time == reset_time and self.remaining is not None:
+            remaining = min(remaining, self.remaining)
+        (self.limit, self.remaining, self.reset_time) = (limit, remaining, reset_time)
+
+    def forget_window(self) -> None:
+        (self.limit, self.remaining, self.reset_time) = (None, None, None)
+
+class RateLimitScheduler(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._budgets_by_resource = {}
+        # pauses from secondary rate limits apply to every resource
+        self._paused_until = 0.0
+        self._request_count = 0
+        self._total_request_seconds = 0.0
+
+    def _get_budget(self, resource: str) -> _RateLimitBudget:
+        if resource not in self._budgets_by_resource:
+            self._budgets_by_resource[resource] = _RateLimitBudget()
+        return self._budgets_by_resource[resource]
+
+    # blocks until we can send a request to `url` without going over the rate limit, and returns its resource.
+    # every call needs to be followed by `record_response` or `record_failure`.
+    def wait_for_budget(self, url: str) -> str:
+        resource = get_resource(url)
+        with self._lock:
+            now = time.time()
+            budget = self._get_budget(resource)
+            wait_seconds = 0.0
+            if self._paused_until > now:
+                wait_seconds = self._paused_until - now + random.uniform(0, RESUME_JITTER_SECONDS)
+            if budget.reset_time is not None and budget.reset_time <= now:
+                budget.forget_window()
+            elif budget.get_available_count() is not None and budget.get_available_count() <= 0:
+                reset_wait_seconds = budget.reset_time - now + RESET_PADDING_SECONDS + random.uniform(0, RESUME_JITTER_SECONDS)
+                if wait_seconds == 0:
+                    print(f"\tUsed up the Github {resource} rate limit, pausing for {reset_wait_seconds:.0f}s until it resets...")
+                wait_seconds = max(wait_seconds, reset_wait_seconds)
+
+        # we only wait once rather than re-checking in a loop. if Github still isn't ready for us, it'll tell us so
+        # and we'll back off from there
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+        with self._lock:
+            self._get_budget(resource).in_flight_count += 1
+        return resource
+
+    def record_failure(self, resource: str) -> None:
+        with self._lock:
+            self._get_budget(resource).in_flight_count -= 1
+
+    # returns whether the request was rate limited and should be retried. `attempt` is the number of times we've
+    # already retried this request.
+    def record_response(self, resource: str, elapsed_seconds: float, status: int, headers: dict[str, str], body: str, attempt: int) -> bool:
+        with self._lock:
+            now = time.time()
+            budget = self._get_budget(resource)
+            budget.in_flight_count -= 1
+            self._request_count += 1
+            self._total_request_seconds += elapsed_seconds
+            if "x-ratelimit-remaining" in headers and "x-ratelimit-reset" in headers:
+                budget.update(
+                    int(headers.get("x-ratelimit-limit", headers["x-ratelimit-remaining"])),
+                    int(headers["x-ratelimit-remaining"]),
+                    int(headers["x-ratelimit-reset"]),
+                )
+
+            if not _is_rate_limited(status, headers, body):
+                return False
+            if attempt >= MAX_RATE_LIMIT_RETRIES:
+                # let the caller deal with the error response
+                return False
+
+            if "retry-after" in headers:
+                pause_seconds = float(headers["retry-after"])
+            elif headers.get("x-ratelimit-remaining") == "0":
+                # `wait_for_budget` will hold off until the window resets
+                return True
+            else:
+                backoff_seconds = min(SECONDARY_RATE_LIMIT_BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS)
+                pause_seconds = backoff_seconds * (1 + random.uniform(0, BACKOFF_JITTER_FRACTION))
+            if now + pause_seconds > self._paused_until:
+                print(f"\tHit a Github secondary rate limit, pausing for {pause_seconds:.0f}s...")
+                self._paused_until = now + pause_seconds
+            return True
+
+    def is_paused(self) -> bool:
+        with self._lock:
+            return self._paused_until > time.time()
+
+    def get_in_flight_count(self, resource: str = CORE_RESOURCE) -> int:
+        with self._lock:
+            return self._get_budget(resource).in_flight_count
+
+    def get_remaining_count(self, resource: str = CORE_RESOURCE) -> int | None:
+        with self._lock:
+            budget = self._get_budget(resource)
+            if budget.reset_time is not None and budget.reset_time <= time.time():
+                return None
+            return budget.get_available_count()
+
+    def get_reset_time(self, resource: str = CORE_RESOURCE) -> int | None:
+        with self._lock:
+            return self._get_budget(resource).reset_time
+
+    # a rough estimate of how long `request_count` requests will take with `concurrency` workers, based on how long
+    # our requests have taken so far and how much of the rate limit budget we have left
+    def get_projected_seconds(self, request_count: int, concurrency: int, resource: str = CORE_RESOURCE) -> float:
+        with self._lock:
+            now = time.time()
+            average_request_seconds = self._total_request_seconds / self._request_count if self._request_count > 0 else DEFAULT_REQUEST_SECONDS
+            projected_seconds = math.ceil(request_count / concurrency) * average_request_seconds
+
+            budget = self._get_budget(resource)
+            available_count = budget.get_available_count()
+            if available_count is not None and budget.reset_time > now and request_count > available_count:
+                # we'll have to sit out the rest of this window, plus a full window for every `limit` requests after that
+                window_count = math.ceil((request_count - available_count) / max(budget.limit, 1))
+                projected_seconds += budget.reset_time - now + (window_count - 1) * RATE_LIMIT_WINDOW_SECONDS
+            return projected_seconds
+
+# the tokens we can send requests with, each with its own scheduler to keep track of its rate limits. None stands for
+# not sending a token at all
+class TokenPool(object):
+    def __init__(self, tokens: list[str | None]):
+        self._lock = threading.Lock()
+        self._schedulers_by_token = {token: RateLimitScheduler() for token in dict.fromkeys(tokens)}
+
+    def get_token_count(self) -> int:
+        with self._lock:
+            return len(self._schedulers_by_token)
+
+    def _get_schedulers(self) -> list[RateLimitScheduler]:
+        with self._lock:
+            return list(self._schedulers_by_token.values())
+
+    # picks the token with the most budget left for `url`'s resource. a token whose window we don't know about yet
+    # (e.g. because we haven't used it) counts as having the most, and ties go to the one with the fewest requests in
+    # flight. tokens that are paused after a secondary rate limit go last
+    def choose_token(self, url: str) -> tuple[str | None, RateLimitScheduler]:
+        resource = get_resource(url)
+        def get_priority(token_and_scheduler: tuple[str | None, RateLimitScheduler]) -> tuple[bool, float, int]:
+            scheduler = token_and_scheduler[1]
+            remaining_count = scheduler.get_remaining_count(resource)
+            return (not scheduler.is_paused(), math.inf if remaining_count is None else remaining_count, -scheduler.get_in_flight_count(resource))
+        with self._lock:
+            tokens_and_schedulers = list(self._schedulers_by_token.items())
+        return max(tokens_and_schedulers, key=get_priority)
+
+    # drops a token that Github rejected, and returns whether there are any left to carry on with. we hold on to the
+    # last one so that the request fails with its error like it would with a single token
+    def drop_token(self, token: str | None) -> bool:
+        with self._lock:
+            if len(self._schedulers_by_token) <= 1:
+                return False
+            self._schedulers_by_token.pop(token, None)
+            return True
+
+    # the rest mirror the scheduler's, across all of the tokens
+
+    def get_remaining_count(self, resource: str = CORE_RESOURCE) -> int | None:
+        remaining_counts = [scheduler.get_remaining_count(resource) for scheduler in self._get_schedulers()]
+        return None if None in remaining_counts else sum(remaining_counts)
+
+    def get_reset_time(self, resource: str = CORE_RESOURCE) -> int | None:
+        reset_times = [reset_time for reset_time in (scheduler.get_reset_time(resource) for scheduler in self._get_schedulers()) if reset_time is not None]
+        return min(reset_times) if len(reset_times) > 0 else None
+
+    def get_projected_seconds(self, request_count: int, concurrency: int, resource: str = CORE_RESOURCE) -> float:
+        # the requests (and workers) are spread evenly across the tokens, so we wait on whichever token takes longest
+        # with its share
+        schedulers = self._get_schedulers()
+        return max(scheduler.get_projected_seconds(math.ceil(request_count / len(schedulers)), concurrency / len(schedulers), resource) for scheduler in schedulers)
+
+# the pool that every request is sent with (see install_thread_safe_connection_classes in utilities/http_utilities.py).
+# it's kept here rather than there so that asking it for a projection doesn't import pygithub
+_token_pool = TokenPool([None])
+
+def get_token_pool() -> TokenPool:
+    return _token_pool
+
+def set_token_pool(token_pool: TokenPool) -> None:
+    global _token_pool
+    _token_pool = token_pool
+
+def _is_rate_limited(status: int, headers: dict[str, str], body: str) -> bool:
+    if status not in RATE_LIMITED_STATUSES:
+        return False
+    if "retry-after" in headers or headers.get("x-ratelimit-remaining") == "0":
+        return True
+    # otherwise a 403 could also mean that we don't have access, so we check the message
+    try:
+        message = json.loads(body).get("message")
+    except Exception:
+        return False
+    # this only comes up on an error response, which will have gone through pygithub anyway
+    from github.Requester import Requester
+
+    return isinstance(message, str) and Requester.isRateLimitError(message)
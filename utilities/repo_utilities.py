@@ -1,15 +1,33 @@
-import heapq
+from __future__ import annotations
 
-from github import PaginatedList, Repository
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import heapq
+import math
+from typing import Callable, Iterable, Iterator, TYPE_CHECKING
 
 from models.criteria import Criteria
+from models.metric import LISTING_METRICS, METRICS_BY_CRITERIA, Metric
 from models.repo_data import RepoData
+from models.repo_metric_table import RepoMetricTable
+from models.repo_record import RepoRecord
+from models.validators import Validators
 from utilities.cache_utilities import GithubDataCache
 from utilities.github_utilities import get_stars_count, get_forks_count, get_pull_requests_count
+from utilities.profiling_utilities import get_profiler
+from utilities.rate_limit_utilities import get_token_pool
+
+# see utilities/github_utilities.py
+if TYPE_CHECKING:
+    from github import Github
+
+DEFAULT_CONCURRENCY = 8
 
 # define a class with a custom comparator so we can define the sort order that the heapq methods use
 class RepoWithValue(object):
-    def __init__(self, value: int, repo: Repository.Repository):
+    __slots__ = ("value", "name", "repo")
+
+    def __init__(self, value: int, repo: RepoRecord):
         self.value = value
         self.name = repo.name
         self.repo = repo
@@ -17,36 +35,274 @@ class RepoWithValue(object):
     def __lt__(self, other):
         return self.value < other.value or self.value == other.value and self.name > other.name
 
-def _get_value_for_criteria(repo: Repository.Repository, criteria: Criteria, cache: GithubDataCache) -> int | float:
-    repo_data = cache.try_get_data_for_repo(repo)
-    
-    if repo_data is None:
+def _create_metric_table(repos: list[RepoRecord], pull_requests_counts: list[int | None] | None = None) -> RepoMetricTable:
+    return RepoMetricTable(
+        repos,
+        stars_counts = (get_stars_count(repo) for repo in repos),
+        forks_counts = (get_forks_count(repo) for repo in repos),
+        pull_requests_counts = pull_requests_counts,
+    )
+
+# the highest value the repo could have for a criteria that needs its pull requests count. the open issues count from
+# the listing includes the open pull requests, so plugging it in for the pull requests count gives a value that the
+# repo can't beat (both criteria only go up with the pull requests count)
+def _get_upper_bound(repo: RepoRecord, criteria: Criteria) -> int | float:
+    if repo.open_issues_count is None:
+        return math.inf
+    return RepoData(
+        stars_count = get_stars_count(repo),
+        forks_count = get_forks_count(repo),
+        pull_requests_count = repo.open_issues_count,
+    ).get_data_for_criteria(criteria)
+
+# the open issues counts are only upper bounds on the pull requests counts as of when the listing was fetched, and a
+# cached listing can stay fresh for longer than the pull requests counts do (see DEFAULT_TIME_TO_LIVE_SECONDS_BY_METRIC).
+# so we only skip repos by their bounds if their listing was checked within the pull requests TTL, e.g. during this run.
+# repos that aren't from a cached listing (e.g. from search) were fetched during this run. the listing is cached under
+# the org name as it was passed in, which can differ in case from the org in the repos' full names
+def _are_upper_bounds_fresh(organization_name: str | None, cache: GithubDataCache) -> bool:
+    return organization_name is None or cache.is_listing_fresh_for_metric(organization_name, Metric.PULL_REQUESTS)
+
+# `stale_count_and_validators` is the pull requests count we had cached for the repo before it went stale, if anything,
+# so that we can ask Github whether it has changed rather than fetching it again
+def _fetch_data_for_repo(github: Github, repo: RepoRecord, stale_count_and_validators: tuple[int, Validators | None] | None) -> tuple[RepoData, Validators | None]:
+    # stars and forks come from the listing, so the pull requests are the only thing we need a request for
+    (cached_pull_requests_count, validators) = stale_count_and_validators or (None, None)
+    if cached_pull_requests_count is None:
         print(f"\tFetching data for {repo.name}")
-        repo_data = RepoData(
+    else:
+        print(f"\tRevalidating data for {repo.name}")
+    (pull_requests_count, validators) = get_pull_requests_count(github, repo, cached_pull_requests_count, validators)
+    return (
+        RepoData(
             stars_count = get_stars_count(repo),
             forks_count = get_forks_count(repo),
-            pull_requests_count = get_pull_requests_count(repo),
+            pull_requests_count = pull_requests_count,
+        ),
+        validators,
+    )
+
+# yields (repo, data, validators) in the order the fetches finish rather than the order of `repos`. repos are handed
+# to the workers in order as they free up, and once `should_fetch` turns down a repo we don't start it or any after it.
+# a repo that `try_claim` turns down is skipped, but we carry on with the ones after it.
+def _fetch_data_for_repos(github: Github, repos: list[tuple[RepoRecord, tuple[int, Validators | None] | None]], concurrency: int, should_fetch: Callable[[RepoRecord], bool] | None = None, try_claim: Callable[[RepoRecord], bool] | None = None) -> Iterator[tuple[RepoRecord, RepoData, Validators | None]]:
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    remaining_repos = iter(repos)
+    futures_to_repos = {}
+
+    def submit_next_repo() -> bool:
+        for (repo, stale_count_and_validators) in remaining_repos:
+            if should_fetch is not None and not should_fetch(repo):
+                return False
+            if try_claim is not None and not try_claim(repo):
+                continue
+            futures_to_repos[executor.submit(_fetch_data_for_repo, github, repo, stale_count_and_validators)] = repo
+            return True
+        return False
+
+    try:
+        has_more_repos = True
+        while has_more_repos and len(futures_to_repos) < concurrency:
+            has_more_repos = submit_next_repo()
+        while len(futures_to_repos) > 0:
+            (done_futures, _) = wait(futures_to_repos, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                yield (futures_to_repos.pop(future), *future.result())
+                if has_more_repos:
+                    has_more_repos = submit_next_repo()
+    finally:
+        # if a fetch failed (e.g. the github utilities exit on rate limiting), don't start any of the queued fetches
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# fetches the pull requests count for each of `repos_to_fetch`, caches it, and passes the repo's data to `add_repo_data`
+# as each one finishes. once `should_fetch` turns down a repo, we don't fetch it or any after it
+def _fetch_and_cache_data_for_repos(github: Github, repos_to_fetch: list[tuple[RepoRecord, tuple[int, Validators | None] | None]], concurrency: int, cache: GithubDataCache, add_repo_data: Callable[[RepoRecord, RepoData], None], should_fetch: Callable[[RepoRecord], bool] | None = None) -> None:
+    # another run sharing the cache (e.g. in another process) may already be fetching some of these repos. rather than
+    # fetching them too, we set them aside and wait for its results once we're done with the rest
+    repos_fetched_elsewhere = []
+    def try_claim(repo: RepoRecord) -> bool:
+        if cache.try_claim_fetch(repo, Metric.PULL_REQUESTS):
+            return True
+        repos_fetched_elsewhere.append(repo)
+        return False
+
+    with get_profiler().phase("fetch"):
+        for repo, repo_data, validators in _fetch_data_for_repos(github, repos_to_fetch, concurrency, should_fetch, try_claim):
+            cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, repo_data.pull_requests_count, validators)
+            cache.release_fetch(repo, Metric.PULL_REQUESTS)
+            add_repo_data(repo, repo_data)
+
+    if len(repos_fetched_elsewhere) > 0:
+        print(f"\tWaiting for another run that's fetching data for {len(repos_fetched_elsewhere)} repo(s)")
+    repos_to_fetch_again = []
+    with get_profiler().phase("wait_for_other_runs"):
+        # these are in the same order as `repos_to_fetch`, so we can stop at the first one that we shouldn't fetch
+        for repo in repos_fetched_elsewhere:
+            if should_fetch is not None and not should_fetch(repo):
+                break
+            pull_requests_count = cache.wait_for_fetch(repo, Metric.PULL_REQUESTS)
+            if pull_requests_count is not None:
+                add_repo_data(repo, RepoData(stars_count=get_stars_count(repo), forks_count=get_forks_count(repo), pull_requests_count=pull_requests_count))
+            else:
+                # the other run didn't get it (e.g. because it errored out), so we fetch it ourselves
+                repos_to_fetch_again.append((repo, cache.try_get_metric_and_validators_for_repo(repo, Metric.PULL_REQUESTS)))
+    with get_profiler().phase("fetch"):
+        for repo, repo_data, validators in _fetch_data_for_repos(github, repos_to_fetch_again, concurrency, should_fetch):
+            cache.update_metric_for_repo(repo, Metric.PULL_REQUESTS, repo_data.pull_requests_count, validators)
+            add_repo_data(repo, repo_data)
+
+def _print_projection(repos_to_fetch: list[tuple[RepoRecord, tuple[int, Validators | None] | None]], concurrency: int) -> None:
+    # a fetch is 2 requests (the count and the validators for next time), and a revalidation is 1 request if nothing
+    # changed (or 2 if it did). we may also skip repos that can't make the top n, so this is only a rough estimate
+    request_count = sum(1 if stale_count_and_validators is not None and stale_count_and_validators[1] is not None else 2 for (_, stale_count_and_validators) in repos_to_fetch)
+    token_pool = get_token_pool()
+    print(f"\tProjected to make up to ~{request_count} request(s), taking up to ~{token_pool.get_projected_seconds(request_count, concurrency):.0f}s")
+    remaining_count = token_pool.get_remaining_count()
+    if remaining_count is not None and request_count > remaining_count:
+        reset_time = datetime.fromtimestamp(token_pool.get_reset_time()).strftime("%H:%M:%S")
+        print(f"\tThat's more than the {remaining_count} request(s) left in the current rate limit window, so we'll pause when we run out until it resets at {reset_time}")
+
+def _push_to_top_n(top_repos_with_value: list[RepoWithValue], repo_with_value: RepoWithValue, n: int) -> None:
+    if len(top_repos_with_value) < n:
+        # if we have fewer than n items in our top_repos list, add this repo in
+        heapq.heappush(top_repos_with_value, repo_with_value)
+    else:
+        # if we have more than n items, we check if this repo has a higher value than the 
+        # smallest (value, repo) pair currently in our top_repos heap. if it does, then 
+        # remove the smallest value and push the new one onto our heap
+        min_repo_with_value = top_repos_with_value[0]
+        if repo_with_value > min_repo_with_value:
+            heapq.heapreplace(top_repos_with_value, repo_with_value)
+
+# ranks the repos by a growth criteria (e.g. stars_growth), with `growths` lining up with `repos`. the growth comes
+# from the snapshot store (see utilities/snapshot_utilities.py), so this doesn't need any requests either
+def get_top_repos_by_growth(repos: list[RepoRecord], growths: list[int], n: int, criteria: Criteria) -> list[RepoWithValue]:
+    with get_profiler().phase("rank"):
+        table = RepoMetricTable(
+            repos,
+            stars_counts = (get_stars_count(repo) for repo in repos),
+            forks_counts = (get_forks_count(repo) for repo in repos),
+            growths_by_criteria = {criteria: growths},
         )
-        cache.update_data_for_repo(repo, repo_data)
-    
-    return repo_data.get_data_for_criteria(criteria)
+        return [RepoWithValue(value, repo) for (value, repo) in table.get_top_n(n, criteria)]
 
-def get_top_repos_by_criteria(repos: PaginatedList.PaginatedList[Repository.Repository], n: int, criteria: Criteria, cache: GithubDataCache) -> list[Repository.Repository]:
-    top_repos_with_value = []
+# for --stale-ok: ranks the repos with whatever pull requests counts we have cached that are at most `max_age_seconds`
+# old, without any requests. returns None if that can't give a complete answer, i.e. a repo we don't have a count for
+# could still make the top n. otherwise returns the top n along with how many of the counts it used were stale
+def try_get_top_repos_from_cache(repos: list[RepoRecord], n: int, criteria: Criteria, cache: GithubDataCache, max_age_seconds: int) -> tuple[list[RepoWithValue], int] | None:
+    if METRICS_BY_CRITERIA[criteria] <= LISTING_METRICS:
+        with get_profiler().phase("rank"):
+            return ([RepoWithValue(value, repo) for (value, repo) in _create_metric_table(repos).get_top_n(n, criteria)], 0)
+
+    pull_requests_counts = []
+    stale_count = 0
+    with get_profiler().phase("read_cache"):
+        for repo in repos:
+            cached_count = cache.try_get_stale_ok_metric_for_repo(repo, Metric.PULL_REQUESTS, max_age_seconds)
+            stale_count += cached_count is not None and cached_count[1]
+            pull_requests_counts.append(cached_count[0] if cached_count is not None else None)
+
+    with get_profiler().phase("rank"):
+        top_repos_with_value = [RepoWithValue(value, repo) for (value, repo) in _create_metric_table(repos, pull_requests_counts).get_top_n(n, criteria)]
+        heapq.heapify(top_repos_with_value)
+        for (repo, pull_requests_count) in zip(repos, pull_requests_counts):
+            if pull_requests_count is None and (len(top_repos_with_value) < n or RepoWithValue(_get_upper_bound(repo, criteria), repo) > top_repos_with_value[0]):
+                return None
+    return (heapq.nlargest(n, top_repos_with_value), stale_count)
+
+# the github client is only used to fetch data for repos that aren't cached. with `incremental`, repos whose cached
+# data is stale but that haven't changed since we fetched it (according to their timestamps in `repos`) reuse it
+# rather than being revalidated. `organization_name` is the org that `repos` was listed for, if it came from the cache
+def get_top_repos_by_criteria(repos: list[RepoRecord], n: int, criteria: Criteria, cache: GithubDataCache, concurrency: int = DEFAULT_CONCURRENCY, github: Github | None = None, incremental: bool = False, organization_name: str | None = None) -> list[RepoWithValue]:
+    # criteria that only need the listing's counts don't need any per-repo requests
+    if METRICS_BY_CRITERIA[criteria] <= LISTING_METRICS:
+        with get_profiler().phase("rank"):
+            return [RepoWithValue(value, repo) for (value, repo) in _create_metric_table(repos).get_top_n(n, criteria)]
+
+    # the pull requests count is the only metric that isn't in the listing, so repos with a fresh cached count go
+    # straight onto the heap, and we only hand the cache misses to the fetch workers (along with any stale count we
+    # have for them, since the workers can't use the cache from their threads)
+    repos_to_fetch = []
+    pull_requests_counts = []
+    unchanged_count = 0
+    with get_profiler().phase("read_cache"):
+        for repo in repos:
+            pull_requests_count = cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS)
+            if pull_requests_count is None and incremental:
+                pull_requests_count = cache.try_get_unchanged_metric_for_repo(repo, Metric.PULL_REQUESTS)
+                unchanged_count += pull_requests_count is not None
+            if pull_requests_count is None:
+                repos_to_fetch.append((repo, cache.try_get_metric_and_validators_for_repo(repo, Metric.PULL_REQUESTS)))
+            pull_requests_counts.append(pull_requests_count)
+
+    # the top n of the cached repos is all we need to start the heap with, since none of the others can make it in
+    with get_profiler().phase("rank"):
+        top_repos_with_value = [RepoWithValue(value, repo) for (value, repo) in _create_metric_table(repos, pull_requests_counts).get_top_n(n, criteria)]
+        heapq.heapify(top_repos_with_value)
+
+    if unchanged_count > 0:
+        print(f"\tReusing cached data for {unchanged_count} repo(s) that haven't changed since it was fetched")
+    if len(repos_to_fetch) > 0:
+        _print_projection(repos_to_fetch, concurrency)
 
-    for repo in repos:
-        value = _get_value_for_criteria(repo, criteria, cache)
-        repo_with_value = RepoWithValue(value, repo)
-        if len(top_repos_with_value) < n:
-            # if we have fewer than n items in our top_repos list, add this repo in
-            heapq.heappush(top_repos_with_value, repo_with_value)
-        else:
-            # if we have more than n items, we check if this repo has a higher value than the 
-            # smallest (value, repo) pair currently in our top_repos heap. if it does, then 
-            # remove the smallest value and push the new one onto our heap
-            min_repo_with_value = top_repos_with_value[0]
-            if repo_with_value > min_repo_with_value:
-                heapq.heapreplace(top_repos_with_value, repo_with_value)
+    # we fetch the repos that could rank the highest first. once the top n is full, a repo whose upper bound can't beat
+    # the nth repo can't make it in, and since the rest of the repos have lower bounds, neither can any of them. if the
+    # bounds are older than the pull requests TTL, a repo could have outgrown its bound, so we fetch all of them
+    upper_bounds_are_fresh = _are_upper_bounds_fresh(organization_name, cache)
+    repos_to_fetch.sort(key=lambda repo_to_fetch: RepoWithValue(_get_upper_bound(repo_to_fetch[0], criteria), repo_to_fetch[0]), reverse=True)
+    def could_make_top_n(repo: RepoRecord) -> bool:
+        return not upper_bounds_are_fresh or len(top_repos_with_value) < n or RepoWithValue(_get_upper_bound(repo, criteria), repo) > top_repos_with_value[0]
+
+    # results are fed into the heap as they finish. since RepoWithValue breaks ties by name, the final
+    # top n doesn't depend on the order in which the fetches complete
+    fetched_count = 0
+    def add_repo_data(repo: RepoRecord, repo_data: RepoData) -> None:
+        nonlocal fetched_count
+        fetched_count += 1
+        _push_to_top_n(top_repos_with_value, RepoWithValue(repo_data.get_data_for_criteria(criteria), repo), n)
+
+    _fetch_and_cache_data_for_repos(github, repos_to_fetch, concurrency, cache, add_repo_data, could_make_top_n)
+    if fetched_count < len(repos_to_fetch):
+        print(f"\tSkipped fetching data for {len(repos_to_fetch) - fetched_count} repo(s) that couldn't make the top {n}")
     
     # We use heapq.nlargest to sort the heap in order of largest to smallest
-    return heapq.nlargest(n, top_repos_with_value)
\ No newline at end of file
+    return heapq.nlargest(n, top_repos_with_value)
+
+# for --export: passes every repo's data to `write` as soon as we have it (the ones with a fresh cached pull requests
+# count first, then the rest as their fetches finish) and returns the top n. unlike get_top_repos_by_criteria, no repo is
+# skipped, and the top n is all that's held on to
+def export_data_for_repos(repos: list[RepoRecord], n: int, criteria: Criteria, cache: GithubDataCache, write: Callable[[RepoRecord, RepoData], None], concurrency: int = DEFAULT_CONCURRENCY, github: Github | None = None, incremental: bool = False) -> list[RepoWithValue]:
+    top_repos_with_value = []
+    def add_repo_data(repo: RepoRecord, repo_data: RepoData) -> None:
+        write(repo, repo_data)
+        _push_to_top_n(top_repos_with_value, RepoWithValue(repo_data.get_data_for_criteria(criteria), repo), n)
+
+    repos_to_fetch = []
+    with get_profiler().phase("export_cached"):
+        for repo in repos:
+            pull_requests_count = cache.try_get_metric_for_repo(repo, Metric.PULL_REQUESTS)
+            if pull_requests_count is None and incremental:
+                pull_requests_count = cache.try_get_unchanged_metric_for_repo(repo, Metric.PULL_REQUESTS)
+            if pull_requests_count is None:
+                repos_to_fetch.append((repo, cache.try_get_metric_and_validators_for_repo(repo, Metric.PULL_REQUESTS)))
+            else:
+                add_repo_data(repo, RepoData(stars_count=get_stars_count(repo), forks_count=get_forks_count(repo), pull_requests_count=pull_requests_count))
+
+    if len(repos_to_fetch) > 0:
+        _print_projection(repos_to_fetch, concurrency)
+    _fetch_and_cache_data_for_repos(github, repos_to_fetch, concurrency, cache, add_repo_data)
+    return heapq.nlargest(n, top_repos_with_value)
+
+# for --export --from-cache: the same as export_data_for_repos, but with whatever is cached (however old it is) and
+# without any requests. repos we don't have a pull requests count for are still written, but can't be ranked by a
+# criteria that needs it
+def export_cached_data_for_repos(repos_with_pull_requests_count: Iterable[tuple[RepoRecord, int | None]], n: int, criteria: Criteria, write: Callable[[RepoRecord, RepoData], None]) -> list[RepoWithValue]:
+    needs_pull_requests_count = not METRICS_BY_CRITERIA[criteria] <= LISTING_METRICS
+    top_repos_with_value = []
+    with get_profiler().phase("export_cached"):
+        for (repo, pull_requests_count) in repos_with_pull_requests_count:
+            repo_data = RepoData(stars_count=get_stars_count(repo), forks_count=get_forks_count(repo), pull_requests_count=pull_requests_count)
+            write(repo, repo_data)
+            if pull_requests_count is not None or not needs_pull_requests_count:
+                _push_to_top_n(top_repos_with_value, RepoWithValue(repo_data.get_data_for_criteria(criteria), repo), n)
+    return heapq.nlargest(n, top_repos_with_value)
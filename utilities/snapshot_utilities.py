@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+from typing import Iterable
+
+from models.metric import Metric
+from models.repo_record import RepoRecord
+from utilities.cache_utilities import BUSY_TIMEOUT_SECONDS, CACHE_DIRECTORY, GithubDataCache
+from utilities.github_utilities import get_forks_count, get_stars_count
+from utilities.profiling_utilities import get_profiler
+
+'''
+This file contains the snapshot store, which keeps the history of each repo's metrics so that we can rank repos by how
+much they've grown (e.g. `-c stars_growth`) without any requests.
+
+Each time we scan an org, we append what we saw to a series per repo and per metric. A series is stored as one blob
+of (seconds since the previous sample, change since the previous sample) pairs, encoded as zigzag varints, and we only
+append a sample when the value changes. So a repo that didn't change since the last scan costs nothing, and one that
+did usually costs a few bytes. The series' latest time and value are kept next to the blob, so appending doesn't need
+to decode it.
+
+The store lives in its own database next to the cache rather than in the cache itself. The cache gets cleared,
+compacted, and thrown away when its format changes, but the history can't be fetched again.
+'''
+
+SNAPSHOT_FILE = os.path.join(CACHE_DIRECTORY, "snapshots.sqlite3")
+# growth windows are measured in days, so scans closer together than this don't add anything worth the time it takes
+# to record them
+SNAPSHOT_INTERVAL_SECONDS = 60 * 60
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def _encode_varints(values: Iterable[int]) -> bytes:
+    encoded = bytearray()
+    for value in values:
+        # zigzag, so that small decreases (e.g. a repo losing a star) stay small too
+        value = value * 2 if value >= 0 else -value * 2 - 1
+        while value >= 0x80:
+            encoded.append((value & 0x7F) | 0x80)
+            value >>= 7
+        encoded.append(value)
+    return bytes(encoded)
+
+def _decode_varints(encoded: bytes) -> list[int]:
+    values = []
+    (value, shift) = (0, 0)
+    for byte in encoded:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value // 2 if value % 2 == 0 else -(value + 1) // 2)
+        (value, shift) = (0, 0)
+    return values
+
+# returns the (time, value) samples in a series, oldest first
+def _decode_samples(encoded: bytes) -> list[tuple[int, int]]:
+    samples = []
+    (sample_time, value) = (0, 0)
+    deltas = _decode_varints(encoded)
+    for index in range(0, len(deltas), 2):
+        sample_time += deltas[index]
+        value += deltas[index + 1]
+        samples.append((sample_time, value))
+    return samples
+
+class SnapshotStore:
+    # like the cache, the store only lives in memory by default. see get_snapshot_store for the on-disk store
+    def __init__(self, database_path: str = ":memory:"):
+        self._connection = sqlite3.connect(database_path, timeout=BUSY_TIMEOUT_SECONDS)
+        if database_path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    organization_name TEXT NOT NULL,
+                    scan_time INTEGER NOT NULL,
+                    PRIMARY KEY (organization_name, scan_time)
+                )
+            """)
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS metric_series (
+                    organization_name TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    repo_full_name TEXT NOT NULL,
+                    last_time INTEGER NOT NULL,
+                    last_value INTEGER NOT NULL,
+                    samples BLOB NOT NULL,
+                    PRIMARY KEY (organization_name, metric, repo_full_name)
+                ) WITHOUT ROWID
+            """)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get_last_scan_time(self, organization_name: str) -> int | None:
+        return self._connection.execute("SELECT MAX(scan_time) FROM scans WHERE organization_name = ?", (organization_name,)).fetchone()[0]
+
+    def get_first_scan_time(self, organization_name: str) -> int | None:
+        return self._connection.execute("SELECT MIN(scan_time) FROM scans WHERE organization_name = ?", (organization_name,)).fetchone()[0]
+
+    def is_due_for_scan(self, organization_name: str) -> bool:
+        last_scan_time = self.get_last_scan_time(organization_name)
+        return last_scan_time is None or time.time() - last_scan_time >= SNAPSHOT_INTERVAL_SECONDS
+
+    # appends what a scan saw to the org's series. `values_by_metric` has the (repo full name, value, time we saw it)
+    # for each metric, and returns the number of samples that were appended
+    def append_scan(self, organization_name: str, values_by_metric: dict[Metric, list[tuple[str, int, float]]]) -> int:
+        appended_count = 0
+        # another run could append to the same series between our read and our write, so we take the write lock first
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            for (metric, values) in values_by_metric.items():
+                series_by_repo_full_name = {
+                    repo_full_name: (last_time, last_value, samples)
+                    for (repo_full_name, last_time, last_value, samples) in self._connection.execute(
+                        "SELECT repo_full_name, last_time, last_value, samples FROM metric_series WHERE organization_name = ? AND metric = ?",
+                        (organization_name, metric.value),
+                    )
+                }
+                rows = []
+                for (repo_full_name, value, seen_time) in values:
+                    seen_time = int(seen_time)
+                    (last_time, last_value, samples) = series_by_repo_full_name.get(repo_full_name, (0, 0, b""))
+                    # a value that hasn't changed, or that's older than what we already have, doesn't add anything
+                    if len(samples) > 0 and (value == last_value or seen_time <= last_time):
+                        continue
+                    rows.append((organization_name, metric.value, repo_full_name, seen_time, value, samples + _encode_varints([seen_time - last_time, value - last_value])))
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO metric_series (organization_name, metric, repo_full_name, last_time, last_value, samples) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                appended_count += len(rows)
+            self._connection.execute("INSERT OR IGNORE INTO scans (organization_name, scan_time) VALUES (?, ?)", (organization_name, int(time.time())))
+            self._connection.commit()
+        except BaseException:
+            self._connection.rollback()
+            raise
+        return appended_count
+
+    # returns (repo full name, latest value, growth) for each repo we've seen `metric` for, where the growth is its
+    # latest value minus its value at the start of the window. for a repo we started tracking after the window started,
+    # it's the growth since then
+    def get_growth(self, organization_name: str, metric: Metric, window_seconds: int) -> list[tuple[str, int, int]]:
+        window_start_time = time.time() - window_seconds
+        growth = []
+        for (repo_full_name, last_value, samples) in self._connection.execute(
+            "SELECT repo_full_name, last_value, samples FROM metric_series WHERE organization_name = ? AND metric = ?",
+            (organization_name, metric.value),
+        ):
+            decoded_samples = _decode_samples(samples)
+            start_value = decoded_samples[0][1]
+            for (sample_time, value) in decoded_samples:
+                if sample_time > window_start_time:
+                    break
+                start_value = value
+            growth.append((repo_full_name, last_value, last_value - start_value))
+        return growth
+
+# records the org's metrics as of this scan: the stars and forks from `repos` (from the listing or search) and the
+# pull requests counts we have cached for them, as of when each was checked
+def record_scan(snapshot_store: SnapshotStore, organization_name: str, repos: list[RepoRecord], cache: GithubDataCache) -> int:
+    with get_profiler().phase("record_snapshot"):
+        current_time = time.time()
+        pull_requests_counts = []
+        for repo in repos:
+            cached_count = cache.try_get_metric_and_checked_time_for_repo(repo, Metric.PULL_REQUESTS)
+            if cached_count is not None:
+                pull_requests_counts.append((repo.full_name, *cached_count))
+        return snapshot_store.append_scan(organization_name, {
+            Metric.STARS: [(repo.full_name, get_stars_count(repo), current_time) for repo in repos],
+            Metric.FORKS: [(repo.full_name, get_forks_count(repo), current_time) for repo in repos],
+            Metric.PULL_REQUESTS: pull_requests_counts,
+        })
+
+@contextmanager
+def get_snapshot_store():
+    os.makedirs(os.path.dirname(SNAPSHOT_FILE), exist_ok=True)
+    snapshot_store = SnapshotStore(SNAPSHOT_FILE)
+    try:
+        yield snapshot_store
+    finally:
+        snapshot_store.close()